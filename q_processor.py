@@ -1,36 +1,94 @@
 #!/usr/bin/env python3
 """
-Single-threaded MCQ enrichment pipeline using Gemini.
+Concurrent MCQ enrichment pipeline using Gemini.
 Features:
-- Strict Pydantic validation
-- Atomic writes
-- Crash-safe
-- No retries
-- No multithreading
-- On FIRST failure → save remaining items and exit
+- Strict Pydantic validation of every returned item
+- Invalid items are re-submitted on their own, bisecting failing batches
+  down to single questions; persistent failures go to a dead-letter file
+- Append-only, fsync'd journal of processed items
+- Crash-safe: a rerun replays the journal and resumes where it stopped
+- Output of the pre-journal script (OUTPUT_FILE, REMAINING_FILE) is imported
+  on the first run, so its questions are not enriched again
+- asyncio engine with a bounded number of in-flight model calls
+- Token-bucket limiting of requests and tokens per minute
+- Batches packed to an input / expected-output token budget, with packing
+  density adapted to the observed output truncation rate
+- Exponential backoff on 429 / 5xx responses
+- Batches hit by transient API errors go to a retry queue instead of aborting the run
+- Results, cache hits included, are journaled in input order
+- Pluggable model client (a latency-simulating fake is included for benchmarks)
+- Persistent SQLite cache of validated enrichments keyed by normalized stem
+  and prompt/model version, consulted before any model call
+- MinHash/LSH near-duplicate index: reworded copies of a stem already seen
+  with the same answer are reported, and skipped with --skip-near-duplicates
+- Final compaction of the journal into OUTPUT_FILE
+
+Usage:
+    python q_processor.py [--concurrency N] [--rpm N] [--tpm N]
+    python q_processor.py --fake-model 1.5 --concurrency 16   # offline benchmark
+    python q_processor.py --cache-stats
+    python q_processor.py --invalidate-cache stale|all
 """
 
+import argparse
+import asyncio
 import hashlib
+import itertools
 import json
 import logging
 import os
+import random
 import re
-import shutil
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
 
-import google.generativeai as genai
 from pydantic import BaseModel, Field, ValidationError, field_validator
 
+from server.lib.enrichment_cache import EnrichmentCache, enrichment_version
+from server.lib.json_stream import chunked, iter_json_records
+from server.lib.near_dupes import NearDuplicateIndex, correct_answer, question_text
+
 # ====================================================
 # CONFIG
 # ====================================================
 INPUT_FILE = "unprocessed_questions_file.json"
 OUTPUT_FILE = "output.json"
-REMAINING_FILE = "remaining_file.json"
-
-BATCH_SIZE = 5
+REMAINING_FILE = "remaining_file.json"  # written by the pre-journal script
+JOURNAL_FILE = "output.journal.ndjson"
+CURSOR_FILE = "output.cursor.json"
+DEAD_LETTER_FILE = "output.dead_letter.ndjson"
+CACHE_FILE = "enrichment_cache.sqlite3"
+NEAR_DUP_INDEX_FILE = "near_dupes.idx"
+NEAR_DUP_REPORT_FILE = "output.near_duplicates.ndjson"
+NEAR_DUP_THRESHOLD = 0.9
+
+# Batches are packed up to these per-call token budgets (system prompt excluded).
+INPUT_TOKEN_BUDGET = int(os.environ.get("ENRICH_INPUT_TOKEN_BUDGET", "6000"))
+OUTPUT_TOKEN_BUDGET = int(os.environ.get("ENRICH_OUTPUT_TOKEN_BUDGET", "16000"))
+MAX_BATCH_ITEMS = 25
 MODEL_NAME = "gemini-flash-latest"
+API_KEY = os.environ.get("GEMINI_API_KEY", "")
+
+# Concurrency and rate limits (override on the command line).
+CONCURRENCY = int(os.environ.get("ENRICH_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = int(os.environ.get("ENRICH_RPM", "60"))
+TOKENS_PER_MINUTE = int(os.environ.get("ENRICH_TPM", "1000000"))
+
+# Retry behaviour.
+MAX_ATTEMPTS = 5  # per model call, for 429 / 5xx responses
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRY_ROUNDS = 2  # passes over the retry queue after the main pass
+
+# Rough token accounting for the batcher and the rate limiter (~4 characters per token).
+CHARS_PER_TOKEN = 4
+EXPECTED_OUTPUT_TOKENS_PER_ITEM = 1500
+
+# Adaptive packing: shrink batches after a truncated response, regrow slowly.
+MIN_PACKING_DENSITY = 0.25
+DENSITY_DECREASE_FACTOR = 0.75
+DENSITY_INCREASE_STEP = 0.02
+TRUNCATION_WINDOW = 50
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
@@ -285,18 +343,20 @@ Return ONLY a JSON List. No markdown formatting. No preamble.
 """
 
 
+# Cached enrichments are only reused while the prompt and model are unchanged.
+ENRICHMENT_VERSION = enrichment_version(SYSTEM_PROMPT, MODEL_NAME)
+
+
 # ====================================================
 # Utilities
 # ====================================================
-def configure_genai():
-    genai.configure(api_key=API_KEY)
-
-
-def atomic_write(data: List[Dict], filename: str):
+def atomic_write(data: Dict, filename: str):
     temp = f"{filename}.tmp"
     with open(temp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    shutil.move(temp, filename)
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, filename)
 
 
 def json_extract(raw: str) -> Tuple[Optional[str], Optional[str]]:
@@ -319,124 +379,958 @@ def hash_question(q: str) -> str:
     return hashlib.sha256(payload.encode()).hexdigest()
 
 
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
 # ====================================================
-# MODEL CALL
+# MODEL CLIENTS
 # ====================================================
-def process_batch(model, batch: List[Dict]):
-    """Send one batch to Gemini. No retries."""
-    payload = f"TRANSFORM THIS DATA:\n{json.dumps(batch, ensure_ascii=False)}"
-    try:
-        response = model.generate_content(
+class ModelClient(Protocol):
+    """Anything that can turn a prompt payload into raw model text."""
+
+    async def generate(self, payload: str) -> str: ...
+
+
+class OutputTruncatedError(Exception):
+    """The model hit its output token limit before finishing the batch."""
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        api_key: str = API_KEY,
+        max_output_tokens: int = OUTPUT_TOKEN_BUDGET,
+    ):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.max_output_tokens = max_output_tokens
+        self._model = genai.GenerativeModel(
+            model_name=model_name, system_instruction=SYSTEM_PROMPT
+        )
+
+    async def generate(self, payload: str) -> str:
+        response = await self._model.generate_content_async(
             contents=[payload],
-            generation_config=genai.types.GenerationConfig(
+            generation_config=self._genai.types.GenerationConfig(
                 temperature=0.1,
                 response_mime_type="application/json",
+                max_output_tokens=self.max_output_tokens,
             ),
         )
+        candidates = getattr(response, "candidates", None) or []
+        if candidates and getattr(candidates[0].finish_reason, "name", "") == "MAX_TOKENS":
+            raise OutputTruncatedError(f"Response exceeded {self.max_output_tokens} output tokens")
+        return getattr(response, "text", str(response))
+
+
+class FakeModelError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"Simulated HTTP {code}")
+        self.code = code
+
+
+class FakeModelClient:
+    """
+    An offline stand-in for benchmarking: sleeps for a simulated latency and
+    returns a schema-valid enrichment of every input question. A fraction of
+    calls can fail with 429 / 503 to exercise backoff, and a fraction of items
+    can come back invalid to exercise bisection. Each item is charged a
+    randomised output size, and a batch whose total exceeds max_output_tokens
+    is reported as truncated.
+    """
+
+    def __init__(
+        self,
+        latency: float = 1.0,
+        jitter: float = 0.25,
+        error_rate: float = 0.0,
+        invalid_rate: float = 0.0,
+        max_output_tokens: int = OUTPUT_TOKEN_BUDGET,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.max_output_tokens = max_output_tokens
+        self.calls = 0
+
+    async def generate(self, payload: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter * self.latency)))
+        if random.random() < self.error_rate:
+            raise FakeModelError(random.choice([429, 503]))
+
+        batch = json.loads(payload.split("\n", 1)[1])
+        output_tokens = sum(
+            EXPECTED_OUTPUT_TOKENS_PER_ITEM * random.uniform(0.6, 1.4) for _ in batch
+        )
+        if output_tokens > self.max_output_tokens:
+            raise OutputTruncatedError(f"Response exceeded {self.max_output_tokens} output tokens")
+        items = [self._enrich(q) for q in batch]
+        for item in items:
+            if random.random() < self.invalid_rate:
+                del item["answer"]
+        return json.dumps(items)
+
+    @staticmethod
+    def _enrich(q: Dict) -> Dict:
+        return {
+            "question": q.get("question", ""),
+            "options": [
+                {"option": "A", "text": "Correct option", "is_correct": True},
+                {"option": "B", "text": "Distractor", "is_correct": False},
+            ],
+            "specialty": ["general practice"],
+            "related_topics": ["benchmarking"],
+            "related_terms": ["latency", "throughput", "concurrency", "tokens", "backoff"],
+            "explanation": "**## Diagnosis**\nSimulated.",
+            "answer": "Correct option",
+            "hint": "Simulated hint.",
+            "needs_review": False,
+            "summary": "Simulated summary.",
+            "question_category": "Diagnosis",
+            "difficulty": "1 (Recall)",
+            "clinical_setting": "Other",
+            "key_takeaway": "Simulated takeaway.",
+            "common_pitfall": None,
+            "guideline_ref": None,
+        }
 
-        raw_text = getattr(response, "text", str(response))
-        json_text, err = json_extract(raw_text)
 
-        if err:
-            return None, err
+# ====================================================
+# RATE LIMITING
+# ====================================================
+class TokenBucket:
+    """Continuously refilling bucket holding at most `capacity` units."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # A request larger than the whole bucket waits for a full bucket.
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Admits a call only when both the request and the token budgets allow it."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+                await asyncio.sleep(wait)
+
+
+# ====================================================
+# MODEL CALL
+# ====================================================
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate-limit and server-side errors worth retrying."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code is not None and not callable(code):
+        try:
+            return int(code) in RETRYABLE_STATUS_CODES
+        except (TypeError, ValueError):
+            pass
+    return isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError))
+
+
+def parse_model_output(raw_text: str) -> Tuple[Optional[List[Dict]], Optional[str]]:
+    json_text, err = json_extract(raw_text)
+    if err:
+        return None, err
+
+    parsed = json.loads(json_text)
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        return None, "Model output was not a list"
+    return parsed, None
 
-        parsed = json.loads(json_text)
-        if isinstance(parsed, dict):
-            parsed = [parsed]
-        if not isinstance(parsed, list):
-            return None, "Model output was not a list"
 
-        return parsed, None
+ItemResult = Tuple[Optional[Dict], Optional[Any]]  # (validated item, error)
 
+
+def validate_item(item: Any) -> ItemResult:
+    """Checks one returned item against ProcessedQuestion."""
+    if not isinstance(item, dict):
+        return None, f"Expected an object, got {type(item).__name__}"
+    try:
+        return ProcessedQuestion.model_validate(item).model_dump(), None
+    except ValidationError as e:
+        return None, json.loads(e.json(include_url=False, include_input=False))
+
+
+class TransientBatchError(Exception):
+    """A model call that kept failing with 429 / 5xx; worth retrying later as is."""
+
+
+async def process_batch(
+    client: ModelClient, limiter: RateLimiter, batch: List[Dict]
+) -> List[ItemResult]:
+    """
+    Sends one batch to the model, backing off exponentially on 429 / 5xx, and
+    validates every returned item. Returns one (item, error) pair per input
+    question. Raises TransientBatchError once the backoff retries run out, and
+    passes OutputTruncatedError on to the caller.
+    """
+    payload = f"TRANSFORM THIS DATA:\n{json.dumps(batch, ensure_ascii=False)}"
+    tokens = (
+        estimate_tokens(SYSTEM_PROMPT)
+        + estimate_tokens(payload)
+        + EXPECTED_OUTPUT_TOKENS_PER_ITEM * len(batch)
+    )
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await limiter.acquire(tokens)
+        try:
+            raw_text = await client.generate(payload)
+            break
+        except OutputTruncatedError:
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                return [(None, str(e))] * len(batch)
+            if attempt == MAX_ATTEMPTS:
+                raise TransientBatchError(str(e)) from e
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.0)
+            logger.warning(f"Model call failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    try:
+        parsed, err = parse_model_output(raw_text)
     except Exception as e:
-        return None, str(e)
+        parsed, err = None, str(e)
+    if not err and len(parsed) != len(batch):
+        # Items cannot be matched to inputs, so none of them can be trusted.
+        err = f"Expected {len(batch)} items, got {len(parsed)}"
+    if err:
+        return [(None, err)] * len(batch)
+    return [validate_item(item) for item in parsed]
 
 
 # ====================================================
-# MAIN PIPELINE
+# JOURNAL
 # ====================================================
-def main():
-    logger.info("Starting single-threaded enrichment pipeline")
-    configure_genai()
-    model = genai.GenerativeModel(
-        model_name=MODEL_NAME, system_instruction=SYSTEM_PROMPT
-    )
+class Journal:
+    """
+    Append-only NDJSON log of processed items.
+
+    Each line is {"source": <hash of the input question>, "item": <processed item>}
+    and is fsync'd as it is written, so every complete line is a finished item
+    whether or not the rest of its batch was. On replay only a line torn by a
+    crash mid-write is dropped; the cursor file records where the last complete
+    batch ended, for reporting. Appends cost O(item) regardless of how much has
+    already been processed.
+    """
+
+    def __init__(self, path: str = JOURNAL_FILE, cursor_path: str = CURSOR_FILE):
+        self.path = path
+        self.cursor_path = cursor_path
+        self.items = 0
+        self._file = None
+
+    def _read_cursor(self) -> Optional[Dict]:
+        if not os.path.exists(self.cursor_path):
+            return None
+        with open(self.cursor_path, "r") as f:
+            return json.load(f)
+
+    def replay(self) -> set:
+        """
+        Returns the source hashes that are already processed, keeping every
+        complete record and truncating a partially written last line.
+        """
+        done = set()
+        self.items = 0
+        if not os.path.exists(self.path):
+            return done
+
+        size = os.path.getsize(self.path)
+        valid_end = 0
+        with open(self.path, "r+b") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line) if line.strip() else None
+                except ValueError:
+                    if valid_end + len(line) < size:
+                        raise ValueError(f"Invalid journal record at byte {valid_end} of {self.path}")
+                    logger.warning(f"Truncating a partially written record from {self.path}")
+                    f.truncate(valid_end)
+                    break
+                valid_end += len(line)
+                if not line.endswith(b"\n"):
+                    # The record was written but its newline was not.
+                    f.write(b"\n")
+                if entry is None:
+                    continue
+                self.items += 1
+                if entry.get("source"):
+                    done.add(entry["source"])
+
+        cursor = self._read_cursor()
+        if cursor and self.items > cursor["items"]:
+            logger.info(
+                f"Kept {self.items - cursor['items']} items journaled after the last complete batch"
+            )
+        logger.info(f"Replayed {self.items} processed items from {self.path}")
+        return done
+
+    def seed_from(self, filename: str, sources: Optional[List[str]] = None) -> None:
+        """
+        Imports a legacy OUTPUT_FILE so compaction keeps its items and replay
+        counts them as done. Items are journaled under `sources`, the input
+        hashes they were enriched from, when there is one per item; otherwise
+        under the hash of their own stem, which matches unless the model
+        reworded it. The journal is written aside and renamed into place, so
+        an interrupted import is started over.
+        """
+        count = sum(1 for _ in iter_json_records(filename))
+        if sources is not None and len(sources) != count:
+            logger.warning(
+                f"{filename} holds {count} items but {len(sources)} questions were processed; "
+                "matching items to questions by their stems instead"
+            )
+            sources = None
+        logger.info(f"Seeding journal with {count} previously processed items from {filename}")
+
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            for i, item in enumerate(iter_json_records(filename)):
+                source = sources[i] if sources is not None else hash_question(item["question"])
+                f.write(json.dumps({"source": source, "item": item}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        self.items = count
+        self.commit()
+
+    def append(self, source: Optional[str], item: Dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        line = json.dumps({"source": source, "item": item}, ensure_ascii=False)
+        self._file.write(line + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.items += 1
+
+    def commit(self) -> None:
+        """Marks everything appended so far as a complete batch."""
+        offset = self._file.tell() if self._file else os.path.getsize(self.path)
+        atomic_write({"offset": offset, "items": self.items}, self.cursor_path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def compact(self, filename: str) -> int:
+        """Streams the journal into a single JSON array at filename."""
+        temp = f"{filename}.tmp"
+        count = 0
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for entry in iter_json_records(self.path):
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(entry["item"], indent=2, ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+        os.replace(temp, filename)
+        return count
+
+
+class DeadLetterFile:
+    """
+    Append-only NDJSON record of questions that still fail validation when
+    sent on their own, with the errors from the last attempt. They are not
+    journaled, so a rerun tries them again.
+    """
+
+    def __init__(self, path: str = DEAD_LETTER_FILE):
+        self.path = path
+        self.count = 0
+
+    def append(self, source: str, question: Dict, error: Any) -> None:
+        entry = {
+            "source": source,
+            "question": question,
+            "errors": error if isinstance(error, list) else [str(error)],
+            "failed_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.count += 1
 
-    # ====================================================
-    # Load previously remaining items (if any)
-    # ====================================================
-    if os.path.exists(REMAINING_FILE):
-        logger.info("Loading from existing remaining_file.json")
-        with open(REMAINING_FILE, "r") as f:
-            to_process = json.load(f)
-    else:
-        with open(INPUT_FILE, "r") as f:
-            raw = json.load(f)
 
-        # Deduplication
-        seen = set()
-        to_process = []
-        for q in raw:
+# ====================================================
+# INPUT STREAM
+# ====================================================
+def legacy_processed_sources(remaining_path: str) -> Optional[List[str]]:
+    """
+    The input hashes the pre-journal script had processed, in processing order.
+    It worked through the deduplicated input in order and, when a batch failed,
+    saved the unprocessed rest to REMAINING_FILE, so everything before that is
+    done. Returns None when there is no REMAINING_FILE.
+    """
+    if not os.path.exists(remaining_path):
+        return None
+    remaining = {hash_question(q["question"]) for q in iter_json_records(remaining_path)}
+    seen = set()
+    processed = []
+    for q in iter_json_records(INPUT_FILE):
+        h = hash_question(q["question"])
+        if h in seen or h in remaining:
+            continue
+        seen.add(h)
+        processed.append(h)
+    return processed
+
+
+def load_near_dupes(path: str, journal: Journal) -> NearDuplicateIndex:
+    """
+    Loads the persisted near-duplicate index, or builds it from the items
+    already in the journal when there is none yet.
+    """
+    index = None
+    if os.path.exists(path):
+        try:
+            index = NearDuplicateIndex.load(path, threshold=NEAR_DUP_THRESHOLD)
+        except ValueError as e:
+            logger.warning(f"Rebuilding the near-duplicate index: {e}")
+    if index is None:
+        index = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD)
+        if os.path.exists(journal.path):
+            for entry in iter_json_records(journal.path):
+                item = entry["item"]
+                key = entry.get("source") or hash_question(item["question"])
+                index.add(key, question_text(item), correct_answer(item))
+    logger.info(f"Near-duplicate index holds {len(index)} questions")
+    return index
+
+
+def iter_questions_to_process(
+    done: set,
+    near_dupes: Optional[NearDuplicateIndex] = None,
+    report_path: Optional[str] = None,
+    skip_near_duplicates: bool = False,
+) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streams (hash, question) pairs still to be enriched from the input file,
+    skipping duplicates and questions the journal already holds. With an index,
+    near-duplicates of questions seen before are written to report_path, and
+    skipped as well when skip_near_duplicates is set. The input may be a JSON
+    array or NDJSON.
+    """
+    seen = set(done)
+    pending = 0
+    near = 0
+    report = open(report_path, "w", encoding="utf-8") if near_dupes is not None and report_path else None
+    try:
+        for q in iter_json_records(INPUT_FILE):
             h = hash_question(q["question"])
-            if h not in seen:
-                to_process.append(q)
-                seen.add(h)
+            if h in seen:
+                continue
+            seen.add(h)
+            if near_dupes is not None:
+                match = near_dupes.add_if_unique(
+                    h, question_text(q), correct_answer(q), index_duplicates=not skip_near_duplicates
+                )
+                if match is not None:
+                    near += 1
+                    if report:
+                        entry = {
+                            "source": h,
+                            "duplicate_of": match[0],
+                            "similarity": match[1],
+                            "question": q,
+                        }
+                        report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    if skip_near_duplicates:
+                        continue
+            pending += 1
+            yield h, q
+    finally:
+        if report:
+            report.close()
+    logger.info(f"Streamed {pending} unique unprocessed questions from input")
+    if near:
+        action = "Skipped" if skip_near_duplicates else "Flagged"
+        logger.info(f"{action} {near} near-duplicate questions; see {report_path}")
+
+
+# ====================================================
+# BATCHING
+# ====================================================
+Batch = List[Tuple[str, Dict]]  # (input hash, input question) pairs
+
+
+class TokenBudgetBatcher:
+    """
+    Packs questions into batches that fit a per-call input and expected-output
+    token budget, so short stems share a call and long vignettes do not
+    overflow one.
+
+    Only `density` of each budget is used. A truncated response cuts the
+    density multiplicatively; each complete response raises it a little, so
+    batches settle just below the size at which the model runs out of output.
+    """
+
+    def __init__(
+        self,
+        input_budget: int = INPUT_TOKEN_BUDGET,
+        output_budget: int = OUTPUT_TOKEN_BUDGET,
+        max_items: int = MAX_BATCH_ITEMS,
+    ):
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+        self.max_items = max_items
+        self.density = 1.0
+        self._recent: List[bool] = []
+        self.calls = 0
+        self.truncated = 0
+
+    @staticmethod
+    def item_tokens(q: Dict) -> Tuple[int, int]:
+        """Estimated (input, output) tokens for one question."""
+        return estimate_tokens(json.dumps(q, ensure_ascii=False)), EXPECTED_OUTPUT_TOKENS_PER_ITEM
+
+    def batches(self, pairs: Iterable[Tuple[str, Dict]]) -> Iterator[Batch]:
+        batch: Batch = []
+        input_used = output_used = 0
+        for h, q in pairs:
+            input_tokens, output_tokens = self.item_tokens(q)
+            if batch and (
+                len(batch) >= self.max_items
+                or input_used + input_tokens > self.input_budget * self.density
+                or output_used + output_tokens > self.output_budget * self.density
+            ):
+                yield batch
+                batch, input_used, output_used = [], 0, 0
+            # An item larger than the budget still goes out, on its own.
+            batch.append((h, q))
+            input_used += input_tokens
+            output_used += output_tokens
+        if batch:
+            yield batch
+
+    def record(self, truncated: bool) -> None:
+        """Feeds back whether a call ran out of output tokens."""
+        self.calls += 1
+        self._recent.append(truncated)
+        if len(self._recent) > TRUNCATION_WINDOW:
+            self._recent.pop(0)
+        if truncated:
+            self.truncated += 1
+            self.density = max(MIN_PACKING_DENSITY, self.density * DENSITY_DECREASE_FACTOR)
+        else:
+            self.density = min(1.0, self.density + DENSITY_INCREASE_STEP)
+
+    @property
+    def truncation_rate(self) -> float:
+        """The share of truncated responses among the most recent calls."""
+        return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "truncated": self.truncated,
+            "recent_truncation_rate": round(self.truncation_rate, 4),
+            "density": round(self.density, 3),
+        }
+
+
+# ====================================================
+# ENGINE
+# ====================================================
+
+class BatchOutcome:
+    """What became of one input batch once bisection has finished with it."""
+
+    def __init__(self, cached: bool = False):
+        self.cached = cached  # served from the enrichment cache, without a model call
+        self.accepted: Dict[str, Dict] = {}
+        self.dead: List[Tuple[str, Dict, Any]] = []
+        self.transient: Batch = []
+
+
+class EnrichmentEngine:
+    """
+    Runs batches through the model with up to `concurrency` calls in flight.
+
+    Items that fail validation are re-submitted without the valid ones, split
+    in halves until single questions are sent on their own; a question that
+    still fails alone is dead-lettered. Accepted items and cache hits are
+    journaled strictly in input order; a bounded window of 2 x concurrency
+    batches limits how far ahead of the oldest unfinished batch the engine
+    reads. Questions whose calls keep hitting 429 / 5xx are set aside in a
+    retry queue and re-run after the main pass instead of aborting it. Any
+    other error, such as a journal write failing, stops the run and is raised
+    from run().
+    """
+
+    def __init__(
+        self,
+        client: ModelClient,
+        journal: Journal,
+        dead_letter: DeadLetterFile,
+        cache: Optional[EnrichmentCache] = None,
+        batcher: Optional[TokenBudgetBatcher] = None,
+        concurrency: int = CONCURRENCY,
+        limiter: Optional[RateLimiter] = None,
+        retry_rounds: int = RETRY_ROUNDS,
+    ):
+        self.client = client
+        self.journal = journal
+        self.dead_letter = dead_letter
+        self.cache = cache
+        self.batcher = batcher or TokenBudgetBatcher()
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+        self.retry_rounds = retry_rounds
+        self.stats = {
+            "batches": 0,
+            "items": 0,
+            "cached_items": 0,
+            "calls": 0,
+            "bisect_calls": 0,
+            "truncated_calls": 0,
+            "dead_lettered": 0,
+            "retried_batches": 0,
+            "failed_batches": 0,
+        }
+
+    def plan(
+        self, pairs: Iterable[Tuple[str, Dict]]
+    ) -> Iterator[Tuple[Batch, Optional[BatchOutcome]]]:
+        """
+        Splits the input into the units the engine journals in order: batches
+        for the model, and runs of consecutive questions the cache already
+        holds, as outcomes that are complete already. A cache hit closes the
+        batch being packed, so every unit is a contiguous stretch of input.
+        """
+
+        def lookup(pair: Tuple[str, Dict]) -> Tuple[str, Dict, Optional[Dict]]:
+            h, q = pair
+            return h, q, self.cache.get(q["question"]) if self.cache else None
+
+        runs = itertools.groupby(map(lookup, pairs), key=lambda entry: entry[2] is not None)
+        for cached, run in runs:
+            if not cached:
+                for batch in self.batcher.batches((h, q) for h, q, _ in run):
+                    yield batch, None
+                continue
+            for hits in chunked(run, self.batcher.max_items):
+                outcome = BatchOutcome(cached=True)
+                outcome.accepted = {h: item for h, _, item in hits}
+                yield [(h, q) for h, q, _ in hits], outcome
+
+    async def _enrich(self, pairs: Batch, outcome: BatchOutcome, split: bool = False) -> None:
+        """Enriches pairs, bisecting whatever fails validation."""
+        self.stats["calls"] += 1
+        if split:
+            self.stats["bisect_calls"] += 1
+        try:
+            results = await process_batch(self.client, self.limiter, [q for _, q in pairs])
+        except TransientBatchError as e:
+            logger.warning(f"Batch of {len(pairs)} set aside for retry: {e}")
+            outcome.transient.extend(pairs)
+            return
+        except OutputTruncatedError as e:
+            # Bisection below re-sends the batch in halves that fit.
+            self.batcher.record(truncated=True)
+            self.stats["truncated_calls"] += 1
+            results = [(None, str(e))] * len(pairs)
+        else:
+            self.batcher.record(truncated=False)
+
+        failing = []
+        for (h, q), (item, error) in zip(pairs, results):
+            if item is not None:
+                outcome.accepted[h] = item
+            elif len(pairs) == 1:
+                outcome.dead.append((h, q, error))
+            else:
+                failing.append((h, q))
+
+        # Halves run one after the other so bisection stays within the batch's
+        # concurrency slot.
+        if len(failing) == 1:
+            await self._enrich(failing, outcome, split=True)
+        elif failing:
+            mid = len(failing) // 2
+            await self._enrich(failing[:mid], outcome, split=True)
+            await self._enrich(failing[mid:], outcome, split=True)
+
+    async def _run_pass(self, units: Iterable[Tuple[Batch, Optional[BatchOutcome]]]) -> List[Batch]:
+        """
+        Processes one pass over (batch, outcome) units and returns what needs
+        a retry. Units with an outcome are already complete and are only
+        journaled, in turn with the rest.
+        """
+        in_flight = asyncio.Semaphore(self.concurrency)
+        window = asyncio.Semaphore(self.concurrency * 2)
+        results: Dict[int, Tuple[Batch, BatchOutcome]] = {}
+        retry: List[Batch] = []
+        failed: List[BaseException] = []
+        next_seq = 0
+
+        def flush() -> None:
+            nonlocal next_seq
+            while next_seq in results and not failed:
+                pairs, outcome = results.pop(next_seq)
+                accepted = 0
+                for h, _ in pairs:
+                    if h in outcome.accepted:
+                        self.journal.append(h, outcome.accepted[h])
+                        accepted += 1
+                if accepted:
+                    self.journal.commit()
+                    if self.cache and not outcome.cached:
+                        self.cache.put_many(
+                            (q["question"], outcome.accepted[h])
+                            for h, q in pairs
+                            if h in outcome.accepted
+                        )
+                for h, q, error in outcome.dead:
+                    logger.error(f"Dead-lettered question {h[:12]}: {error}")
+                    self.dead_letter.append(h, q, error)
+                if outcome.transient:
+                    retry.append(outcome.transient)
+                if outcome.cached:
+                    self.stats["cached_items"] += accepted
+                else:
+                    self.stats["batches"] += 1
+                    self.stats["items"] += accepted
+                self.stats["dead_lettered"] += len(outcome.dead)
+                next_seq += 1
+                window.release()
+
+        async def run_one(seq: int, pairs: Batch, outcome: Optional[BatchOutcome]) -> None:
+            try:
+                if outcome is None:
+                    outcome = BatchOutcome()
+                    async with in_flight:
+                        await self._enrich(pairs, outcome)
+                results[seq] = (pairs, outcome)
+                flush()
+            except Exception as e:
+                # Nothing after this batch may be journaled; wake the reader so it stops.
+                failed.append(e)
+                window.release()
+                raise
+
+        tasks = []
+        try:
+            for seq, (pairs, outcome) in enumerate(units):
+                await window.acquire()
+                if failed:
+                    break
+                tasks.append(asyncio.create_task(run_one(seq, pairs, outcome)))
+            # Raises the first failure as soon as it happens.
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return retry
+
+    async def run(self, pairs: Iterable[Tuple[str, Dict]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        retry_queue = await self._run_pass(self.plan(pairs))
+        for round_number in range(1, self.retry_rounds + 1):
+            if not retry_queue:
+                break
+            logger.info(f"Retry round {round_number}: {len(retry_queue)} batches")
+            self.stats["retried_batches"] += len(retry_queue)
+            retry_queue = await self._run_pass((batch, None) for batch in retry_queue)
+
+        elapsed = time.perf_counter() - started
+        self.stats["failed_batches"] = len(retry_queue)
+        self.stats["seconds"] = round(elapsed, 2)
+        self.stats["items_per_second"] = round(self.stats["items"] / elapsed, 2) if elapsed else 0.0
+        self.stats["batching"] = self.batcher.stats()
+        if retry_queue:
+            logger.error(
+                f"{len(retry_queue)} batches still failing; rerun to resume them from the journal."
+            )
+        if self.stats["dead_lettered"]:
+            logger.error(
+                f"{self.stats['dead_lettered']} questions failed validation; see {self.dead_letter.path}"
+            )
+        return self.stats
+
+
+# ====================================================
+# MAIN PIPELINE
+# ====================================================
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Enrich raw MCQs with Gemini.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE)
+    parser.add_argument(
+        "--input-budget",
+        type=int,
+        default=INPUT_TOKEN_BUDGET,
+        help="Input tokens packed into one call, excluding the system prompt.",
+    )
+    parser.add_argument(
+        "--output-budget",
+        type=int,
+        default=OUTPUT_TOKEN_BUDGET,
+        help="Expected output tokens packed into one call; also the model's output limit.",
+    )
+    parser.add_argument(
+        "--fake-model",
+        type=float,
+        metavar="LATENCY",
+        help="Benchmark against a local fake model with this mean latency (seconds). "
+        "Writes to bench_* output files.",
+    )
+    parser.add_argument(
+        "--fake-error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of fake model calls that fail with 429 / 503.",
+    )
+    parser.add_argument(
+        "--fake-invalid-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of fake model items returned without a required field.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read from nor write to the enrichment cache.",
+    )
+    parser.add_argument(
+        "--skip-near-duplicates",
+        action="store_true",
+        help="Skip near-duplicate questions instead of only reporting them.",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print enrichment cache statistics and exit.",
+    )
+    parser.add_argument(
+        "--invalidate-cache",
+        choices=["stale", "all"],
+        help="Delete cache entries from other prompt/model versions (stale) or every entry (all), then exit.",
+    )
+    return parser.parse_args()
 
-        logger.info(f"Loaded {len(to_process)} unique questions from input")
 
-    with open(REMAINING_FILE, "w") as f:
-        json.dump(to_process, f, indent=2, ensure_ascii=False)
+async def run_pipeline(args: argparse.Namespace) -> None:
+    if args.fake_model is not None:
+        client: ModelClient = FakeModelClient(
+            args.fake_model,
+            error_rate=args.fake_error_rate,
+            invalid_rate=args.fake_invalid_rate,
+            max_output_tokens=args.output_budget,
+        )
+        prefix = "bench_"
+    else:
+        client = GeminiClient(max_output_tokens=args.output_budget)
+        prefix = ""
+    output_file = prefix + OUTPUT_FILE
+    cache = None if args.no_cache else EnrichmentCache(prefix + CACHE_FILE, ENRICHMENT_VERSION)
 
     # ====================================================
-    # Load existing processed (if the script is resumed manually)
+    # Replay the journal (if the script is resumed), first importing the
+    # output of the pre-journal script if that is all there is
     # ====================================================
-    processed = []
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "r") as f:
-            processed = json.load(f)
-        logger.info(f"Loaded {len(processed)} previously processed items")
+    journal = Journal(prefix + JOURNAL_FILE, prefix + CURSOR_FILE)
+    if not os.path.exists(journal.path) and os.path.exists(output_file):
+        journal.seed_from(output_file, legacy_processed_sources(prefix + REMAINING_FILE))
+    done = journal.replay()
 
     # ====================================================
-    # Process sequentially, batch by batch
+    # Process concurrently, committing batches in order
     # ====================================================
-    total = len(to_process)
-    idx = 0
-    # if os.path.exists('last_index'):
-    #     with open('last_index', 'r') as f:
-    #         idx = json.load(f)
-
-    try:    
-        while idx < total:
-            batch = to_process[idx : idx + BATCH_SIZE]
-            logger.info(f"Processing batch {idx // BATCH_SIZE + 1}")
-
-            parsed, error = process_batch(model, batch)
-
-            if error or parsed is None:
-                logger.error(f"Batch failed: {error}")
-                logger.error("Saving remaining items and exiting...")
+    # Input is streamed, so only the batches in the engine's window are held in memory.
+    batcher = TokenBudgetBatcher(args.input_budget, args.output_budget)
+    engine = EnrichmentEngine(
+        client,
+        journal,
+        DeadLetterFile(prefix + DEAD_LETTER_FILE),
+        cache=cache,
+        batcher=batcher,
+        concurrency=args.concurrency,
+        limiter=RateLimiter(args.rpm, args.tpm),
+    )
+    near_dupes = load_near_dupes(prefix + NEAR_DUP_INDEX_FILE, journal)
+    questions = iter_questions_to_process(
+        done, near_dupes, prefix + NEAR_DUP_REPORT_FILE, args.skip_near_duplicates
+    )
+    try:
+        stats = await engine.run(questions)
+    finally:
+        journal.close()
+        near_dupes.save(prefix + NEAR_DUP_INDEX_FILE)
+        if cache:
+            logger.info(f"Cache stats: {cache.stats()}")
+            cache.close()
+    logger.info(f"Run stats: {stats}")
 
-                # Save remaining including failed batch
-                atomic_write(to_process[idx:], REMAINING_FILE)
-                atomic_write(processed, OUTPUT_FILE)
-                return
+    count = journal.compact(output_file)
+    logger.info(f"Compacted {count} processed items into {output_file}")
 
-            processed.extend(parsed)
 
-            # Save continuously
-            atomic_write(processed, OUTPUT_FILE)
+def manage_cache(args: argparse.Namespace) -> None:
+    cache = EnrichmentCache(CACHE_FILE, ENRICHMENT_VERSION)
+    try:
+        if args.invalidate_cache:
+            removed = cache.invalidate(stale_only=args.invalidate_cache == "stale")
+            logger.info(f"Removed {removed} cached enrichments ({args.invalidate_cache})")
+        print(json.dumps(cache.stats(), indent=2))
+    finally:
+        cache.close()
 
-            idx += BATCH_SIZE
-            print(
-                f"Batch {(idx // BATCH_SIZE) + 1} of {(len(to_process) // BATCH_SIZE) + 1}"
-            )
-            # with open("last_index_1", "w") as f:
-            #     json.dump(idx, f)
-        # time.sleep(2)
-    except Exception as e:    
-        print(e)
 
-    print('done')    
+def main():
+    args = parse_args()
+    if args.cache_stats or args.invalidate_cache:
+        manage_cache(args)
+        return
+    logger.info(
+        f"Starting enrichment pipeline (concurrency={args.concurrency}, "
+        f"rpm={args.rpm}, tpm={args.tpm})"
+    )
+    asyncio.run(run_pipeline(args))
+    print('done')
 
 
 if __name__ == "__main__":
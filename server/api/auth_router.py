@@ -1,7 +1,7 @@
 # app/api/auth_router.py
+import logging
 import os
 from os import access
-from pprint import pprint
 from typing import Annotated, Any, cast
 
 from fastapi import (
@@ -19,13 +19,13 @@ from fastapi.security import (
     HTTPBearer,
 )
 from gotrue.errors import AuthApiError
-from jose import JWTError, jwt
+from jose import JWTError
 from postgrest import APIResponse
 from supabase import AsyncClient
 
-from server.core.config import settings
 from server.core.dependencies import get_current_user
-from server.db.db import get_supabase_client
+from server.core.token_cache import decode_access_token
+from server.db.db import get_supabase_auth_client, get_supabase_client
 
 # Import our new, specific schemas and dependencies
 from server.models.schemas import (
@@ -41,6 +41,7 @@ from server.models.schemas import (
 
 # Initialize the router
 router = APIRouter(prefix="/auth", tags=["Authentication"])
+logger = logging.getLogger("app.auth")
 origin_url = os.environ.get("ORIGIN_URL", "http://localhost:3000")
 
 
@@ -74,7 +75,7 @@ def remove_refresh_token_cookie(response: Response) -> None:
 @router.post("/register", response_model=UserAuthResponse, status_code=201)
 async def register_user(
     user_credentials: UserCreate,
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)],
     response: Response,
 ):
     """
@@ -122,7 +123,7 @@ async def register_user(
 async def login_for_access_token(
     response: Response,
     form_data: UserLogin,
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)],
 ):
     """
     Handles email/password login.
@@ -226,7 +227,7 @@ async def login_for_access_token(
 async def google_callback(
     response: Response,
     callback_data: OAuthCallback,
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)],
 ):
     """
     Handles the callback from the frontend after Google authentication.
@@ -286,7 +287,7 @@ async def google_callback(
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
 async def logout(
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)], response: Response
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)], response: Response
 ):
     """
     Logs out the current user by invalidating their session on Supabase.
@@ -305,7 +306,7 @@ async def logout(
 async def refresh_access_token(
     response: Response,
     request: Request,
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)],
     cognito_refresh_token=Cookie(None, alias="cognito_refresh_token"),
 ):
     """
@@ -322,14 +323,8 @@ async def refresh_access_token(
     if authorisation is not None:
         token = authorisation.split()[1]
         try:
-            payload = jwt.decode(
-                token,
-                settings.SUPABASE_JWT_SECRET,
-                algorithms=["HS256"],
-                audience="authenticated",
-            )
-            if payload:
-                return {"access_token": token}
+            decode_access_token(token)
+            return {"access_token": token}
         except JWTError:
             pass
 
@@ -356,7 +351,7 @@ async def refresh_access_token(
 @router.post("/change-password", status_code=status.HTTP_204_NO_CONTENT)
 async def change_password(
     password_data: ChangePasswordRequest,
-    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    supabase: Annotated[AsyncClient, Depends(get_supabase_auth_client)],
     token: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
 ):
     """
@@ -399,7 +394,7 @@ async def toggle_send_email(
         return None
 
     except Exception as e:
-        print(e)
+        logger.exception("Failed to update email preference")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e),
@@ -1,18 +1,27 @@
 # app/api/dashboard_router.py
 
+from datetime import datetime, timezone
 from typing import Annotated, cast
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from supabase import AsyncClient
 
 from server.core.dependencies import get_current_user
 from server.db.db import get_supabase_client
+from server.lib.cache import (
+    dashboard_forecast_cache,
+    dashboard_stats_cache,
+    dashboard_summary_cache,
+)
 from server.models.schemas import (
     DashboardStatsResponse,
     DashboardSummary,
+    ReviewForecastItem,
     UserAuthResponse,
 )
 
+FORECAST_MAX_DAYS = 60
+
 # Initialize the router
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 # --- API Endpoint ---
@@ -44,7 +53,11 @@ async def get_user_dashboard_stats(
     """
     Retrieves a comprehensive set of dashboard statistics for the
     currently authenticated user in a single, efficient database call.
+    Results are cached per user until the user next answers a question.
     """
+    cached = dashboard_stats_cache.get(current_user.id)
+    if cached is not None:
+        return cached
     try:
         # Call the RPC function with the user's ID
         rpc_params = {"p_user_id": current_user.id}
@@ -55,6 +68,7 @@ async def get_user_dashboard_stats(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Could not retrieve dashboard stats for the user.",
             )
+        dashboard_stats_cache.set(current_user.id, response.data)
         return response.data
 
     except Exception as e:
@@ -70,32 +84,47 @@ async def get_dashboard_summary(
 ):
     """
     Get counts of due, new, and learned questions for the user dashboard.
+    Counts are cached per user until the user next answers a question.
     """
+    cached = dashboard_summary_cache.get(current_user.id)
+    if cached is not None:
+        return cached
     try:
-        # Count questions due for review
-        due_response = (
-            await supabase.table("user_question_progress")
-            .select("question_id", count="exact")
-            .eq("user_id", current_user.id)
-            .lte("next_review_at", "now()")
-            .execute()
-        )
-
-        new_questions_count = 50
-
-        # Count graduated questions
-        graduated_response = (
-            await supabase.table("user_question_progress")
-            .select("question_id", count="exact")
-            .eq("user_id", current_user.id)
-            .eq("status", "graduated")
-            .execute()
-        )
+        rpc_params = {"p_user_id": current_user.id}
+        response = await supabase.rpc("get_user_dashboard_summary", rpc_params).execute()
 
-        return {
-            "due_for_review_count": due_response.count,
-            "new_questions_count": new_questions_count,
-            "graduated_questions_count": graduated_response.count,
-        }
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Could not retrieve dashboard summary for the user.",
+            )
+        dashboard_summary_cache.set(current_user.id, response.data)
+        return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/forecast", response_model=list[ReviewForecastItem])
+async def get_review_forecast(
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    current_user=Depends(get_current_user),
+    days: Annotated[int, Query(ge=1, le=FORECAST_MAX_DAYS)] = 14,
+):
+    """
+    Reviews falling due on each of the next `days` days (UTC), with overdue
+    reviews counted today. Cached per user until the user next answers a question.
+    """
+    today = datetime.now(timezone.utc).date().isoformat()
+    cached = dashboard_forecast_cache.get(current_user.id)
+    forecast = cached[1] if cached and cached[0] == today else None
+    if forecast is None:
+        try:
+            # The whole horizon is fetched and cached so any `days` is served from it.
+            rpc_params = {"p_user_id": current_user.id, "p_days": FORECAST_MAX_DAYS}
+            response = await supabase.rpc("get_review_forecast", rpc_params).execute()
+            forecast = response.data or []
+            dashboard_forecast_cache.set(current_user.id, (today, forecast))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return forecast[:days]
@@ -1,22 +1,34 @@
 # app/api/quiz_router.py
 
+import logging
 import os
 import uuid
 from os import error
-from pprint import pprint
 from typing import Annotated, Any, cast
 from urllib import response
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Response
-from postgrest import APIResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from supabase import AsyncClient
 import requests
 
 # Import the correct, full dependency functions and new schemas
 from server.core.dependencies import get_current_user
 from server.db.db import get_supabase_client
+from server.lib.cache import invalidate_user_dashboard
+from server.lib.single_flight import single_flight
+from server.lib.tag_catalog import tag_catalog
 from server.models.schemas import (
     ActiveSessionResponse,
+    AnswerBatchRequest,
+    AnswerBatchResult,
     AnswerSubmissionRequest,
     NewSessionRequest,
     ProgressUpdateResponse,
@@ -29,6 +41,7 @@ from server.models.schemas import (
 )
 
 router = APIRouter(prefix="/quiz", tags=["Quiz"])
+logger = logging.getLogger("app.quiz")
 
 
 # --- Background Task for Performance Optimization ---
@@ -52,7 +65,25 @@ async def log_session_questions(
         await supabase.table("session_question").insert(session_question_data).execute()
 
     except Exception as e:
-        print(f"Error in background task for session {session_id}: {e}")
+        logger.exception(
+            "Error in background task", extra={"session_id": str(session_id)}
+        )
+
+
+async def create_session_bundle(
+    supabase: AsyncClient, session_kind: str, rpc_params: dict[str, Any]
+) -> SessionResponse:
+    """
+    Creates a session and fetches its questions in a single RPC call, so the
+    client does not need a follow-up /resume request before rendering.
+    """
+    response = await supabase.rpc(
+        "create_session_with_questions", {"p_session_kind": session_kind, **rpc_params}
+    ).execute()
+    bundle = cast(dict[str, Any], response.data)
+    return SessionResponse(
+        session_id=bundle["session_id"], questions=bundle["questions"] or []
+    )
 
 
 # --- API Endpoints ---
@@ -60,6 +91,7 @@ async def log_session_questions(
 
 @router.get("/tags", response_model=list)
 async def get_all_tags(
+    request: Request,
     supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
     # current_user=Depends(get_current_user),
     type: str | None = None,
@@ -67,19 +99,11 @@ async def get_all_tags(
     """
     Get a list of all available tags, optionally filtered by type.
     Valid types are 'SPECIALTY', 'TOPIC', 'RELATED_TERM'.
+    Served from the in-memory tag catalog with an ETag for conditional requests.
     """
     try:
-        _response = (
-            await supabase.table("tags")
-            .select("id", "name")
-            .eq("type", type.upper())
-            .execute()
-            if type
-            else await supabase.table("tags").select("id, name, type").execute()
-        )
-
-        response = cast(APIResponse, _response)
-        return response.data
+        payload = await tag_catalog.payload(supabase, type=type)
+        return payload.to_response(request)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -132,7 +156,9 @@ async def check_for_active_session(
         )
 
 
-@router.post("/sessions/new", response_model=SessionCreateResponse)
+@router.post(
+    "/sessions/new", response_model=SessionCreateResponse | SessionResponse
+)
 async def create_new_learning_session(
     background_tasks: BackgroundTasks,
     request_body: NewSessionRequest,
@@ -150,6 +176,9 @@ async def create_new_learning_session(
             "p_tag_id": str(request_body.tag_id) if request_body.tag_id else None,
             "p_limit": request_body.limit,
         }
+        if request_body.include_questions:
+            return await create_session_bundle(supabase, "new", rpc_params)
+
         session_res = await supabase.rpc(
             "get_new_questions_for_user", rpc_params
         ).execute()
@@ -166,7 +195,9 @@ async def create_new_learning_session(
         )
 
 
-@router.post("/sessions/review", response_model=SessionCreateResponse)
+@router.post(
+    "/sessions/review", response_model=SessionCreateResponse | SessionResponse
+)
 async def create_review_session(
     background_tasks: BackgroundTasks,
     request_body: NewSessionRequest,
@@ -184,6 +215,9 @@ async def create_review_session(
             "p_tag_id": str(request_body.tag_id) if request_body.tag_id else None,
             "p_limit": request_body.limit,
         }
+        if request_body.include_questions:
+            return await create_session_bundle(supabase, "review", rpc_params)
+
         session_res = await supabase.rpc(
             "get_due_review_questions_for_user", rpc_params
         ).execute()
@@ -199,7 +233,9 @@ async def create_review_session(
         )
 
 
-@router.post("/sessions/mixed", response_model=SessionCreateResponse)
+@router.post(
+    "/sessions/mixed", response_model=SessionCreateResponse | SessionResponse
+)
 async def create_smart_session(
     background_tasks: BackgroundTasks,
     request_body: NewSessionRequest,
@@ -218,6 +254,15 @@ async def create_smart_session(
             "p_tag_id": str(request_body.tag_id) if request_body.tag_id else None,
             "p_limit": request_body.limit if request_body.limit else 20,
         }
+        if request_body.include_questions:
+            bundle = await create_session_bundle(supabase, "mixed", rpc_params)
+            if not bundle.session_id:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create smart session.",
+                )
+            return bundle
+
         session_res = await supabase.rpc(
             "create_smart_session_for_user", rpc_params
         ).execute()
@@ -263,9 +308,13 @@ async def submit_answer(
 
         # 2. Make a single, atomic call to the database function
         response = await supabase.rpc("process_answer_submission", rpc_params).execute()
+        invalidate_user_dashboard(current_user.id)
 
         if not response.data:
-            pprint(response.data["error"])
+            logger.error(
+                "process_answer_submission returned no data",
+                extra={"session_id": str(session_id)},
+            )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=(
@@ -283,7 +332,56 @@ async def submit_answer(
             explanation=result["explanation"],
         )
     except Exception as e:
-        pprint(e)
+        logger.exception("Failed to submit answer", extra={"session_id": str(session_id)})
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.post(
+    "/sessions/{session_id}/answers:batch", response_model=list[AnswerBatchResult]
+)
+async def submit_answers_batch(
+    session_id: uuid.UUID,
+    batch: AnswerBatchRequest,
+    supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
+    current_user=Depends(get_current_user),
+):
+    """
+    Submits up to 50 answers in one call, e.g. when a test-mode session ends.
+    All answers are applied in a single database transaction and feedback is
+    returned per answer, in submission order.
+    """
+    try:
+        rpc_params = {
+            "p_user_id": str(current_user.id),
+            "p_session_id": str(session_id),
+            "p_answers": [
+                {
+                    "question_id": str(answer.question_id),
+                    "selected_option_id": str(answer.selected_option_id),
+                    "performance_rating": answer.performance_rating,
+                    "time_to_answer_ms": answer.time_to_answer_ms,
+                }
+                for answer in batch.answers
+            ],
+            "p_completed": batch.completed
+            or any(answer.completed for answer in batch.answers),
+        }
+        response = await supabase.rpc(
+            "process_answer_submissions_batch", rpc_params
+        ).execute()
+        invalidate_user_dashboard(current_user.id)
+
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to process answers and update progress.",
+            )
+
+        results = cast(list[dict[str, Any]], response.data)
+        return [AnswerBatchResult(**result) for result in results]
+    except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         )
@@ -391,9 +489,13 @@ async def get_question_feedback(
     in a mode like "Test" or "Tutor" where feedback is not immediate.
     """
     try:
-        # Call the RPC function we created in Step 1
+        # Call the RPC function we created in Step 1. Feedback is the same for
+        # every user, so concurrent requests for a question share one call.
         rpc_params = {"p_question_id": str(question_id)}
-        response = await supabase.rpc("get_question_feedback", rpc_params).execute()
+        response = await single_flight("get_question_feedback").do(
+            str(question_id),
+            lambda: supabase.rpc("get_question_feedback", rpc_params).execute(),
+        )
 
         if not response.data:
             raise HTTPException(
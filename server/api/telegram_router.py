@@ -1,19 +1,15 @@
 # app/api/dashboard_router.py
 
-from typing import Annotated, cast
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from supabase import AsyncClient
-from postgrest import APIResponse
 
 
 from server.core.dependencies import get_current_user
 from server.db.db import get_supabase_client
-from server.models.schemas import (
-    DashboardStatsResponse,
-    DashboardSummary,
-    UserAuthResponse,
-)
+from server.lib.tag_catalog import tag_catalog
+from server.models.schemas import UserAuthResponse
 
 # Initialize the router
 router = APIRouter(prefix="/telegram", tags=["Telegram"])
@@ -21,19 +17,14 @@ router = APIRouter(prefix="/telegram", tags=["Telegram"])
 
 @router.get("/start", response_model=list)
 async def start_telegram_integration(
+    request: Request,
     supabase: Annotated[AsyncClient, Depends(get_supabase_client)],
     current_user: Annotated[UserAuthResponse, Depends(get_current_user)],
 ):
 
     try:
-        _response = (
-            await supabase.table("tags")
-            .select("id", "name")
-            .execute()
-        )
-
-        response = cast(APIResponse, _response)
-        return response.data
+        payload = await tag_catalog.payload(supabase, with_type=False)
+        return payload.to_response(request)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
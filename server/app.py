@@ -1,13 +1,13 @@
 import logging
-import logging.config
 import os
 import uuid
+from contextlib import asynccontextmanager
 from typing import Annotated
 
 import httpx
 import requests
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Response, status
+from fastapi import Depends, FastAPI, Header, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from supabase import AsyncClient
 
@@ -17,21 +17,145 @@ from server.api import (
     quiz_router,
     telegram_router,
 )
-from server.db.db import get_supabase_client
+from server.core.log_config import setup_logging, shutdown_logging
+from server.core.metrics import (
+    exposition,
+    family,
+    registry,
+    start_metrics_flusher,
+    stop_metrics_flusher,
+)
+from server.core.request_logging import RequestLoggingMiddleware
+from server.core.token_cache import token_cache
+from server.db.db import (
+    close_supabase_pool,
+    get_supabase_client,
+    open_supabase_pool,
+)
+from server.lib.og_image import (
+    close_og_client,
+    image_cache_key,
+    og_image_cache,
+    open_og_client,
+)
+from server.lib.cache import (
+    dashboard_forecast_cache,
+    dashboard_stats_cache,
+    dashboard_summary_cache,
+)
+from server.lib.single_flight import single_flight, single_flight_stats
+from server.lib.tag_catalog import tag_catalog
 from server.models.schemas import ContactUsFormat, QuestionForImageParams
 
 load_dotenv()
 
-# logging.config.fileConfig("./server/logging.ini", disable_existing_loggers=False)
-# logger = logging.getLogger("app")
+logger = logging.getLogger("app")
+
+API_DEBUG = os.environ.get("API_DEBUG", "") == "1"
+
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>". Without a token it
+# is only served in debug mode (API_DEBUG=1); otherwise it answers 404.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+def _cache_metrics() -> list[dict]:
+    """Exports the in-process cache and single-flight stats alongside the request metrics."""
+    caches = {
+        "token": token_cache.stats(),
+        "dashboard_summary": dashboard_summary_cache.stats(),
+        "dashboard_stats": dashboard_stats_cache.stats(),
+        "dashboard_forecast": dashboard_forecast_cache.stats(),
+    }
+    images = og_image_cache.stats()
+    groups = single_flight_stats()
+    return [
+        family(
+            "cache_lookups_total",
+            "counter",
+            "In-process cache lookups by result.",
+            ("cache", "result"),
+            [[[name, "hit"], s["hits"]] for name, s in caches.items()]
+            + [[[name, "miss"], s["misses"]] for name, s in caches.items()],
+        ),
+        family(
+            "cache_entries",
+            "gauge",
+            "Entries held by each in-process cache.",
+            ("cache",),
+            [[[name], s["size"]] for name, s in caches.items()]
+            + [[["og_image"], images["entries"]]],
+        ),
+        family(
+            "og_image_requests_total",
+            "counter",
+            "Share image requests by where they were served from.",
+            ("source",),
+            [
+                [["memory"], images["memory_hits"]],
+                [["disk"], images["disk_hits"]],
+                [["render"], images["renders"]],
+                [["coalesced"], images["coalesced"]],
+            ],
+        ),
+        family(
+            "single_flight_calls_total",
+            "counter",
+            "Calls made through each single-flight group.",
+            ("group",),
+            [[[name], s["calls"]] for name, s in groups.items()],
+        ),
+        family(
+            "single_flight_executions_total",
+            "counter",
+            "Underlying executions per single-flight group; calls minus executions were coalesced.",
+            ("group",),
+            [[[name], s["executions"]] for name, s in groups.items()],
+        ),
+        family(
+            "single_flight_errors_total",
+            "counter",
+            "Failed executions per single-flight group.",
+            ("group",),
+            [[[name], s["errors"]] for name, s in groups.items()],
+        ),
+    ]
+
+
+registry.register_collector(_cache_metrics)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens per-worker shared resources on startup and releases them on shutdown.
+    Runs once in every worker process, after it has been started.
+    """
+    setup_logging()
+    if not METRICS_TOKEN and not API_DEBUG:
+        logger.warning("METRICS_TOKEN is not set; /metrics is disabled")
+    metrics_flusher = start_metrics_flusher()
+    supabase = await open_supabase_pool()
+    await open_og_client()
+    try:
+        # Warm the tag catalog so a worker's first requests do not all wait on it.
+        await tag_catalog.ensure_loaded(supabase)
+    except Exception as e:
+        logger.warning(f"Could not preload the tag catalog: {e}")
+    yield
+    await close_og_client()
+    await close_supabase_pool()
+    await stop_metrics_flusher(metrics_flusher)
+    shutdown_logging()
+
 
 app = FastAPI(
     title="CognitoMD API",
+    lifespan=lifespan,
     swagger_ui_init_oauth={
         "clientId": None,
         "clientSecret": None,
     },
-    debug=True,
+    debug=API_DEBUG,
 )
 origins = [os.environ.get("ORIGIN_URL", "")]
 app.add_middleware(
@@ -42,16 +166,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# @app.middleware("http")
-# async def log_requests(request, call_next):
-#     logger.info(f"REQUEST {request.method} {request.url}")
-#     try:
-#         response = await call_next(request)
-#         logger.info(f"RESPONSE {response.status_code} for {request.url}")
-#         return response
-#     except Exception as e:
-#         logger.exception(f"Unhandled error: {e}")
-#         raise
+app.add_middleware(RequestLoggingMiddleware)
 
 app.include_router(auth_router.router, tags=["Authentication"])
 app.include_router(dashboard_router.router, tags=["Dashboard"])
@@ -64,6 +179,20 @@ def read_root():
     return {"message": "Welcome to the CognitoMD API"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Annotated[str | None, Header()] = None):
+    """Prometheus scrape endpoint: HTTP route, Supabase call and cache metrics."""
+    if not METRICS_TOKEN:
+        if not API_DEBUG:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    elif authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return Response(
+        content=await exposition(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.post("/contact-us")
 async def contact_us(
     contact_data: ContactUsFormat, supabase=Depends(get_supabase_client)
@@ -81,7 +210,7 @@ async def contact_us(
 
         return None
     except Exception as e:
-        logging.exception(f"Unhandled error in contact_us endpoint: {e}")
+        logger.exception(f"Unhandled error in contact_us endpoint: {e}")
         raise HTTPException(
             status_code=500,
             detail="An unexpected error occurred. Please try again later.",
@@ -104,7 +233,11 @@ async def get_image(
             "p_question_id": question_for_image_params.question_id if question_for_image_params else None,
         }
         
-        response = await supabase.rpc("get_question_for_image", rpc_params).execute()
+        # Concurrent requests for the same question (or the same random pick) share one call.
+        response = await single_flight("get_question_for_image").do(
+            (rpc_params["p_tag_id"], rpc_params["p_question_id"]),
+            lambda: supabase.rpc("get_question_for_image", rpc_params).execute(),
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Could not retrieve session result.")
@@ -126,7 +259,9 @@ async def get_image(
             }
 
         download_filename = f"{data.get('id', 'image')}.png" 
-        image_bytes = await fetch_og_image_async(image_url, params)
+        # Identical renders are served from the image cache; concurrent misses share one render.
+        cache_key = image_cache_key(params["id"], params)
+        image_bytes = await og_image_cache.get_or_render(cache_key, image_url, params)
 
         return Response(
             content=image_bytes,
@@ -137,20 +272,9 @@ async def get_image(
         )
 
     except httpx.HTTPStatusError as e:
-        print(e)
+        logger.error(f"OG image render failed: {e}")
         raise HTTPException(status_code=502, detail=f"Failed to generate image from upstream: ({str(e)})")
     except Exception as e:
-        print(e)
+        logger.exception(f"Unhandled error in get_image endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-
-async def fetch_og_image_async(url: str, params: dict) -> bytes:
-    """
-    Fetches image bytes asynchronously without blocking the server.
-    """
-    async with httpx.AsyncClient() as client:        
-        response = await client.get(url, params=params, timeout=10.0)
-        
-        response.raise_for_status()
-        
-        return response.content
\ No newline at end of file
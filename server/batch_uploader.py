@@ -1,194 +1,362 @@
+import argparse
 import asyncio
+import hashlib
 import json
 import os
-from re import A
+import time
+import uuid
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
 from postgrest.exceptions import APIError
 from supabase import AsyncClient, acreate_client
 
+from server.lib.json_stream import chunked, iter_json_records
+from server.lib.near_dupes import NearDuplicateIndex, correct_answer, question_text
+from server.lib.tag_registry import TagRegistry
+
 load_dotenv()
 
 # --- 1. Supabase Client Setup ---
 url: str = os.environ.get("SUPABASE_URL", "")
 key: str = os.environ.get("SUPABASE_KEY", "")
 
+# --- 2. Bulk Upload Tuning ---
+CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", "200"))
+MAX_CONCURRENT_CHUNKS = int(os.environ.get("UPLOAD_MAX_CONCURRENT_CHUNKS", "4"))
+CHUNK_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+
+# --- 3. Near-Duplicate Detection ---
+NEAR_DUP_INDEX_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "question_index.idx"
+)
+NEAR_DUP_THRESHOLD = float(os.environ.get("UPLOAD_NEAR_DUP_THRESHOLD", "0.9"))
+PAGE_SIZE = 1000
 
-def load_questions_from_file(file_path: str) -> list:
-    """Loads the large list of questions from a JSON file."""
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            questions = json.load(f)
-            print(f"Loaded {len(questions)} questions from {file_path}")
-            return questions
-    except FileNotFoundError:
-        print(f"ERROR: Question file not found at {file_path}")
-        return []
-    except json.JSONDecodeError:
-        print(f"ERROR: Could not decode JSON from {file_path}")
-        return []
 
+# Fields every question needs before it can be transformed into rows.
+REQUIRED_TEXT_FIELDS = (
+    "question",
+    "explanation",
+    "hint",
+    "question_category",
+    "clinical_setting",
+    "summary",
+    "common_pitfall",
+    "difficulty",
+    "key_takeaway",
+)
 
-async def _upsert_and_get_map(questions: list, supabase: AsyncClient) -> dict:
+
+def load_questions_from_file(file_path: str) -> Iterator[dict]:
     """
-    Helper function to bulk-upsert many-to-many items (specialties/terms)
-    and return a mapping of their name to their ID.
+    Streams questions from a JSON array or NDJSON file one record at a time,
+    so memory use stays flat however large the question bank is.
     """
-    "dami".strip()
-    specialties = set()
-    r_terms = set()
-    topics = set()
+    if not os.path.exists(file_path):
+        print(f"ERROR: Question file not found at {file_path}")
+        return
+    print(f"Streaming questions from {file_path}")
+    try:
+        yield from iter_json_records(file_path)
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"ERROR: Could not decode JSON from {file_path}: {e}")
 
-    for question in questions:
-        specialties = specialties.union(set(question["specialty"]))
-        r_terms = r_terms.union(set(question["related_terms"]))
-        topics = topics.union(set(question["related_topics"]))
 
-    print(
-        f"Upserting tags:\nTotal: {len(specialties) + len(r_terms) + len(topics)}. ({len(specialties)} specialties, {len(r_terms)} related terms, {len(topics)} topics)..."
-    )
-    try:
-        # 1. Upsert all unique items in one go
-        s_data = [{"name": name.strip(), "type": "SPECIALTY"} for name in specialties]
-        r_data = [{"name": name.strip(), "type": "RELATED_TERM"} for name in r_terms]
-        t_data = [{"name": name.strip(), "type": "TOPIC"} for name in r_terms]
+async def _load_near_dupe_index(supabase: AsyncClient) -> NearDuplicateIndex:
+    """
+    Loads the persisted near-duplicate index of uploaded questions, building it
+    from the questions and options tables if absent.
+    """
+    if os.path.exists(NEAR_DUP_INDEX_FILE):
+        try:
+            index = NearDuplicateIndex.load(NEAR_DUP_INDEX_FILE, threshold=NEAR_DUP_THRESHOLD)
+            print(f"Near-duplicate index holds {len(index)} questions.")
+            return index
+        except ValueError as e:
+            print(f"Rebuilding the near-duplicate index: {e}")
 
-        r_response = (
-            await supabase.table("tags").upsert(r_data, on_conflict="name").execute()
+    print("Building the near-duplicate index from the questions table...")
+    index = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD)
+    start = 0
+    while True:
+        response = (
+            await supabase.table("questions")
+            .select("id, question_text, options(option_text, is_correct)")
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
         )
-        t_response = (
-            await supabase.table("tags").upsert(t_data, on_conflict="name").execute()
-        )
-        s_response = (
-            await supabase.table("tags").upsert(s_data, on_conflict="name").execute()
+        for row in response.data:
+            index.add(row["id"], question_text(row), correct_answer(row))
+        if len(response.data) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    index.save(NEAR_DUP_INDEX_FILE)
+    print(f"Near-duplicate index holds {len(index)} questions.")
+    return index
+
+
+def _dedupe(
+    questions: Iterable[dict],
+    index: NearDuplicateIndex,
+    near_duplicates: list,
+    skip_near_duplicates: bool = False,
+) -> Iterator[dict]:
+    """
+    Drops questions whose normalized stem has already been seen in this run, and
+    records in near_duplicates those that near-duplicate (reworded stem, same
+    correct answer) one already in the database or earlier in this run. Near-
+    duplicates are only dropped with skip_near_duplicates. Each question that
+    passes is assigned its ID here so it can be indexed before it is uploaded.
+    """
+    seen = set()
+    duplicates = 0
+    for q_data in questions:
+        stem = " ".join(str(q_data.get("question", "")).split()).casefold()
+        digest = hashlib.sha256(stem.encode()).digest()
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+
+        question_id = q_data.setdefault("id", str(uuid.uuid4()))
+        match = index.add_if_unique(
+            question_id,
+            question_text(q_data),
+            correct_answer(q_data),
+            index_duplicates=not skip_near_duplicates,
         )
+        if match is not None:
+            duplicate_of, similarity = match
+            near_duplicates.append(
+                {"duplicate_of": duplicate_of, "similarity": similarity, "question": q_data}
+            )
+            if skip_near_duplicates:
+                continue
+        yield q_data
+    if duplicates:
+        print(f"Skipped {duplicates} duplicate questions.")
+    if near_duplicates:
+        action = "Skipped" if skip_near_duplicates else "Flagged"
+        print(f"{action} {len(near_duplicates)} near-duplicate questions.")
+
 
-        if not r_response.data:
-            raise Exception("No data returned from upsert. related_term")
-        if not t_response.data:
-            raise Exception("No data returned from upsert. topic")
-        if not s_response.data:
-            raise Exception("No data returned from upsert. specialty")
+def _validate(questions: Iterable[dict], failed_questions: list) -> Iterator[dict]:
+    """Passes on well-formed questions and records the rest as failed."""
+    for q_data in questions:
+        missing = [
+            field
+            for field in REQUIRED_TEXT_FIELDS
+            if not isinstance(q_data.get(field), str)
+        ]
+        if "guideline_ref" not in q_data:
+            missing.append("guideline_ref")
+        if not isinstance(q_data.get("needs_review"), bool):
+            missing.append("needs_review")
+        if not q_data.get("options"):
+            missing.append("options")
+        if missing:
+            print(f"ERROR preparing question: missing or invalid fields {missing}. Skipping...")
+            failed_questions.append(q_data)
+            continue
+        yield q_data
 
-        response = await supabase.table("tags").select("*").execute()
 
-        if not response.data:
-            raise Exception("No data returned from upsert.")
+async def _load_tag_registry(supabase: AsyncClient) -> TagRegistry:
+    """Loads the persisted tag index, building it from the tags table if absent."""
+    registry = TagRegistry()
+    if not registry.load():
+        print("No local tag index found. Building it from the tags table...")
+        await registry.rebuild(supabase)
+    print(f"Tag index holds {len(registry)} items.")
+    return registry
 
-        # 2. Create the name -> id map
-        # This is a simple in-memory "dictionary" for fast lookups
-        name_to_id_map = {item["name"]: item["id"] for item in response.data}
-        print(f"Successfully mapped {len(name_to_id_map)} items.")
-        with open("all_tags.json", "w") as f:
-            json.dump(name_to_id_map, f)
-        return name_to_id_map
 
+async def _sync_tags(
+    registry: TagRegistry, questions: list, supabase: AsyncClient
+) -> None:
+    """
+    Brings the tag index up to date with the tags used by the questions,
+    upserting only names the index does not know yet.
+    """
+    try:
+        added = await registry.sync(questions, supabase)
+        if added:
+            print(f"Upserted {added} new tags. Tag index holds {len(registry)} items.")
     except APIError as e:
         print(f"API Error upserting: {e.message}")
-        return {}
     except Exception as e:
-        print(f"Error creating map: {e}")
-        return {}
+        print(f"Error syncing tags: {e}")
 
 
-async def batch_upload_questions(all_questions: list, supabase: AsyncClient):
+def _build_question_rows(
+    q_data: dict, tag_registry: TagRegistry
+) -> tuple[dict, list[dict], list[dict]]:
     """
-    Uploads all questions in batches for maximum efficiency.
+    Converts one question from the input file into its 'questions', 'options'
+    and 'question_tags' rows. IDs are generated client-side so all three tables
+    can be written in bulk without reading the inserted questions back.
     """
+    question_id = q_data.get("id") or str(uuid.uuid4())
+    guideline_ref = (
+        None
+        if q_data["guideline_ref"] is None or q_data["guideline_ref"] == "null"
+        else q_data["guideline_ref"]
+    )
+    question_to_insert = {
+        "id": question_id,
+        "question_text": q_data["question"].strip(),
+        "explanation": q_data["explanation"].strip(),
+        "status": "published" if not q_data["needs_review"] else "draft",
+        "created_by_user_id": "cb8fa0d1-d119-4109-9a04-8d85fd6b22ff",
+        "hint": q_data["hint"].strip(),
+        "question_category": q_data["question_category"].strip(),
+        "clinical_setting": q_data["clinical_setting"].strip(),
+        "summary": q_data["summary"].strip(),
+        "common_pitfall": q_data["common_pitfall"].strip(),
+        "guideline_ref": guideline_ref,
+        "ranked_difficulty": q_data["difficulty"].strip().split(" ")[0],
+        "key_takeaway": q_data["key_takeaway"].strip(),
+    }
+    options_to_insert = [
+        {
+            "id": str(uuid.uuid4()),
+            "question_id": question_id,
+            "option_text": opt["text"].strip(),
+            "is_correct": opt["is_correct"],
+        }
+        for opt in q_data.get("options", [])
+    ]
+    tag_ids = {
+        tag_registry.get(tag)
+        for tag in q_data.get("specialty", [])
+        + q_data.get("related_terms", [])
+        + q_data.get("related_topics", [])
+    }
+    q_tags_links = [
+        {"question_id": question_id, "tag_id": tag_id}
+        for tag_id in tag_ids
+        if tag_id
+    ]
+    return question_to_insert, options_to_insert, q_tags_links
 
-    print("Pre-processing: Finding all unique specialties and terms...")
 
-    all_tags_map = await _upsert_and_get_map(all_questions, supabase)
+async def _upload_chunk(chunk: list[tuple[dict, dict, list, list]], supabase: AsyncClient):
+    """
+    Writes one chunk with three multi-row requests. Upserts keyed on the
+    client-generated IDs make a retried chunk idempotent.
+    """
+    questions = [question for _, question, _, _ in chunk]
+    options = [option for _, _, q_options, _ in chunk for option in q_options]
+    links = [link for _, _, _, q_links in chunk for link in q_links]
+
+    await supabase.table("questions").upsert(questions).execute()
+    if options:
+        await supabase.table("options").upsert(options).execute()
+    if links:
+        await supabase.table("question_tags").upsert(
+            links, on_conflict="question_id,tag_id"
+        ).execute()
+
+
+async def batch_upload_questions(
+    questions: Iterable[dict],
+    supabase: AsyncClient,
+    chunk_size: int = CHUNK_SIZE,
+    max_concurrent_chunks: int = MAX_CONCURRENT_CHUNKS,
+    skip_near_duplicates: bool = False,
+):
+    """
+    Uploads a stream of questions in chunked, multi-row batches for maximum efficiency.
+    Records flow through dedupe -> validate -> transform -> upload, and at most
+    max_concurrent_chunks chunks are held in memory and in flight at once.
+    Each failed chunk is retried with exponential backoff before being recorded
+    in failed.json. Near-duplicates are recorded in near_duplicates.json, and
+    only left out of the upload with skip_near_duplicates.
+    """
+
+    tag_registry = await _load_tag_registry(supabase)
+    near_dupe_index = await _load_near_dupe_index(supabase)
 
     print("\n--- Starting Batch Upload Process ---")
-    successful, failed = 0, 0
+    started = time.perf_counter()
     failed_questions = []
-    for i in range(0, len(all_questions)):
-        try:
-            q_data = all_questions[i].copy()
-            q_tags = []
-            options_to_insert = []
-            guideline_ref = (
-                None
-                if q_data["guideline_ref"] is None or q_data["guideline_ref"] == "null"
-                else q_data["guideline_ref"]
-            )
-            question_to_insert = {
-                "question_text": q_data["question"].strip(),
-                "explanation": q_data["explanation"].strip(),
-                "status": "published" if not q_data["needs_review"] else "draft",
-                "created_by_user_id": "cb8fa0d1-d119-4109-9a04-8d85fd6b22ff",
-                "hint": q_data["hint"].strip(),
-                "question_category": q_data["question_category"].strip(),
-                "clinical_setting": q_data["clinical_setting"].strip(),
-                "summary": q_data["summary"].strip(),
-                "common_pitfall": q_data["common_pitfall"].strip(),
-                "guideline_ref": guideline_ref,
-                "ranked_difficulty": q_data["difficulty"].strip().split(" ")[0],
-                "key_takeaway": q_data["key_takeaway"].strip(),
-            }
-            q_res = (
-                await supabase.table("questions").insert(question_to_insert).execute()
-            )
-            if not q_res.data:
-                failed += 1
-                print(f"Failed to insert question {i+1}. Skipping...")
-                print(f"Failed questions so far: {failed}")
-                continue
-            created_question = q_res.data[0]
-            new_question_id = created_question["id"]
-            for opt in q_data.get("options", []):
-                options_to_insert.append(
-                    {
-                        "question_id": new_question_id,
-                        # "option": opt["option"],
-                        "option_text": opt["text"].strip(),
-                        "is_correct": opt["is_correct"],
-                    }
-                )
-            await supabase.table("options").insert(options_to_insert).execute()
-            _tags = list(
-                set(
-                    q_data.get("specialty", [])
-                    + q_data.get("related_terms", [])
-                    + q_data.get("related_topics", [])
+    near_duplicates = []
+    successful = 0
+
+    async def upload_with_retry(index: int, chunk: list):
+        nonlocal successful
+        for attempt in range(1, CHUNK_RETRIES + 1):
+            try:
+                await _upload_chunk(chunk, supabase)
+                successful += len(chunk)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"Chunk {index + 1} uploaded. "
+                    f"Total successful: {successful} ({successful / elapsed:.1f} questions/sec)"
                 )
+                return
+            except Exception as e:
+                message = e.message if isinstance(e, APIError) else str(e)
+                print(f"ERROR uploading chunk {index + 1} (attempt {attempt}/{CHUNK_RETRIES}): {message}")
+                if attempt < CHUNK_RETRIES:
+                    await asyncio.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        print(f"Giving up on chunk {index + 1}; recording its questions in failed.json.")
+        failed_questions.extend(q_data for q_data, _, _, _ in chunk)
+
+    in_flight = set()
+    valid_questions = _validate(
+        _dedupe(questions, near_dupe_index, near_duplicates, skip_near_duplicates),
+        failed_questions,
+    )
+    for index, chunk in enumerate(chunked(valid_questions, chunk_size)):
+        await _sync_tags(tag_registry, chunk, supabase)
+        rows = [(q_data, *_build_question_rows(q_data, tag_registry)) for q_data in chunk]
+        if len(in_flight) >= max_concurrent_chunks:
+            _, in_flight = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
             )
-            tags = [tag.strip() for tag in _tags]
-            q_tags.extend(tags)
-            q_tags_links = [
-                {"question_id": new_question_id, "tag_id": all_tags_map.get(tag_name)}
-                for tag_name in q_tags
-                if all_tags_map.get(tag_name)
-            ]
-
-            await supabase.table("question_tags").insert(q_tags_links).execute()
-            successful += 1
-            print(
-                f"Successfully inserted question {i+1}. Total successful: {successful}"
-            )
-        except APIError as e:
-            print(f"ERROR processing question {i}: {e.message}")
-            print("Skipping this question and continuing...")
-            failed_questions.append((q_data))
-            continue
-        except Exception as e:
-            print(f"CRITICAL ERROR processing quesetion {i}: {e}")
-            print("Skipping this chunk and continuing...")
+        in_flight.add(asyncio.create_task(upload_with_retry(index, rows)))
+    if in_flight:
+        await asyncio.wait(in_flight)
 
+    elapsed = time.perf_counter() - started
+    # Questions that never reached the database must not block future imports.
+    for q_data in failed_questions:
+        near_dupe_index.remove(q_data.get("id"))
+    near_dupe_index.save(NEAR_DUP_INDEX_FILE)
     with open('failed.json', 'w') as f:
         json.dump(failed_questions, f)
+    with open('near_duplicates.json', 'w') as f:
+        json.dump(near_duplicates, f)
     print("\n--- Batch Upload Complete ---")
+    print(
+        f"Uploaded {successful} questions in {elapsed:.1f}s "
+        f"({successful / elapsed if elapsed else 0:.1f} questions/sec). "
+        f"Failed: {len(failed_questions)}. Near-duplicates "
+        f"{'skipped' if skip_near_duplicates else 'flagged'}: {len(near_duplicates)}."
+    )
 
 
 async def main():
-    # Load your giant JSON file
-    # Make sure this file is a JSON *list* of your question objects
+    # Run from the repository root: python -m server.batch_uploader [questions.json|.ndjson]
+    # The file may be a JSON *list* of question objects or NDJSON (one object per line).
+    parser = argparse.ArgumentParser(description="Upload enriched questions to Supabase.")
+    parser.add_argument("file_path", nargs="?", default="output_file.json")
+    parser.add_argument(
+        "--skip-near-duplicates",
+        action="store_true",
+        help="Leave near-duplicates out of the upload instead of only reporting them.",
+    )
+    args = parser.parse_args()
     supabase: AsyncClient = await acreate_client(url, key)
-    all_questions = load_questions_from_file("output_file.json")
-
-    if all_questions:
-        await batch_upload_questions(all_questions, supabase)
+    await batch_upload_questions(
+        load_questions_from_file(args.file_path),
+        supabase,
+        skip_near_duplicates=args.skip_near_duplicates,
+    )
 
 
 if __name__ == "__main__":
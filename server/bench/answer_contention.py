@@ -0,0 +1,169 @@
+"""
+Benchmark: concurrent answers to one question, before and after the
+question statistics log.
+
+Every client answers the same question in a closed loop with pgbench, once
+through each answer path (see answer_contention.sql):
+
+    inline  every answer updates the question's row, so concurrent answers
+            queue on its row lock
+    log     process_answer_submission(), which appends to question_stats_log
+            while fold_question_stats() drains it every --fold-interval
+
+and reports throughput and p50/p95/p99 latency per path and client count.
+Each run starts from a vacuumed question row. After each run the statistics
+are folded and checked: the question's times_answered must have grown by
+exactly the number of answers given.
+
+Runs with psql and pgbench against a scratch database that has
+server/database.sql loaded. On plain Postgres, create the auth.users table
+Supabase provides first:
+    psql scratch -c 'CREATE SCHEMA auth; CREATE TABLE auth.users (id uuid PRIMARY KEY);'
+    psql scratch -f server/database.sql
+    python -m server.bench.answer_contention --database scratch --clients 1,8,32,64
+"""
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_DATABASE = os.environ.get("BENCH_DATABASE", "scratch")
+
+ANSWER_FUNCTIONS = {
+    "inline": "bench_contention.process_answer_submission_inline",
+    "log": "process_answer_submission",
+}
+
+# Client n answers as bench user n + 1 in its own session (see answer_contention.sql).
+# 'forgot' keeps the client's interval at one day; repeated passes would grow it until
+# next_review_at overflows.
+SCRIPT = """\\set time_to_answer_ms random(3000, 90000)
+SELECT {function}(
+    md5('bench-contention-user-' || (:client_id + 1))::uuid,
+    md5('bench-contention-session-' || (:client_id + 1))::uuid,
+    :question_id, :option_id, 'forgot', :time_to_answer_ms
+);
+"""
+
+
+def run_psql(args: argparse.Namespace, sql: str, variables: dict[str, int] | None = None) -> str:
+    command = [*shlex.split(args.psql), "-X", "-q", "-A", "-t", "-v", "ON_ERROR_STOP=1"]
+    for name, value in (variables or {}).items():
+        command += ["-v", f"{name}={value}"]
+    result = subprocess.run([*command, args.database], input=sql, text=True, capture_output=True)
+    if result.returncode != 0:
+        raise SystemExit(f"psql failed:\n{result.stderr}")
+    return result.stdout
+
+
+def times_answered(args: argparse.Namespace, question_id: str) -> int:
+    return int(run_psql(args, f"SELECT times_answered FROM questions WHERE id = '{question_id}';"))
+
+
+def fold_every(args: argparse.Namespace, stop: threading.Event) -> None:
+    while not stop.wait(args.fold_interval):
+        run_psql(args, "SELECT fold_question_stats();")
+
+
+def run_pgbench(
+    args: argparse.Namespace, path: str, clients: int, question_id: str, option_id: str
+) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        script = Path(workdir, "answer.sql")
+        script.write_text(SCRIPT.format(function=ANSWER_FUNCTIONS[path]), encoding="utf-8")
+        command = [
+            *shlex.split(args.pgbench), "--no-vacuum", "--protocol=prepared",
+            f"--client={clients}", f"--jobs={min(clients, args.jobs)}", f"--time={args.duration:g}",
+            f"--define=question_id={question_id}", f"--define=option_id={option_id}",
+            "--log", f"--log-prefix={Path(workdir, 'txn')}", f"--file={script}", args.database,
+        ]
+        result = subprocess.run(command, text=True, capture_output=True, cwd=workdir)
+        if result.returncode != 0:
+            raise SystemExit(f"pgbench failed:\n{result.stderr}")
+        # Each log line is: client_id transaction_no time_us script_no epoch epoch_us
+        latencies = sorted(
+            int(line.split()[2]) / 1000
+            for log in Path(workdir).glob("txn.*")
+            for line in log.read_text().splitlines()
+        )
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        "answers": len(latencies),
+        "tps": len(latencies) / args.duration,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--database", default=DEFAULT_DATABASE, help="Database name or connection string to run against."
+    )
+    parser.add_argument("--psql", default="psql", help="psql command.")
+    parser.add_argument("--pgbench", default="pgbench", help="pgbench command from the same installation.")
+    parser.add_argument("--clients", default="1,8,32,64", help="Comma-separated client counts.")
+    parser.add_argument("--jobs", type=int, default=8, help="pgbench worker threads.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per run.")
+    parser.add_argument("--fold-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    client_counts = [int(n) for n in args.clients.split(",")]
+    run_psql(
+        args,
+        (BENCH_DIR / "answer_contention.sql").read_text(encoding="utf-8"),
+        {"clients": max(client_counts)},
+    )
+    question_id, option_id = run_psql(
+        args,
+        "SELECT q.id, o.id FROM questions AS q JOIN options AS o ON o.question_id = q.id "
+        "WHERE q.id = md5('bench-contention-question')::uuid AND o.is_correct;",
+    ).strip().split("|")
+
+    print(
+        f"{'path':<8}{'clients':>8}{'answers':>9}{'answers/s':>11}"
+        f"{'mean ms':>9}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}  check"
+    )
+    for clients in client_counts:
+        for path in ANSWER_FUNCTIONS:
+            # Start each run from a vacuumed question row, so one path does not pay for
+            # the dead row versions the previous run left behind.
+            run_psql(args, "SELECT fold_question_stats();\nVACUUM questions, question_stats_log;")
+            before = times_answered(args, question_id)
+
+            stop = threading.Event()
+            folder = None
+            if path == "log":
+                folder = threading.Thread(target=fold_every, args=(args, stop))
+                folder.start()
+            try:
+                s = run_pgbench(args, path, clients, question_id, option_id)
+            finally:
+                stop.set()
+                if folder:
+                    folder.join()
+
+            run_psql(args, "SELECT fold_question_stats();")
+            counted = times_answered(args, question_id) - before
+            check = "ok" if counted == s["answers"] else f"counted {counted}"
+            print(
+                f"{path:<8}{clients:>8}{s['answers']:>9}{s['tps']:>11.0f}"
+                f"{s['mean_ms']:>9.2f}{s['p50_ms']:>8.2f}{s['p95_ms']:>8.2f}{s['p99_ms']:>8.2f}  {check}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+-- =================================================================
+-- Benchmark setup: concurrent answers to one question
+-- Prepares a scratch database for server/bench/answer_contention.py,
+-- which has many clients answer the same question at once through
+--   inline  the answer path before question_stats_log: every answer
+--           updates the question's row in "questions"
+--   log     process_answer_submission() from server/database.sql, which
+--           appends to question_stats_log for fold_question_stats()
+--
+-- Expects the psql variable clients (the largest client count to run) and
+-- a database with server/database.sql loaded. Bench rows are keyed by
+-- md5('bench-contention-...') and reused on later runs.
+-- =================================================================
+
+SET client_min_messages = warning;
+
+DROP SCHEMA IF EXISTS bench_contention CASCADE;
+CREATE SCHEMA bench_contention;
+
+-- One question with four options, answered by every client.
+INSERT INTO questions (id, question_text, explanation)
+VALUES (md5('bench-contention-question')::uuid, 'Bench contention question', 'Bench contention explanation')
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO options (id, question_id, option_text, is_correct)
+SELECT md5('bench-contention-option-' || o)::uuid, md5('bench-contention-question')::uuid, 'Option ' || o, o = 1
+FROM generate_series(1, 4) AS o
+ON CONFLICT (id) DO NOTHING;
+
+-- Client n answers as bench user n + 1, in a session of its own, so the only
+-- row every client writes is the question's.
+INSERT INTO auth.users (id)
+SELECT md5('bench-contention-user-' || u)::uuid
+FROM generate_series(1, :clients) AS u
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO "user" (id)
+SELECT md5('bench-contention-user-' || u)::uuid
+FROM generate_series(1, :clients) AS u
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO user_quiz_sessions (id, user_id, session_type)
+SELECT md5('bench-contention-session-' || u)::uuid, md5('bench-contention-user-' || u)::uuid, 'custom_practice'
+FROM generate_series(1, :clients) AS u
+ON CONFLICT (id) DO NOTHING;
+
+-- Same definition as process_answer_submission() in server/database.sql, except for Step 3,
+-- which is the in-place UPDATE it replaced.
+CREATE FUNCTION bench_contention.process_answer_submission_inline(
+    p_user_id uuid,
+    p_session_id uuid,
+    p_question_id uuid,
+    p_selected_option_id uuid,
+    p_performance_rating text,
+    p_time_to_answer_ms integer
+)
+RETURNS json AS $$ -- It will return a single JSON object with all feedback.
+DECLARE
+    -- Variables to store feedback data for the final response.
+    v_is_correct boolean;
+    v_correct_option_id uuid;
+    v_explanation text;
+
+    -- Variables for the SRS calculation.
+    v_current_repetitions integer;
+    v_current_ease_factor numeric;
+    v_current_interval integer;
+    v_new_repetitions integer;
+    v_new_ease_factor numeric;
+    v_new_interval integer;
+    v_next_review_at timestamptz;
+
+    -- A variable to hold the entire updated progress record.
+    v_updated_progress_record user_question_progress;
+
+    -- Whether this is the user's first answer to the question.
+    v_is_new_question boolean := FALSE;
+BEGIN
+    -- Step 1: Determine if the selected answer was correct.
+    SELECT o.is_correct INTO v_is_correct
+    FROM options AS o
+    WHERE o.id = p_selected_option_id;
+
+    -- Step 2: Log the specific answer for this session.
+    INSERT INTO user_session_answers (session_id, question_id, selected_option_id, is_correct, time_to_answer_ms, answered_at)
+    VALUES (p_session_id, p_question_id, p_selected_option_id, v_is_correct, p_time_to_answer_ms, now());
+
+    -- Step 3: Update the question's statistics in place (the pre-log version). The running
+    -- total is widened to bigint as in fold_question_stats(): one bench run can give the
+    -- question more answers than the integer product allows.
+    UPDATE questions
+    SET
+        avg_time_to_answer_ms = CASE
+            WHEN avg_time_to_answer_ms IS NULL THEN p_time_to_answer_ms
+            ELSE ((avg_time_to_answer_ms::bigint * times_answered) + p_time_to_answer_ms) / (times_answered + 1)
+        END,
+        times_answered = times_answered + 1,
+        times_correct = times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END),
+        difficulty = CASE
+            WHEN (times_answered + 1) < 20 THEN difficulty
+            WHEN (times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END))::numeric / (times_answered + 1) >= 0.85 THEN 'easy'
+            WHEN (times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END))::numeric / (times_answered + 1) <= 0.50 THEN 'hard'
+            ELSE 'medium'
+        END
+    WHERE id = p_question_id
+    RETURNING explanation INTO v_explanation;
+
+    -- Step 4: Fetch the user's current SRS progress for this question.
+    SELECT repetitions, ease_factor, current_interval
+    INTO v_current_repetitions, v_current_ease_factor, v_current_interval
+    FROM user_question_progress
+    WHERE user_id = p_user_id AND question_id = p_question_id;
+
+    -- If no record exists, initialize with default values for the first review.
+    IF NOT FOUND THEN
+        v_current_repetitions := 0;
+        v_current_ease_factor := 2.5;
+        v_current_interval := 0;
+        v_is_new_question := TRUE;
+    END IF;
+
+    -- Step 5: Calculate new SRS values based on the user's performance rating (SM-2 logic).
+    IF p_performance_rating = 'forgot' THEN
+        v_new_repetitions := 0;
+        v_new_interval := 1;
+        v_new_ease_factor := GREATEST(1.3, v_current_ease_factor - 0.2);
+    ELSE -- This handles 'good' or 'easy' ratings.
+        v_new_repetitions := v_current_repetitions + 1;
+        IF v_new_repetitions = 1 THEN
+            v_new_interval := 1;
+        ELSIF v_new_repetitions = 2 THEN
+            v_new_interval := 6;
+        ELSE
+            v_new_interval := round(v_current_interval * v_current_ease_factor);
+        END IF;
+
+        IF p_performance_rating = 'easy' THEN
+            v_new_ease_factor := v_current_ease_factor + 0.15;
+        ELSE
+            v_new_ease_factor := v_current_ease_factor;
+        END IF;
+    END IF;
+
+    -- Calculate the next review date based on the new interval.
+    v_next_review_at := now() + (v_new_interval * interval '1 day');
+
+    -- Step 6: "Upsert" the user's progress record and capture the updated row.
+    INSERT INTO user_question_progress (
+        user_id, question_id, repetitions, ease_factor, current_interval, next_review_at, last_reviewed_at, status
+    )
+    VALUES (
+        p_user_id, p_question_id, v_new_repetitions, v_new_ease_factor, v_new_interval, v_next_review_at, now(), 'learning'
+    )
+    ON CONFLICT (user_id, question_id) DO UPDATE
+    SET
+        repetitions = v_new_repetitions,
+        ease_factor = v_new_ease_factor,
+        current_interval = v_new_interval,
+        next_review_at = v_next_review_at,
+        last_reviewed_at = now(),
+        status = 'learning'
+    RETURNING * INTO v_updated_progress_record;
+
+    -- Roll the answer into the user's daily statistics for the dashboard.
+    INSERT INTO user_daily_stats (user_id, day, answers, correct, time_spent_ms, new_questions)
+    VALUES (
+        p_user_id, current_date, 1, (CASE WHEN v_is_correct THEN 1 ELSE 0 END),
+        COALESCE(p_time_to_answer_ms, 0), (CASE WHEN v_is_new_question THEN 1 ELSE 0 END)
+    )
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET
+        answers = user_daily_stats.answers + EXCLUDED.answers,
+        correct = user_daily_stats.correct + EXCLUDED.correct,
+        time_spent_ms = user_daily_stats.time_spent_ms + EXCLUDED.time_spent_ms,
+        new_questions = user_daily_stats.new_questions + EXCLUDED.new_questions;
+
+    -- Step 7: Fetch the actual correct option ID to return to the frontend.
+    SELECT o.id INTO v_correct_option_id
+    FROM options AS o
+    WHERE o.question_id = p_question_id AND o.is_correct = TRUE
+    LIMIT 1;
+
+    -- Step 8: Construct and return the complete response object as a single JSON.
+    RETURN json_build_object(
+        'is_correct', v_is_correct,
+        'correct_option_id', v_correct_option_id,
+        'explanation', v_explanation,
+        'new_progress', row_to_json(v_updated_progress_record)
+    );
+
+END;
+$$ LANGUAGE plpgsql;
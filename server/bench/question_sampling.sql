@@ -0,0 +1,185 @@
+-- =================================================================
+-- Benchmark: unseen-question sampling
+-- Compares ORDER BY random() against the random_key index seek used by
+-- sample_unseen_question_ids() on 100k questions, with one user who has
+-- already answered 10k of them.
+--
+-- Run against a scratch Postgres database:
+--   psql -d scratch -f server/bench/question_sampling.sql
+-- Everything is created in the "bench_sampling" schema and dropped at the end.
+-- =================================================================
+
+\timing on
+SET client_min_messages = warning;
+
+DROP SCHEMA IF EXISTS bench_sampling CASCADE;
+CREATE SCHEMA bench_sampling;
+SET search_path = bench_sampling, public;
+
+-- Minimal copies of the tables the sampler touches (see server/database.sql).
+CREATE TABLE questions (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    question_text text NOT NULL,
+    random_key double precision NOT NULL DEFAULT random()
+);
+CREATE INDEX questions_random_key_idx ON questions (random_key);
+
+CREATE TABLE question_tags (
+    question_id uuid NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    tag_id uuid NOT NULL,
+    PRIMARY KEY (question_id, tag_id)
+);
+CREATE INDEX question_tags_tag_id_idx ON question_tags (tag_id, question_id);
+
+CREATE TABLE user_question_progress (
+    user_id uuid NOT NULL,
+    question_id uuid NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, question_id)
+);
+
+-- 100k questions spread over 50 tags; the benchmark user has answered 10k.
+INSERT INTO questions (question_text)
+SELECT 'Question ' || g FROM generate_series(1, 100000) AS g;
+
+CREATE TEMP TABLE bench_tags AS
+SELECT gen_random_uuid() AS tag_id, g AS n FROM generate_series(0, 49) AS g;
+
+INSERT INTO question_tags (question_id, tag_id)
+SELECT q.id, t.tag_id
+FROM (SELECT id, row_number() OVER () AS rn FROM questions) AS q
+JOIN bench_tags AS t ON t.n = q.rn % 50;
+
+INSERT INTO user_question_progress (user_id, question_id)
+SELECT '00000000-0000-0000-0000-000000000001', id
+FROM questions
+ORDER BY random()
+LIMIT 10000;
+
+ANALYZE questions;
+ANALYZE question_tags;
+ANALYZE user_question_progress;
+
+-- Same definition as server/database.sql.
+CREATE OR REPLACE FUNCTION sample_unseen_question_ids(
+    p_user_id uuid,
+    p_limit integer,
+    p_tag_id uuid DEFAULT NULL
+)
+RETURNS SETOF uuid AS $$
+DECLARE
+    v_pivot double precision := random();
+    v_found integer;
+BEGIN
+    RETURN QUERY
+    SELECT q.id
+    FROM questions AS q
+    WHERE q.random_key >= v_pivot
+    AND NOT EXISTS (
+        SELECT 1
+        FROM user_question_progress AS uqp
+        WHERE uqp.question_id = q.id AND uqp.user_id = p_user_id
+    )
+    AND (
+        p_tag_id IS NULL
+        OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = q.id AND qt.tag_id = p_tag_id)
+    )
+    ORDER BY q.random_key
+    LIMIT p_limit;
+
+    GET DIAGNOSTICS v_found = ROW_COUNT;
+
+    IF v_found < p_limit THEN
+        RETURN QUERY
+        SELECT q.id
+        FROM questions AS q
+        WHERE q.random_key < v_pivot
+        AND NOT EXISTS (
+            SELECT 1
+            FROM user_question_progress AS uqp
+            WHERE uqp.question_id = q.id AND uqp.user_id = p_user_id
+        )
+        AND (
+            p_tag_id IS NULL
+            OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = q.id AND qt.tag_id = p_tag_id)
+        )
+        ORDER BY q.random_key
+        LIMIT p_limit - v_found;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+\echo '--- Baseline: ORDER BY random(), no tag ---'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT q.id
+FROM questions AS q
+WHERE NOT EXISTS (
+    SELECT 1 FROM user_question_progress AS uqp
+    WHERE uqp.question_id = q.id AND uqp.user_id = '00000000-0000-0000-0000-000000000001'
+)
+ORDER BY random()
+LIMIT 20;
+
+\echo '--- Baseline: ORDER BY random(), one tag ---'
+EXPLAIN (ANALYZE, BUFFERS, COSTS OFF)
+SELECT q.id
+FROM questions AS q
+WHERE NOT EXISTS (
+    SELECT 1 FROM user_question_progress AS uqp
+    WHERE uqp.question_id = q.id AND uqp.user_id = '00000000-0000-0000-0000-000000000001'
+)
+AND q.id IN (SELECT qt.question_id FROM question_tags qt WHERE qt.tag_id = (SELECT tag_id FROM bench_tags WHERE n = 7))
+ORDER BY random()
+LIMIT 20;
+
+-- Mean time per call over 100 separate executions of each strategy. Each one
+-- runs its own statement, so nothing is shared or rewound between calls.
+CREATE FUNCTION time_calls(p_label text, p_query text, p_calls integer DEFAULT 100)
+RETURNS TABLE (strategy text, calls integer, ms_per_call numeric) AS $$
+DECLARE
+    v_started timestamptz := clock_timestamp();
+    v_rows integer;
+BEGIN
+    FOR i IN 1..p_calls LOOP
+        EXECUTE format('SELECT count(*) FROM (%s) AS s', p_query) INTO v_rows;
+    END LOOP;
+    RETURN QUERY SELECT
+        p_label,
+        p_calls,
+        round((extract(epoch FROM clock_timestamp() - v_started) * 1000 / p_calls)::numeric, 3);
+END;
+$$ LANGUAGE plpgsql;
+
+\echo '--- Mean per call, 100 calls each ---'
+SELECT * FROM time_calls('ORDER BY random(), no tag', $q$
+    SELECT q.id
+    FROM questions AS q
+    WHERE NOT EXISTS (
+        SELECT 1 FROM user_question_progress AS uqp
+        WHERE uqp.question_id = q.id AND uqp.user_id = '00000000-0000-0000-0000-000000000001'
+    )
+    ORDER BY random()
+    LIMIT 20
+$q$)
+UNION ALL
+SELECT * FROM time_calls('ORDER BY random(), one tag', format($q$
+    SELECT q.id
+    FROM questions AS q
+    WHERE NOT EXISTS (
+        SELECT 1 FROM user_question_progress AS uqp
+        WHERE uqp.question_id = q.id AND uqp.user_id = '00000000-0000-0000-0000-000000000001'
+    )
+    AND q.id IN (SELECT qt.question_id FROM question_tags qt WHERE qt.tag_id = %L)
+    ORDER BY random()
+    LIMIT 20
+$q$, (SELECT tag_id FROM bench_tags WHERE n = 7)))
+UNION ALL
+SELECT * FROM time_calls('sample_unseen_question_ids, no tag', $q$
+    SELECT sample_unseen_question_ids('00000000-0000-0000-0000-000000000001', 20)
+$q$)
+UNION ALL
+SELECT * FROM time_calls('sample_unseen_question_ids, one tag', format($q$
+    SELECT sample_unseen_question_ids('00000000-0000-0000-0000-000000000001', 20, %L)
+$q$, (SELECT tag_id FROM bench_tags WHERE n = 7)));
+
+RESET search_path;
+DROP SCHEMA bench_sampling CASCADE;
@@ -0,0 +1,174 @@
+"""
+Benchmark: single-process uvicorn (the previous supervisord command) against
+the multi-worker production profile in server/serve.py.
+
+Each profile is started as a subprocess on its own port and loaded with the
+same closed-loop workload: --connections concurrent keep-alive clients
+requesting the given paths for --duration seconds after a short warm-up.
+
+Run from the repository root, with the usual SUPABASE_* environment:
+    python -m server.bench.serving_compare --path / --path /quiz/tags
+
+Paths that need a signed-in user can be given a bearer token with --token.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+PROFILES = {
+    # The command supervisord used to run.
+    "baseline": [sys.executable, "-m", "uvicorn", "server.app:app", "--host", "127.0.0.1"],
+    "production": [sys.executable, "-m", "server.serve"],
+}
+
+
+def start_profile(name: str, port: int, workers: int | None) -> subprocess.Popen:
+    env = dict(os.environ, API_HOST="127.0.0.1", API_PORT=str(port))
+    if workers:
+        env["WEB_CONCURRENCY"] = str(workers)
+    command = PROFILES[name]
+    if name == "baseline":
+        command = command + ["--port", str(port)]
+    return subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def stop_profile(process: subprocess.Popen) -> None:
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=45)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout:.0f}s")
+
+
+async def run_load(
+    base_url: str,
+    paths: list[str],
+    connections: int,
+    duration: float,
+    warmup: float,
+    token: str | None,
+) -> dict:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies: list[float] = []
+    errors = 0
+    recording = False
+
+    async def client_loop(client: httpx.AsyncClient, offset: int, stop_at: float) -> None:
+        nonlocal errors
+        i = offset
+        while time.monotonic() < stop_at:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                ok = response.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            if recording:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(
+        base_url=base_url, headers=headers, limits=limits, timeout=30
+    ) as client:
+        stop_at = time.monotonic() + warmup
+        await asyncio.gather(*(client_loop(client, n, stop_at) for n in range(connections)))
+        recording = True
+        started = time.monotonic()
+        stop_at = started + duration
+        await asyncio.gather(*(client_loop(client, n, stop_at) for n in range(connections)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return float("nan")
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--path", action="append", dest="paths", help="Path to request (repeatable).")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, help="Override the production worker count.")
+    parser.add_argument("--token", help="Bearer token for authenticated paths.")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    paths = args.paths or ["/"]
+
+    results = {}
+    for offset, name in enumerate(PROFILES):
+        port = args.port + offset
+        process = start_profile(name, port, args.workers)
+        try:
+            await wait_until_ready(f"http://127.0.0.1:{port}")
+            print(f"Loading {name} on port {port}...")
+            results[name] = await run_load(
+                f"http://127.0.0.1:{port}",
+                paths,
+                args.connections,
+                args.duration,
+                args.warmup,
+                args.token,
+            )
+        finally:
+            stop_profile(process)
+
+    print(f"\n{args.connections} connections, {args.duration:.0f}s, paths: {', '.join(paths)}")
+    print(f"{'profile':<12}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(
+            f"{name:<12}{r['rps']:>10.0f}{r['mean_ms']:>10.1f}{r['p50_ms']:>10.1f}"
+            f"{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['errors']:>8}"
+        )
+    if len(results) == 2 and results["baseline"]["rps"]:
+        print(f"\nThroughput ratio: {results['production']['rps'] / results['baseline']['rps']:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
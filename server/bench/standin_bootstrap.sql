@@ -0,0 +1,44 @@
+-- =================================================================
+-- Study-loop stand-in: roles and the auth schema
+-- Recreates what a Supabase project provides before server/database.sql
+-- is applied: the PostgREST roles and a minimal auth.users table.
+--
+-- Loaded by `python -m server.bench.study_loop setup`, which refuses to
+-- run unless the database name contains "bench": the public and auth
+-- schemas are dropped and recreated.
+-- =================================================================
+
+SET client_min_messages = warning;
+
+DROP SCHEMA IF EXISTS public CASCADE;
+CREATE SCHEMA public;
+DROP SCHEMA IF EXISTS auth CASCADE;
+CREATE SCHEMA auth;
+
+-- The roles PostgREST switches to: the API's service key runs as service_role
+-- and signed-in users as authenticated, as on Supabase.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        CREATE ROLE anon NOLOGIN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN
+        CREATE ROLE authenticated NOLOGIN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+        CREATE ROLE service_role NOLOGIN BYPASSRLS;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticator') THEN
+        CREATE ROLE authenticator LOGIN NOINHERIT PASSWORD 'bench';
+    END IF;
+END;
+$$;
+
+GRANT anon, authenticated, service_role TO authenticator;
+
+-- Only the columns "user".id references; the gateway signs users in itself.
+CREATE TABLE auth.users (
+    id uuid PRIMARY KEY,
+    email text UNIQUE,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
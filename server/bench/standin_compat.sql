@@ -0,0 +1,87 @@
+-- =================================================================
+-- Study-loop stand-in: objects the API uses that server/database.sql
+-- does not define
+-- The production project has these; until they are added to
+-- database.sql, the stand-in defines equivalents so the study loop can
+-- run end to end. Applied after database.sql.
+-- =================================================================
+
+SET client_min_messages = warning;
+
+-- Profile columns read by /auth/login and /dashboard/me.
+ALTER TABLE "user"
+    ADD COLUMN IF NOT EXISTS email text,
+    ADD COLUMN IF NOT EXISTS send_email boolean NOT NULL DEFAULT TRUE,
+    ADD COLUMN IF NOT EXISTS send_notification boolean NOT NULL DEFAULT TRUE,
+    ADD COLUMN IF NOT EXISTS last_login timestamptz;
+
+-- Read by /quiz/sessions/active.
+ALTER TABLE user_quiz_sessions
+    ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+
+
+-- /quiz/sessions/{id}/answer sends p_completed; the last answer closes the session.
+CREATE OR REPLACE FUNCTION process_answer_submission(
+    p_user_id uuid,
+    p_session_id uuid,
+    p_question_id uuid,
+    p_selected_option_id uuid,
+    p_performance_rating text,
+    p_time_to_answer_ms integer,
+    p_completed boolean
+)
+RETURNS json AS $$
+DECLARE
+    v_result json;
+BEGIN
+    v_result := process_answer_submission(
+        p_user_id, p_session_id, p_question_id, p_selected_option_id,
+        p_performance_rating, p_time_to_answer_ms
+    );
+    IF p_completed THEN
+        UPDATE user_quiz_sessions
+        SET completed_at = now()
+        WHERE id = p_session_id AND user_id = p_user_id;
+    END IF;
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- /quiz/results/{id}: one TestResult object per answer, in answer order.
+CREATE OR REPLACE FUNCTION get_session_results(
+    p_session_id uuid,
+    p_user_id uuid
+)
+RETURNS SETOF json AS $$
+BEGIN
+    RETURN QUERY
+    SELECT json_build_object(
+        'questionId', q.id,
+        'questionText', q.question_text,
+        'userAnswer', COALESCE(selected.option_text, ''),
+        'correctAnswer', COALESCE(correct.option_text, ''),
+        'isCorrect', usa.is_correct,
+        'explanation', q.explanation,
+        'timeToAnswerMs', COALESCE(usa.time_to_answer_ms, 0)
+    )
+    FROM user_session_answers AS usa
+    JOIN user_quiz_sessions AS uqs ON uqs.id = usa.session_id AND uqs.user_id = p_user_id
+    JOIN questions AS q ON q.id = usa.question_id
+    LEFT JOIN options AS selected ON selected.id = usa.selected_option_id
+    LEFT JOIN LATERAL (
+        SELECT o.option_text FROM options AS o
+        WHERE o.question_id = q.id AND o.is_correct
+        LIMIT 1
+    ) AS correct ON TRUE
+    WHERE usa.session_id = p_session_id
+    ORDER BY usa.answered_at, usa.id;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- The stand-in has no row-level security; every API role may use everything.
+GRANT USAGE ON SCHEMA public TO anon, authenticated, service_role;
+GRANT ALL ON ALL TABLES IN SCHEMA public TO anon, authenticated, service_role;
+GRANT ALL ON ALL SEQUENCES IN SCHEMA public TO anon, authenticated, service_role;
+GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA public TO anon, authenticated, service_role;
@@ -0,0 +1,140 @@
+"""
+Gateway for the study-loop stand-in, playing the part of Supabase's API
+gateway in front of a local PostgREST:
+
+    /rest/v1/*          proxied to PostgREST (POSTGREST_URL)
+    /auth/v1/token      password sign-in for the seeded bench users, issuing
+                        access tokens signed with BENCH_JWT_SECRET
+
+Every bench user (bench-user-<n>@bench.example.com) signs in with
+BENCH_USER_PASSWORD; whether the user exists is left to the database, as
+the API's login reads the profile right after signing in.
+
+Started by `python -m server.bench.study_loop run`, or on its own with:
+    uvicorn server.bench.standin_gateway:app --port 54321
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+POSTGREST_URL = os.environ.get("POSTGREST_URL", "http://127.0.0.1:3000")
+BENCH_JWT_SECRET = os.environ.get(
+    "BENCH_JWT_SECRET", "bench-jwt-secret-with-at-least-32-characters"
+)
+BENCH_USER_PASSWORD = os.environ.get("BENCH_USER_PASSWORD", "bench-password")
+ACCESS_TOKEN_TTL = 3600
+
+_BENCH_EMAIL = re.compile(r"bench-user-(\d+)@bench\.example\.com")
+# Hop-by-hop and body-framing headers are recomputed on each side.
+_DROPPED_HEADERS = {"host", "connection", "content-length", "transfer-encoding", "content-encoding"}
+
+_postgrest: httpx.AsyncClient | None = None
+
+
+def bench_user_id(n: int) -> str:
+    """Matches md5('bench-user-' || n)::uuid in standin_seed.sql."""
+    return str(uuid.UUID(hashlib.md5(f"bench-user-{n}".encode()).hexdigest()))
+
+
+def sign_token(claims: dict) -> str:
+    return jwt.encode(claims, BENCH_JWT_SECRET, algorithm="HS256")
+
+
+async def token(request: Request) -> JSONResponse:
+    if request.query_params.get("grant_type") != "password":
+        return JSONResponse({"error": "unsupported_grant_type"}, status_code=400)
+    body = await request.json()
+    email = body.get("email") or ""
+    match = _BENCH_EMAIL.fullmatch(email)
+    if match is None or body.get("password") != BENCH_USER_PASSWORD:
+        return JSONResponse(
+            {"error": "invalid_grant", "error_description": "Invalid login credentials"},
+            status_code=400,
+        )
+
+    user_id = bench_user_id(int(match.group(1)))
+    now = int(time.time())
+    created_at = datetime.now(timezone.utc).isoformat()
+    access_token = sign_token(
+        {
+            "sub": user_id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email,
+            "iat": now,
+            "exp": now + ACCESS_TOKEN_TTL,
+        }
+    )
+    return JSONResponse(
+        {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "expires_in": ACCESS_TOKEN_TTL,
+            "expires_at": now + ACCESS_TOKEN_TTL,
+            "refresh_token": secrets.token_urlsafe(24),
+            "user": {
+                "id": user_id,
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": email,
+                "app_metadata": {"provider": "email"},
+                "user_metadata": {},
+                "created_at": created_at,
+                "last_sign_in_at": created_at,
+            },
+        }
+    )
+
+
+async def rest(request: Request) -> Response:
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _DROPPED_HEADERS}
+    upstream = await _postgrest.request(
+        request.method,
+        "/" + request.path_params["path"],
+        params=request.query_params.multi_items(),
+        headers=headers,
+        content=await request.body(),
+    )
+    return Response(
+        content=upstream.content,
+        status_code=upstream.status_code,
+        headers={k: v for k, v in upstream.headers.items() if k.lower() not in _DROPPED_HEADERS},
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    global _postgrest
+    _postgrest = httpx.AsyncClient(
+        base_url=POSTGREST_URL,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=200),
+        timeout=30,
+    )
+    yield
+    await _postgrest.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/auth/v1/token", token, methods=["POST"]),
+        Route(
+            "/rest/v1/{path:path}",
+            rest,
+            methods=["GET", "HEAD", "POST", "PATCH", "PUT", "DELETE"],
+        ),
+    ],
+    lifespan=lifespan,
+)
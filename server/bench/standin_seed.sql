@@ -0,0 +1,71 @@
+-- =================================================================
+-- Study-loop stand-in: synthetic question bank and users
+-- Expects psql variables questions, tags, users and history (answered
+-- questions per user), set by `python -m server.bench.study_loop setup`.
+--
+-- Ids are md5-derived so the gateway and the load driver can compute
+-- them: user n is md5('bench-user-' || n) with email
+-- bench-user-<n>@bench.example.com.
+-- =================================================================
+
+SET client_min_messages = warning;
+
+INSERT INTO tags (id, name, type)
+SELECT
+    md5('bench-tag-' || t)::uuid,
+    'Bench tag ' || t,
+    CASE WHEN t <= 10 THEN 'SPECIALTY' ELSE 'TOPIC' END
+FROM generate_series(1, :tags) AS t;
+
+-- Stems and explanations of roughly production length.
+INSERT INTO questions (id, question_text, explanation, difficulty)
+SELECT
+    md5('bench-q-' || n)::uuid,
+    'Synthetic question ' || n || ': ' || repeat('a patient presents with findings ', 8),
+    'Explanation ' || n || ': ' || repeat('the correct choice follows from the findings ', 10),
+    (ARRAY['easy', 'medium', 'hard'])[1 + n % 3]
+FROM generate_series(1, :questions) AS n;
+
+INSERT INTO options (question_id, option_text, is_correct)
+SELECT md5('bench-q-' || n)::uuid, 'Option ' || k || ' of question ' || n, k = 1 + n % 5
+FROM generate_series(1, :questions) AS n, generate_series(1, 5) AS k;
+
+INSERT INTO question_tags (question_id, tag_id)
+SELECT md5('bench-q-' || n)::uuid, md5('bench-tag-' || (1 + n % :tags))::uuid
+FROM generate_series(1, :questions) AS n;
+
+INSERT INTO auth.users (id, email)
+SELECT md5('bench-user-' || u)::uuid, 'bench-user-' || u || '@bench.example.com'
+FROM generate_series(1, :users) AS u;
+
+INSERT INTO "user" (id, username, full_name, email)
+SELECT md5('bench-user-' || u)::uuid, 'bench_user_' || u, 'Bench User ' || u, 'bench-user-' || u || '@bench.example.com'
+FROM generate_series(1, :users) AS u;
+
+-- Study history: each user has answered `history` questions, about half of them due now,
+-- with a month of daily totals so the dashboard has real work to do.
+INSERT INTO user_question_progress (
+    user_id, question_id, status, repetitions, current_interval, next_review_at, last_reviewed_at
+)
+SELECT
+    md5('bench-user-' || u)::uuid,
+    md5('bench-q-' || (1 + (u * 7919 + h * 104729) % :questions))::uuid,
+    'learning',
+    1 + h % 4,
+    1 + h % 10,
+    now() + ((h % 10) - 5) * interval '1 day',
+    now() - (1 + h % 30) * interval '1 day'
+FROM generate_series(1, :users) AS u, generate_series(1, :history) AS h
+ON CONFLICT DO NOTHING;
+
+INSERT INTO user_daily_stats (user_id, day, answers, correct, time_spent_ms, new_questions)
+SELECT
+    md5('bench-user-' || u)::uuid,
+    current_date - d,
+    20 + (u + d) % 30,
+    10 + (u + d) % 20,
+    60000 * (5 + d % 10),
+    5 + d % 10
+FROM generate_series(1, :users) AS u, generate_series(1, 30) AS d;
+
+ANALYZE;
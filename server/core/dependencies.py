@@ -8,9 +8,9 @@ from fastapi.security import (
     HTTPBearer,
     OAuth2PasswordBearer,
 )
-from jose import JWTError, jwt
+from jose import JWTError
 
-from server.core.config import settings
+from server.core.token_cache import decode_access_token
 from server.models.schemas import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -26,16 +26,6 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token.credentials,
-            settings.SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience="authenticated",
-        )
-        user_id_str = payload.get("sub")
-        if user_id_str is None:
-            raise credentials_exception
-        token_data = TokenData(id=user_id_str)
-        return token_data
-    except JWTError as e:
+        return decode_access_token(token.credentials)
+    except JWTError:
         raise credentials_exception
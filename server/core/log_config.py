@@ -0,0 +1,116 @@
+# app/core/log_config.py
+
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.environ.get(
+    "LOG_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs"),
+)
+# Set to "0" to log to stdout only (e.g. when a container runtime collects it).
+LOG_TO_FILES = os.environ.get("LOG_TO_FILES", "1") == "1"
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RESERVED_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+    "color_message",  # uvicorn's ANSI-coloured duplicate of the message
+}
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, including `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _StructuredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without flattening them: the message
+    is merged with its args and the traceback rendered here (the objects may
+    not outlive the call), while `extra` fields stay separate for the JSON
+    formatter.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> None:
+    """
+    Routes every logger through a queue to a background thread that writes JSON
+    lines to stdout and, optionally, to LOG_DIR/activity.log and error.log, so
+    no log call blocks the event loop on I/O. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if LOG_TO_FILES:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        handlers.append(
+            logging.FileHandler(os.path.join(LOG_DIR, "activity.log"), encoding="utf-8")
+        )
+        error_handler = logging.FileHandler(
+            os.path.join(LOG_DIR, "error.log"), encoding="utf-8"
+        )
+        error_handler.setLevel(logging.ERROR)
+        handlers.append(error_handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_StructuredQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # Let uvicorn's server logs flow into the same pipeline. Its access log is
+    # left as configured: RequestLoggingMiddleware already logs every request.
+    for name in ("uvicorn", "uvicorn.error"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,271 @@
+# app/core/metrics.py
+
+import asyncio
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the workers of one server; each writes its own snapshot
+# there and /metrics merges them. Unset means single-process: /metrics only
+# reports the worker that serves it.
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = tuple[str, ...]
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def series(self) -> list[list]:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._values: dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def series(self) -> list[list]:
+        with self._lock:
+            return [[list(labels), [list(counts), total]] for labels, (counts, total) in self._values.items()]
+
+
+class MetricsRegistry:
+    """
+    Per-worker metric families plus collectors that report stats kept
+    elsewhere (caches, single-flight groups) at snapshot time.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._collectors: list[Callable[[], list[dict]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str]) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], list[dict]]) -> None:
+        """
+        Adds a callable returning families in snapshot form:
+        {"name", "type", "help", "labelnames", "series": [[labels, value], ...]}.
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self) -> list[dict]:
+        families = [
+            {
+                "name": metric.name,
+                "type": metric.type,
+                "help": metric.help,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "series": metric.series(),
+            }
+            for metric in self._metrics.values()
+        ]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return families
+
+
+registry = MetricsRegistry()
+
+
+def family(name: str, type: str, help: str, labelnames: Iterable[str], series: list[list]) -> dict:
+    """A metric family in snapshot form, for collectors."""
+    return {"name": name, "type": type, "help": help, "labelnames": list(labelnames), "series": series}
+
+
+def merge_snapshots(snapshots: Iterable[list[dict]]) -> list[dict]:
+    """Sums the series of every family across worker snapshots."""
+    merged: dict[str, dict] = {}
+    for snapshot in snapshots:
+        for family in snapshot:
+            target = merged.setdefault(family["name"], {**family, "series": {}})
+            for labels, value in family["series"]:
+                key = tuple(labels)
+                current = target["series"].get(key)
+                if family["type"] == "histogram":
+                    counts, total = value
+                    if current is None:
+                        target["series"][key] = [list(counts), total]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], counts)]
+                        current[1] += total
+                else:
+                    target["series"][key] = (current or 0) + value
+    return [
+        {**family, "series": [[list(k), v] for k, v in family["series"].items()]}
+        for family in merged.values()
+    ]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Iterable[str], values: Iterable[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render(families: list[dict]) -> str:
+    """Formats families in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for family in sorted(families, key=lambda f: f["name"]):
+        name, names = family["name"], family["labelnames"]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in sorted(family["series"], key=lambda s: s[0]):
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_label_text(names, labels)} {value}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip([*family["buckets"], "+Inf"], counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_label_text(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(names, labels)} {total}")
+            lines.append(f"{name}_count{_label_text(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_path() -> str:
+    return os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+
+
+def write_snapshot() -> None:
+    """Atomically stores this worker's snapshot for the other workers to merge."""
+    path = _snapshot_path()
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(temp, path)
+
+
+def _worker_alive(path: str) -> bool:
+    """Whether the worker that wrote the snapshot at path is still running."""
+    try:
+        pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_other_snapshots() -> list[list[dict]]:
+    """
+    The snapshots of the other workers. Exited workers only contribute their
+    counters and histograms, which must stay monotonic; their gauges described
+    state that is gone and would otherwise add up across worker restarts.
+    """
+    own = _snapshot_path()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        if path == own:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _worker_alive(path):
+            snapshot = [family for family in snapshot if family["type"] != "gauge"]
+        snapshots.append(snapshot)
+    return snapshots
+
+
+async def exposition() -> str:
+    """The /metrics body: this worker live, merged with the other workers' snapshots."""
+    if not METRICS_DIR:
+        return render(registry.snapshot())
+    others = await asyncio.to_thread(_read_other_snapshots)
+    return render(merge_snapshots([registry.snapshot(), *others]))
+
+
+async def flush_loop() -> None:
+    """Writes this worker's snapshot every METRICS_FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(write_snapshot)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+
+def start_metrics_flusher() -> asyncio.Task | None:
+    if not METRICS_DIR:
+        return None
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    return asyncio.create_task(flush_loop())
+
+
+async def stop_metrics_flusher(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    # Keep the final totals so counters stay monotonic after this worker exits.
+    await asyncio.to_thread(write_snapshot)
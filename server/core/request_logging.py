@@ -0,0 +1,85 @@
+# app/core/request_logging.py
+
+import logging
+import time
+from typing import Any
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server.core.metrics import registry
+
+logger = logging.getLogger("app.access")
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by method, route template and status class.",
+    ("method", "route", "status"),
+)
+
+
+def _route_template(app: Any, scope: Scope) -> str:
+    """
+    The matched route's path template (e.g. /quiz/sessions/{session_id}), so
+    metrics are grouped per endpoint rather than per URL.
+    """
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    router = getattr(app, "router", None)
+    for candidate in getattr(router, "routes", ()):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return getattr(candidate, "path", scope["path"])
+    return "<unmatched>"
+
+
+class RequestLoggingMiddleware:
+    """
+    Times every HTTP request, records it in the per-route latency histogram
+    and logs one structured line with method, route, status and duration.
+    Written as plain ASGI so it adds no per-request task or body buffering.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            logger.exception(
+                "Unhandled error",
+                extra={"method": scope["method"], "path": scope["path"]},
+            )
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            route = _route_template(scope.get("app"), scope)
+            http_request_duration.observe(
+                (scope["method"], route, f"{status_code // 100}xx"), duration
+            )
+            logger.info(
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "route": route,
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_ms": round(duration * 1000, 2),
+                    "client": scope["client"][0] if scope.get("client") else None,
+                },
+            )
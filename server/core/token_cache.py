@@ -0,0 +1,109 @@
+# app/core/token_cache.py
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jose import JWTError, jwt
+
+from server.core.config import settings
+from server.models.schemas import TokenData
+
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", "10000"))
+# Upper bound for tokens that carry no 'exp' claim.
+TOKEN_CACHE_DEFAULT_TTL = float(os.environ.get("TOKEN_CACHE_DEFAULT_TTL", "300"))
+
+
+class TokenCache:
+    """
+    A bounded LRU of validated access tokens.
+
+    Entries are keyed on a SHA-256 digest of the raw token, so bearer tokens are
+    never held in memory as dictionary keys, and each entry expires at the
+    token's own 'exp' claim.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[TokenData, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> TokenData | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            token_data, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return token_data
+
+    def put(self, token: str, token_data: TokenData, expires_at: float) -> None:
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (token_data, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache()
+
+
+def decode_access_token(token: str) -> TokenData:
+    """
+    Validates a Supabase access token and returns its claims as TokenData.
+    Previously validated tokens are served from the cache until they expire.
+    Raises JWTError if the token is invalid or carries no subject.
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload = jwt.decode(
+        token,
+        settings.SUPABASE_JWT_SECRET,
+        algorithms=["HS256"],
+        audience="authenticated",
+    )
+    user_id_str = payload.get("sub")
+    if user_id_str is None:
+        raise JWTError("Token has no subject.")
+
+    token_data = TokenData(id=user_id_str)
+    exp = payload.get("exp")
+    expires_at = (
+        float(exp) if exp is not None else time.time() + TOKEN_CACHE_DEFAULT_TTL
+    )
+    token_cache.put(token, token_data, expires_at)
+    return token_data
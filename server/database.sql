@@ -51,6 +51,7 @@ CREATE TABLE questions (
     times_answered integer NOT NULL DEFAULT 0,
     times_correct integer NOT NULL DEFAULT 0,
     avg_time_to_answer_ms integer,
+    random_key double precision NOT NULL DEFAULT random(),
     created_at timestamptz NOT NULL DEFAULT now(),
     updated_at timestamptz
 );
@@ -59,6 +60,9 @@ COMMENT ON TABLE questions IS 'Stores the core question content and community-dr
 COMMENT ON COLUMN questions.status IS 'Manages the content lifecycle (draft, published, flagged for review).';
 COMMENT ON COLUMN questions.times_answered IS 'Powers dynamic, community-based difficulty calculation.';
 COMMENT ON COLUMN questions.avg_time_to_answer_ms IS 'Advanced metric to identify complex or poorly worded questions.';
+COMMENT ON COLUMN questions.random_key IS 'A fixed random position used to sample questions with an index seek instead of ORDER BY random().';
+
+CREATE INDEX questions_random_key_idx ON questions (random_key);
 
 
 -- Table: "options"
@@ -73,6 +77,9 @@ CREATE TABLE options (
 COMMENT ON TABLE options IS 'Stores the answer choices for each question.';
 COMMENT ON COLUMN options.question_id IS 'Ensures options are deleted if their parent question is deleted.';
 
+-- Options are always read by question (session payloads, results, answer checks).
+CREATE INDEX options_question_id_idx ON options (question_id);
+
 
 -- Table: "question_tags" (Join Table)
 -- Creates the many-to-many relationship between questions and tags.
@@ -84,6 +91,21 @@ CREATE TABLE question_tags (
 
 COMMENT ON TABLE question_tags IS 'Links questions to multiple tags (specialties, topics, etc.).';
 
+-- Supports tag-filtered lookups; the primary key only serves lookups by question.
+CREATE INDEX question_tags_tag_id_idx ON question_tags (tag_id, question_id);
+
+
+-- Table: "question_bank_stats"
+-- A single-row summary of the question bank, maintained by triggers on "questions".
+CREATE TABLE question_bank_stats (
+    id boolean PRIMARY KEY DEFAULT TRUE CHECK (id),
+    total_questions integer NOT NULL DEFAULT 0
+);
+
+COMMENT ON TABLE question_bank_stats IS 'Question bank totals, so per-user dashboards never count the questions table.';
+
+INSERT INTO question_bank_stats DEFAULT VALUES;
+
 
 -- =================================================================
 -- Module 3: User Interaction and SRS Module
@@ -149,6 +171,38 @@ COMMENT ON TABLE user_session_answers IS 'The raw data for all analytics, loggin
 COMMENT ON COLUMN user_session_answers.selected_option_id IS 'Crucial for analyzing common mistakes and distractors.';
 COMMENT ON COLUMN user_session_answers.time_to_answer_ms IS 'Advanced metric to differentiate hesitation from mastery.';
 
+-- Serves the per-session reads of /resume and /results.
+CREATE INDEX user_session_answers_session_id_idx ON user_session_answers (session_id, question_id);
+
+
+-- Table: "user_daily_stats"
+-- A per-user, per-day rollup of answers, maintained incrementally by the answer submission functions.
+CREATE TABLE user_daily_stats (
+    user_id uuid NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    day date NOT NULL,
+    answers integer NOT NULL DEFAULT 0,
+    correct integer NOT NULL DEFAULT 0,
+    time_spent_ms bigint NOT NULL DEFAULT 0,
+    new_questions integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+COMMENT ON TABLE user_daily_stats IS 'Daily answer totals per user, so dashboard statistics never scan raw answers.';
+COMMENT ON COLUMN user_daily_stats.new_questions IS 'Questions answered for the first time that day, i.e. new progress records.';
+
+
+-- Table: "question_stats_log"
+-- An append-only queue of answers whose statistics have not yet been applied to "questions".
+CREATE TABLE question_stats_log (
+    id bigserial PRIMARY KEY,
+    question_id uuid NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    is_correct boolean NOT NULL,
+    time_to_answer_ms integer,
+    logged_at timestamptz NOT NULL DEFAULT now()
+);
+
+COMMENT ON TABLE question_stats_log IS 'Pending per-answer statistics, drained in bulk by fold_question_stats().';
+
 
 -- =================================================================
 -- Module 4: Gamification and Community Module
@@ -198,52 +252,184 @@ COMMENT ON COLUMN content_reports.status IS 'For admin workflow to track and res
 
 
 
--- This function fetches new questions for a user, with an optional filter by tag (e.g., specialty).
--- It returns a set of JSON objects, each representing a full question with its options.
-CREATE OR REPLACE FUNCTION get_new_questions_for_user(
+-- This function samples up to p_limit questions the user has never seen, optionally within a tag.
+-- Instead of shuffling the whole table with ORDER BY random(), it seeks to a random point in the
+-- questions_random_key_idx index and walks forward, wrapping around to the start if needed, so the
+-- cost is proportional to the rows visited rather than the size of the question bank.
+-- Periodically running UPDATE questions SET random_key = random() reshuffles the neighbourhoods.
+CREATE OR REPLACE FUNCTION sample_unseen_question_ids(
     p_user_id uuid,
     p_limit integer,
-    p_tag_id uuid DEFAULT NULL -- This parameter is optional. If NULL, questions are pulled from any tag.
+    p_tag_id uuid DEFAULT NULL
 )
-RETURNS SETOF json AS $$
+RETURNS SETOF uuid AS $$
+DECLARE
+    v_pivot double precision := random();
+    v_found integer;
 BEGIN
-    -- This query uses a conditional WHERE clause to handle both cases efficiently.
     RETURN QUERY
-    SELECT
-        -- Constructs the main JSON object for each question.
-        json_build_object(
-            'id', q.id,
-            'question_text', q.question_text,
-            -- This subquery builds the nested array of options for each question.
-            'options', (
-                SELECT json_agg(
-                    json_build_object(
-                        'id', o.id,
-                        'option_text', o.option_text
-                        -- Note: 'is_correct' is intentionally omitted here to encourage
-                        -- active recall on the frontend. The correct answer is revealed later.
-                    )
-                )
-                FROM options AS o
-                WHERE o.question_id = q.id
-            )
-        )
-    FROM
-        questions AS q
-    WHERE
-        -- This is the crucial part: Filter out questions the user has already seen.
-        NOT EXISTS (
+    SELECT q.id
+    FROM questions AS q
+    WHERE q.random_key >= v_pivot
+    AND NOT EXISTS (
+        SELECT 1
+        FROM user_question_progress AS uqp
+        WHERE uqp.question_id = q.id AND uqp.user_id = p_user_id
+    )
+    AND (
+        p_tag_id IS NULL
+        OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = q.id AND qt.tag_id = p_tag_id)
+    )
+    ORDER BY q.random_key
+    LIMIT p_limit;
+
+    GET DIAGNOSTICS v_found = ROW_COUNT;
+
+    -- Wrap around: take the remainder from the start of the key range.
+    IF v_found < p_limit THEN
+        RETURN QUERY
+        SELECT q.id
+        FROM questions AS q
+        WHERE q.random_key < v_pivot
+        AND NOT EXISTS (
             SELECT 1
             FROM user_question_progress AS uqp
             WHERE uqp.question_id = q.id AND uqp.user_id = p_user_id
         )
-    AND
-        -- This conditional clause applies the tag filter only if p_tag_id is provided.
-        (p_tag_id IS NULL OR q.id IN (SELECT qt.question_id FROM question_tags qt WHERE qt.tag_id = p_tag_id))
-    ORDER BY
-        random() -- Shuffle the results to provide variety.
-    LIMIT
-        p_limit; -- Only return the number of questions requested.
+        AND (
+            p_tag_id IS NULL
+            OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = q.id AND qt.tag_id = p_tag_id)
+        )
+        ORDER BY q.random_key
+        LIMIT p_limit - v_found;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function creates a new-learning session of up to p_limit questions the user has never
+-- seen, with an optional filter by tag (e.g., specialty), and returns the session's id.
+-- It returns NULL, without creating a session, when there are no unseen questions left.
+-- Earlier revisions of this file returned the questions as JSON instead; the API has always
+-- used it as a session creator, so the old shape is dropped rather than replaced in place.
+DROP FUNCTION IF EXISTS get_new_questions_for_user(uuid, integer, uuid);
+CREATE OR REPLACE FUNCTION get_new_questions_for_user(
+    p_user_id uuid,
+    p_limit integer,
+    p_tag_id uuid DEFAULT NULL -- This parameter is optional. If NULL, questions are pulled from any tag.
+)
+RETURNS uuid AS $$
+DECLARE
+    v_question_ids uuid[];
+    v_session_id uuid;
+BEGIN
+    -- The sampler already filters out seen questions and applies the tag filter.
+    v_question_ids := ARRAY(SELECT sample_unseen_question_ids(p_user_id, p_limit, p_tag_id));
+
+    IF cardinality(v_question_ids) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO user_quiz_sessions (user_id, session_type)
+    VALUES (p_user_id, 'new_learning')
+    RETURNING id INTO v_session_id;
+
+    INSERT INTO session_question (session_id, question_id)
+    SELECT v_session_id, question_id FROM unnest(v_question_ids) AS question_id;
+
+    RETURN v_session_id;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function creates a review session of up to p_limit questions due for the user, most
+-- overdue first, with an optional filter by tag, and returns the session's id.
+-- It returns NULL, without creating a session, when nothing is due.
+CREATE OR REPLACE FUNCTION get_due_review_questions_for_user(
+    p_user_id uuid,
+    p_limit integer,
+    p_tag_id uuid DEFAULT NULL
+)
+RETURNS uuid AS $$
+DECLARE
+    v_question_ids uuid[];
+    v_session_id uuid;
+BEGIN
+    v_question_ids := ARRAY(
+        SELECT uqp.question_id
+        FROM user_question_progress AS uqp
+        WHERE uqp.user_id = p_user_id
+        AND uqp.next_review_at <= now()
+        AND (
+            p_tag_id IS NULL
+            OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = uqp.question_id AND qt.tag_id = p_tag_id)
+        )
+        ORDER BY uqp.next_review_at
+        LIMIT p_limit
+    );
+
+    IF cardinality(v_question_ids) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO user_quiz_sessions (user_id, session_type)
+    VALUES (p_user_id, 'review')
+    RETURNING id INTO v_session_id;
+
+    INSERT INTO session_question (session_id, question_id)
+    SELECT v_session_id, question_id FROM unnest(v_question_ids) AS question_id;
+
+    RETURN v_session_id;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function creates a mixed session and returns its id: up to half of it from the user's
+-- due reviews, most overdue first, and the rest from unseen questions. When there are not
+-- enough unseen questions, more due reviews fill the remaining places.
+-- It returns NULL, without creating a session, when there is nothing to study.
+CREATE OR REPLACE FUNCTION create_smart_session_for_user(
+    p_user_id uuid,
+    p_limit integer,
+    p_tag_id uuid DEFAULT NULL
+)
+RETURNS uuid AS $$
+DECLARE
+    v_due_ids uuid[];
+    v_new_ids uuid[];
+    v_session_id uuid;
+BEGIN
+    v_due_ids := ARRAY(
+        SELECT uqp.question_id
+        FROM user_question_progress AS uqp
+        WHERE uqp.user_id = p_user_id
+        AND uqp.next_review_at <= now()
+        AND (
+            p_tag_id IS NULL
+            OR EXISTS (SELECT 1 FROM question_tags AS qt WHERE qt.question_id = uqp.question_id AND qt.tag_id = p_tag_id)
+        )
+        ORDER BY uqp.next_review_at
+        LIMIT p_limit
+    );
+    v_new_ids := ARRAY(
+        SELECT sample_unseen_question_ids(
+            p_user_id, p_limit - LEAST(cardinality(v_due_ids), p_limit / 2), p_tag_id
+        )
+    );
+    v_due_ids := v_due_ids[1:p_limit - cardinality(v_new_ids)];
+
+    IF cardinality(v_due_ids) + cardinality(v_new_ids) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO user_quiz_sessions (user_id, session_type)
+    VALUES (p_user_id, 'custom_practice')
+    RETURNING id INTO v_session_id;
+
+    INSERT INTO session_question (session_id, question_id)
+    SELECT v_session_id, question_id FROM unnest(v_due_ids || v_new_ids) AS question_id;
+
+    RETURN v_session_id;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -296,7 +482,7 @@ $$ LANGUAGE plpgsql;
 
 
 -- This function processes a user's answer submission in a single atomic transaction.
--- It now includes logic to dynamically update the question's difficulty based on community performance.
+-- Community statistics and difficulty are applied asynchronously by fold_question_stats().
 CREATE OR REPLACE FUNCTION process_answer_submission(
     p_user_id uuid,
     p_session_id uuid,
@@ -323,6 +509,9 @@ DECLARE
 
     -- A variable to hold the entire updated progress record.
     v_updated_progress_record user_question_progress;
+
+    -- Whether this is the user's first answer to the question.
+    v_is_new_question boolean := FALSE;
 BEGIN
     -- Step 1: Determine if the selected answer was correct.
     SELECT o.is_correct INTO v_is_correct
@@ -333,34 +522,15 @@ BEGIN
     INSERT INTO user_session_answers (session_id, question_id, selected_option_id, is_correct, time_to_answer_ms, answered_at)
     VALUES (p_session_id, p_question_id, p_selected_option_id, v_is_correct, p_time_to_answer_ms, now());
 
-    -- Step 3: Update the global statistics and difficulty for the question.
-    UPDATE questions
-    SET
-        -- Update the running average for time to answer.
-        avg_time_to_answer_ms = CASE
-            WHEN avg_time_to_answer_ms IS NULL THEN p_time_to_answer_ms
-            ELSE ((avg_time_to_answer_ms * (times_answered)) + p_time_to_answer_ms) / (times_answered + 1)
-        END,
-
-        times_answered = times_answered + 1,
-        times_correct = times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END),
-        
-        -- ** NEW LOGIC: Dynamically update the difficulty **
-        difficulty = CASE
-            -- Only start adjusting difficulty after 20 answers to ensure statistical significance.
-            WHEN (times_answered + 1) < 20 THEN difficulty -- Keep the current difficulty
-            
-            -- If the new correct ratio is high (>= 85%), the question is 'easy'.
-            WHEN (times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END))::numeric / (times_answered + 1) >= 0.85 THEN 'easy'
-            
-            -- If the new correct ratio is low (<= 50%), the question is 'hard'.
-            WHEN (times_correct + (CASE WHEN v_is_correct THEN 1 ELSE 0 END))::numeric / (times_answered + 1) <= 0.50 THEN 'hard'
-            
-            -- Otherwise, it's 'medium'.
-            ELSE 'medium'
-        END
-    WHERE id = p_question_id
-    RETURNING explanation INTO v_explanation; -- Also retrieve the explanation for the final response.
+    -- Step 3: Record the answer in the question statistics log.
+    -- This is an append-only insert, so concurrent answers to a popular question never
+    -- wait on its row lock; fold_question_stats() applies the log to "questions" in bulk.
+    INSERT INTO question_stats_log (question_id, is_correct, time_to_answer_ms)
+    VALUES (p_question_id, v_is_correct, p_time_to_answer_ms);
+
+    SELECT q.explanation INTO v_explanation
+    FROM questions AS q
+    WHERE q.id = p_question_id;
 
     -- Step 4: Fetch the user's current SRS progress for this question.
     SELECT repetitions, ease_factor, current_interval
@@ -373,6 +543,7 @@ BEGIN
         v_current_repetitions := 0;
         v_current_ease_factor := 2.5;
         v_current_interval := 0;
+        v_is_new_question := TRUE;
     END IF;
 
     -- Step 5: Calculate new SRS values based on the user's performance rating (SM-2 logic).
@@ -417,6 +588,19 @@ BEGIN
         status = 'learning'
     RETURNING * INTO v_updated_progress_record;
 
+    -- Roll the answer into the user's daily statistics for the dashboard.
+    INSERT INTO user_daily_stats (user_id, day, answers, correct, time_spent_ms, new_questions)
+    VALUES (
+        p_user_id, current_date, 1, (CASE WHEN v_is_correct THEN 1 ELSE 0 END),
+        COALESCE(p_time_to_answer_ms, 0), (CASE WHEN v_is_new_question THEN 1 ELSE 0 END)
+    )
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET
+        answers = user_daily_stats.answers + EXCLUDED.answers,
+        correct = user_daily_stats.correct + EXCLUDED.correct,
+        time_spent_ms = user_daily_stats.time_spent_ms + EXCLUDED.time_spent_ms,
+        new_questions = user_daily_stats.new_questions + EXCLUDED.new_questions;
+
     -- Step 7: Fetch the actual correct option ID to return to the frontend.
     SELECT o.id INTO v_correct_option_id
     FROM options AS o
@@ -436,7 +620,8 @@ $$ LANGUAGE plpgsql;
 
 
 -- This function finds all questions in a given session that the user has not yet answered.
--- It returns a set of full JSON objects for each unanswered question.
+-- It returns a set of full JSON objects for each unanswered question, typed 'review' when the
+-- user already has progress on it and 'new' otherwise.
 CREATE OR REPLACE FUNCTION get_unanswered_questions_for_session(
     p_session_id uuid,
     p_user_id uuid
@@ -449,6 +634,7 @@ BEGIN
         json_build_object(
             'id', q.id,
             'question_text', q.question_text,
+            'type', CASE WHEN uqp.question_id IS NULL THEN 'new' ELSE 'review' END,
             -- This subquery builds the nested array of options for each question.
             'options', (
                 SELECT json_agg(
@@ -466,6 +652,8 @@ BEGIN
     -- Find questions that are part of the specified session.
     JOIN
         session_question AS sq ON q.id = sq.question_id
+    LEFT JOIN
+        user_question_progress AS uqp ON uqp.user_id = p_user_id AND uqp.question_id = q.id
     WHERE
         sq.session_id = p_session_id
     AND
@@ -479,4 +667,493 @@ BEGIN
                 usa.question_id = q.id
         );
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- This function creates a quiz session through the matching session RPC and returns it
+-- together with its hydrated questions, so the first question can be rendered without a
+-- follow-up call to get_unanswered_questions_for_session.
+CREATE OR REPLACE FUNCTION create_session_with_questions(
+    p_session_kind text, -- 'new', 'review' or 'mixed'
+    p_user_id uuid,
+    p_limit integer,
+    p_tag_id uuid DEFAULT NULL
+)
+RETURNS json AS $$
+DECLARE
+    v_session_id uuid;
+BEGIN
+    IF p_session_kind = 'new' THEN
+        v_session_id := get_new_questions_for_user(p_user_id => p_user_id, p_limit => p_limit, p_tag_id => p_tag_id);
+    ELSIF p_session_kind = 'review' THEN
+        v_session_id := get_due_review_questions_for_user(p_user_id => p_user_id, p_limit => p_limit, p_tag_id => p_tag_id);
+    ELSIF p_session_kind = 'mixed' THEN
+        v_session_id := create_smart_session_for_user(p_user_id => p_user_id, p_limit => p_limit, p_tag_id => p_tag_id);
+    ELSE
+        RAISE EXCEPTION 'Unknown session kind: %', p_session_kind;
+    END IF;
+
+    -- No eligible questions: no session was created.
+    IF v_session_id IS NULL THEN
+        RETURN json_build_object('session_id', NULL, 'questions', '[]'::json);
+    END IF;
+
+    RETURN json_build_object(
+        'session_id', v_session_id,
+        'questions', COALESCE(
+            (SELECT json_agg(q) FROM get_unanswered_questions_for_session(v_session_id, p_user_id) AS q),
+            '[]'::json
+        )
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function applies a whole batch of answers (e.g. a submitted test) in one transaction.
+-- Every step is set-based: answers are graded and logged together, question statistics are
+-- updated once per distinct question, and SRS progress is upserted in a single statement.
+-- It returns a JSON array of per-answer feedback in submission order.
+CREATE OR REPLACE FUNCTION process_answer_submissions_batch(
+    p_user_id uuid,
+    p_session_id uuid,
+    p_answers jsonb, -- [{question_id, selected_option_id, performance_rating, time_to_answer_ms}, ...]
+    p_completed boolean DEFAULT FALSE
+)
+RETURNS json AS $$
+DECLARE
+    v_result json;
+BEGIN
+    -- Step 1: Only the owner of the session may submit answers to it.
+    IF NOT EXISTS (
+        SELECT 1 FROM user_quiz_sessions WHERE id = p_session_id AND user_id = p_user_id
+    ) THEN
+        RAISE EXCEPTION 'Session not found or access denied.';
+    END IF;
+
+    WITH answers AS (
+        SELECT
+            e.ord,
+            (e.value->>'question_id')::uuid AS question_id,
+            (e.value->>'selected_option_id')::uuid AS selected_option_id,
+            e.value->>'performance_rating' AS performance_rating,
+            (e.value->>'time_to_answer_ms')::integer AS time_to_answer_ms
+        FROM jsonb_array_elements(p_answers) WITH ORDINALITY AS e(value, ord)
+    ),
+    -- Step 2: Grade every answer against its selected option.
+    graded AS (
+        SELECT a.*, COALESCE(o.is_correct, FALSE) AS is_correct
+        FROM answers AS a
+        LEFT JOIN options AS o ON o.id = a.selected_option_id AND o.question_id = a.question_id
+    ),
+    -- Step 3: Log all answers for this session.
+    logged AS (
+        INSERT INTO user_session_answers (session_id, question_id, selected_option_id, is_correct, time_to_answer_ms, answered_at)
+        SELECT p_session_id, g.question_id, g.selected_option_id, g.is_correct, g.time_to_answer_ms, now()
+        FROM graded AS g
+    ),
+    -- Step 4: Append to the question statistics log; fold_question_stats() applies it later.
+    stats AS (
+        INSERT INTO question_stats_log (question_id, is_correct, time_to_answer_ms)
+        SELECT g.question_id, g.is_correct, g.time_to_answer_ms
+        FROM graded AS g
+    ),
+    -- Step 5: The last rating given for a question in the batch drives its schedule (SM-2 logic).
+    latest AS (
+        SELECT DISTINCT ON (question_id) question_id, performance_rating
+        FROM graded
+        ORDER BY question_id, ord DESC
+    ),
+    scheduled AS (
+        SELECT
+            l.question_id,
+            CASE
+                WHEN l.performance_rating = 'forgot' THEN 0
+                ELSE COALESCE(p.repetitions, 0) + 1
+            END AS repetitions,
+            CASE
+                WHEN l.performance_rating = 'forgot' THEN 1
+                WHEN COALESCE(p.repetitions, 0) + 1 = 1 THEN 1
+                WHEN COALESCE(p.repetitions, 0) + 1 = 2 THEN 6
+                ELSE round(COALESCE(p.current_interval, 0) * COALESCE(p.ease_factor, 2.5))::integer
+            END AS current_interval,
+            CASE
+                WHEN l.performance_rating = 'forgot' THEN GREATEST(1.3, COALESCE(p.ease_factor, 2.5) - 0.2)
+                WHEN l.performance_rating = 'easy' THEN COALESCE(p.ease_factor, 2.5) + 0.15
+                ELSE COALESCE(p.ease_factor, 2.5)
+            END AS ease_factor,
+            p.question_id IS NULL AS is_new_question
+        FROM latest AS l
+        LEFT JOIN user_question_progress AS p
+            ON p.user_id = p_user_id AND p.question_id = l.question_id
+    ),
+    -- Step 6: "Upsert" all progress records in one statement.
+    progress AS (
+        INSERT INTO user_question_progress (
+            user_id, question_id, repetitions, ease_factor, current_interval, next_review_at, last_reviewed_at, status
+        )
+        SELECT
+            p_user_id, s.question_id, s.repetitions, s.ease_factor, s.current_interval,
+            now() + (s.current_interval * interval '1 day'), now(), 'learning'
+        FROM scheduled AS s
+        ON CONFLICT (user_id, question_id) DO UPDATE
+        SET
+            repetitions = EXCLUDED.repetitions,
+            ease_factor = EXCLUDED.ease_factor,
+            current_interval = EXCLUDED.current_interval,
+            next_review_at = EXCLUDED.next_review_at,
+            last_reviewed_at = EXCLUDED.last_reviewed_at,
+            status = 'learning'
+    ),
+    -- Roll the whole batch into the user's daily statistics for the dashboard.
+    daily AS (
+        INSERT INTO user_daily_stats (user_id, day, answers, correct, time_spent_ms, new_questions)
+        SELECT
+            p_user_id,
+            current_date,
+            (SELECT count(*) FROM graded),
+            (SELECT count(*) FROM graded WHERE is_correct),
+            (SELECT COALESCE(sum(time_to_answer_ms), 0) FROM graded),
+            (SELECT count(*) FROM scheduled WHERE is_new_question)
+        ON CONFLICT (user_id, day) DO UPDATE
+        SET
+            answers = user_daily_stats.answers + EXCLUDED.answers,
+            correct = user_daily_stats.correct + EXCLUDED.correct,
+            time_spent_ms = user_daily_stats.time_spent_ms + EXCLUDED.time_spent_ms,
+            new_questions = user_daily_stats.new_questions + EXCLUDED.new_questions
+    )
+    -- Step 7: Build the per-answer feedback in submission order.
+    SELECT json_agg(
+        json_build_object(
+            'question_id', g.question_id,
+            'is_correct', g.is_correct,
+            'correct_option_id', c.id,
+            'explanation', q.explanation
+        )
+        ORDER BY g.ord
+    )
+    INTO v_result
+    FROM graded AS g
+    JOIN questions AS q ON q.id = g.question_id
+    LEFT JOIN LATERAL (
+        SELECT o.id FROM options AS o
+        WHERE o.question_id = g.question_id AND o.is_correct = TRUE
+        LIMIT 1
+    ) AS c ON TRUE;
+
+    -- Step 8: Close the session if this batch finishes it.
+    IF p_completed THEN
+        UPDATE user_quiz_sessions
+        SET completed_at = now()
+        WHERE id = p_session_id AND completed_at IS NULL;
+    END IF;
+
+    RETURN COALESCE(v_result, '[]'::json);
+END;
+$$ LANGUAGE plpgsql;
+
+
+
+-- This function drains the question statistics log and folds it into "questions" in bulk.
+-- Consuming the log with DELETE ... RETURNING means every committed row is applied exactly
+-- once, even when answers keep arriving while it runs. Difficulty is recomputed with the
+-- same thresholds process_answer_submission used to apply per answer.
+-- It returns the number of questions updated. Schedule it with pg_cron, e.g.
+--   SELECT cron.schedule('fold-question-stats', '* * * * *', 'SELECT fold_question_stats()');
+-- or run server/jobs/question_stats.py.
+CREATE OR REPLACE FUNCTION fold_question_stats()
+RETURNS integer AS $$
+DECLARE
+    v_updated integer;
+BEGIN
+    WITH consumed AS (
+        DELETE FROM question_stats_log
+        RETURNING question_id, is_correct, time_to_answer_ms
+    ),
+    totals AS (
+        SELECT
+            question_id,
+            count(*) AS n,
+            count(*) FILTER (WHERE is_correct) AS n_correct,
+            count(time_to_answer_ms) AS n_timed,
+            sum(time_to_answer_ms) AS total_time
+        FROM consumed
+        GROUP BY question_id
+    ),
+    updated AS (
+        UPDATE questions AS q
+        SET
+            -- Update the running average for time to answer.
+            avg_time_to_answer_ms = CASE
+                WHEN t.n_timed = 0 THEN q.avg_time_to_answer_ms
+                WHEN q.avg_time_to_answer_ms IS NULL THEN t.total_time / t.n_timed
+                ELSE ((q.avg_time_to_answer_ms::bigint * q.times_answered) + t.total_time) / (q.times_answered + t.n_timed)
+            END,
+            times_answered = q.times_answered + t.n,
+            times_correct = q.times_correct + t.n_correct,
+            difficulty = CASE
+                -- Only start adjusting difficulty after 20 answers to ensure statistical significance.
+                WHEN (q.times_answered + t.n) < 20 THEN q.difficulty
+                WHEN (q.times_correct + t.n_correct)::numeric / (q.times_answered + t.n) >= 0.85 THEN 'easy'
+                WHEN (q.times_correct + t.n_correct)::numeric / (q.times_answered + t.n) <= 0.50 THEN 'hard'
+                ELSE 'medium'
+            END,
+            updated_at = now()
+        FROM totals AS t
+        WHERE q.id = t.question_id
+        RETURNING q.id
+    )
+    SELECT count(*) INTO v_updated FROM updated;
+
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This trigger function keeps question_bank_stats.total_questions equal to the number of rows in
+-- "questions". It runs once per statement, so a multi-row upload updates the counter once.
+CREATE OR REPLACE FUNCTION maintain_question_bank_stats()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE question_bank_stats SET total_questions = total_questions + (SELECT count(*) FROM inserted_questions);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE question_bank_stats SET total_questions = total_questions - (SELECT count(*) FROM deleted_questions);
+    ELSE -- TRUNCATE
+        UPDATE question_bank_stats SET total_questions = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER questions_count_inserts
+AFTER INSERT ON questions
+REFERENCING NEW TABLE AS inserted_questions
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_question_bank_stats();
+
+CREATE TRIGGER questions_count_deletes
+AFTER DELETE ON questions
+REFERENCING OLD TABLE AS deleted_questions
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_question_bank_stats();
+
+CREATE TRIGGER questions_count_truncates
+AFTER TRUNCATE ON questions
+FOR EACH STATEMENT EXECUTE FUNCTION maintain_question_bank_stats();
+
+-- Backfill the counter for questions that existed before the triggers.
+UPDATE question_bank_stats SET total_questions = (SELECT count(*) FROM questions);
+
+
+-- This function returns the dashboard summary counts for a user in one call.
+-- Due and graduated counts come from a single pass over the user's progress rows, and the
+-- new-question count is the question bank total from question_bank_stats minus the questions
+-- the user has a progress record for.
+CREATE OR REPLACE FUNCTION get_user_dashboard_summary(
+    p_user_id uuid
+)
+RETURNS json AS $$
+DECLARE
+    v_due integer;
+    v_graduated integer;
+    v_seen integer;
+    v_total integer;
+BEGIN
+    SELECT
+        count(*) FILTER (WHERE uqp.next_review_at <= now()),
+        count(*) FILTER (WHERE uqp.status = 'graduated'),
+        count(*)
+    INTO v_due, v_graduated, v_seen
+    FROM user_question_progress AS uqp
+    WHERE uqp.user_id = p_user_id;
+
+    SELECT total_questions INTO v_total FROM question_bank_stats;
+
+    RETURN json_build_object(
+        'due_for_review_count', v_due,
+        'new_questions_count', GREATEST(v_total - v_seen, 0),
+        'graduated_questions_count', v_graduated
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function returns the reviews falling due on each of the next p_days days (UTC), one
+-- {date, due} object per day including days with none; overdue reviews are counted today.
+-- The counting happens here so the dashboard reads p_days rows instead of every progress row.
+CREATE OR REPLACE FUNCTION get_review_forecast(
+    p_user_id uuid,
+    p_days integer
+)
+RETURNS SETOF json AS $$
+DECLARE
+    v_today date := (now() AT TIME ZONE 'UTC')::date;
+BEGIN
+    RETURN QUERY
+    SELECT json_build_object(
+        'date', to_char(d.day, 'YYYY-MM-DD'),
+        'due', COALESCE(c.due, 0)
+    )
+    FROM generate_series(v_today, v_today + p_days - 1, interval '1 day') AS d(day)
+    LEFT JOIN (
+        SELECT
+            GREATEST((uqp.next_review_at AT TIME ZONE 'UTC')::date, v_today) AS day,
+            count(*) AS due
+        FROM user_question_progress AS uqp
+        WHERE uqp.user_id = p_user_id
+        AND uqp.next_review_at < (v_today + p_days)::timestamp AT TIME ZONE 'UTC'
+        GROUP BY 1
+    ) AS c ON c.day = d.day::date
+    ORDER BY d.day;
+END;
+$$ LANGUAGE plpgsql;
+
+
+
+-- This function rebuilds the daily statistics rollup from the raw answer log.
+-- Use it once to backfill existing history, or to repair a single user's rollup.
+CREATE OR REPLACE FUNCTION rebuild_user_daily_stats(
+    p_user_id uuid DEFAULT NULL -- Optional: rebuild a single user instead of everyone.
+)
+RETURNS void AS $$
+BEGIN
+    DELETE FROM user_daily_stats
+    WHERE p_user_id IS NULL OR user_id = p_user_id;
+
+    INSERT INTO user_daily_stats (user_id, day, answers, correct, time_spent_ms, new_questions)
+    SELECT
+        a.user_id,
+        a.day,
+        count(*),
+        count(*) FILTER (WHERE a.is_correct),
+        COALESCE(sum(a.time_to_answer_ms), 0),
+        count(*) FILTER (WHERE a.is_first_answer)
+    FROM (
+        SELECT
+            uqs.user_id,
+            usa.answered_at::date AS day,
+            usa.is_correct,
+            usa.time_to_answer_ms,
+            row_number() OVER (
+                PARTITION BY uqs.user_id, usa.question_id ORDER BY usa.answered_at, usa.id
+            ) = 1 AS is_first_answer
+        FROM user_session_answers AS usa
+        JOIN user_quiz_sessions AS uqs ON uqs.id = usa.session_id
+        WHERE p_user_id IS NULL OR uqs.user_id = p_user_id
+    ) AS a
+    GROUP BY a.user_id, a.day;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- This function returns the dashboard statistics for a user.
+-- It reads only the user_daily_stats rollup and the question_bank_stats total, so its cost depends
+-- on the number of days the user has studied rather than the number of answers they have given
+-- or the size of the question bank.
+CREATE OR REPLACE FUNCTION get_user_dashboard_stats(
+    p_user_id uuid
+)
+RETURNS json AS $$
+DECLARE
+    v_total_questions integer;
+    v_seen bigint;
+    v_seen_this_week bigint;
+    v_answers bigint;
+    v_correct bigint;
+    v_answers_before_week bigint;
+    v_correct_before_week bigint;
+    v_answers_today bigint;
+    v_last_day date;
+    v_streak integer := 0;
+    v_accuracy numeric;
+    v_accuracy_before_week numeric;
+    v_weekly_progress json;
+    v_weekly_accuracy json;
+BEGIN
+    SELECT total_questions INTO v_total_questions FROM question_bank_stats;
+
+    -- Step 1: Lifetime, this-week and today totals in one pass over the rollup.
+    SELECT
+        COALESCE(sum(new_questions), 0),
+        COALESCE(sum(new_questions) FILTER (WHERE day > current_date - 7), 0),
+        COALESCE(sum(answers), 0),
+        COALESCE(sum(correct), 0),
+        COALESCE(sum(answers) FILTER (WHERE day <= current_date - 7), 0),
+        COALESCE(sum(correct) FILTER (WHERE day <= current_date - 7), 0),
+        COALESCE(sum(answers) FILTER (WHERE day = current_date), 0),
+        max(day) FILTER (WHERE answers > 0)
+    INTO
+        v_seen, v_seen_this_week, v_answers, v_correct,
+        v_answers_before_week, v_correct_before_week, v_answers_today, v_last_day
+    FROM user_daily_stats
+    WHERE user_id = p_user_id;
+
+    v_accuracy := CASE WHEN v_answers = 0 THEN 0 ELSE 100.0 * v_correct / v_answers END;
+    v_accuracy_before_week := CASE
+        WHEN v_answers_before_week = 0 THEN v_accuracy
+        ELSE 100.0 * v_correct_before_week / v_answers_before_week
+    END;
+
+    -- Step 2: The streak is the run of consecutive study days ending today or yesterday.
+    IF v_last_day >= current_date - 1 THEN
+        SELECT count(*) INTO v_streak
+        FROM (
+            SELECT day, row_number() OVER (ORDER BY day DESC) AS rn
+            FROM user_daily_stats
+            WHERE user_id = p_user_id AND answers > 0 AND day <= v_last_day
+        ) AS d
+        WHERE d.day = v_last_day - (d.rn - 1)::integer;
+    END IF;
+
+    -- Step 3: Correct and incorrect answers for each of the last 7 days.
+    SELECT json_agg(
+        json_build_object(
+            'day', to_char(d.day, 'Dy'),
+            'correct', COALESCE(uds.correct, 0),
+            'incorrect', COALESCE(uds.answers - uds.correct, 0)
+        )
+        ORDER BY d.day
+    )
+    INTO v_weekly_progress
+    FROM generate_series(current_date - 6, current_date, interval '1 day') AS d(day)
+    LEFT JOIN user_daily_stats AS uds ON uds.user_id = p_user_id AND uds.day = d.day::date;
+
+    -- Step 4: Accuracy for each of the last 8 weeks, labelled by the week's first day.
+    SELECT json_agg(
+        json_build_object(
+            'date', w.week::date,
+            'accuracy', CASE WHEN w.answers = 0 THEN 0 ELSE round(100.0 * w.correct / w.answers, 2) END
+        )
+        ORDER BY w.week
+    )
+    INTO v_weekly_accuracy
+    FROM (
+        SELECT
+            weeks.week,
+            COALESCE(sum(uds.answers), 0) AS answers,
+            COALESCE(sum(uds.correct), 0) AS correct
+        FROM generate_series(
+            date_trunc('week', current_date) - interval '7 weeks',
+            date_trunc('week', current_date),
+            interval '1 week'
+        ) AS weeks(week)
+        LEFT JOIN user_daily_stats AS uds
+            ON uds.user_id = p_user_id
+            AND uds.day >= weeks.week::date
+            AND uds.day < (weeks.week + interval '1 week')::date
+        GROUP BY weeks.week
+    ) AS w;
+
+    RETURN json_build_object(
+        'overallProgress', json_build_object(
+            'value', CASE WHEN v_total_questions = 0 THEN 0 ELSE round(100.0 * v_seen / v_total_questions, 2) END,
+            'change', CASE WHEN v_total_questions = 0 THEN 0 ELSE round(100.0 * v_seen_this_week / v_total_questions, 2) END
+        ),
+        'questionsAnswered', json_build_object('value', v_answers, 'change', v_answers_today),
+        'accuracyRate', json_build_object(
+            'value', round(v_accuracy, 2),
+            'change', round(v_accuracy - v_accuracy_before_week, 2)
+        ),
+        'studyStreak', json_build_object('value', v_streak, 'change', v_streak),
+        'weeklyProgress', v_weekly_progress,
+        'weeklyAccuracy', v_weekly_accuracy
+    );
+END;
+$$ LANGUAGE plpgsql;
@@ -1,20 +1,118 @@
+import asyncio
+import logging
 import os
-from supabase import AsyncClient, acreate_client
+
+import httpx
 from dotenv import load_dotenv
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+from server.db.instrumentation import InstrumentedTransport
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SUPABASE_URL = os.getenv('SUPABASE_URL', '')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', '')
 
-async def get_supabase_client() -> AsyncClient:
-    """Initializes and returns the asynchronous Supabase client."""
+# Connection pool tuning for the shared HTTP transport. One pool is opened per
+# worker process and reused by every request handled by that worker.
+SUPABASE_POOL_MAX_CONNECTIONS = int(os.getenv('SUPABASE_POOL_MAX_CONNECTIONS', '100'))
+SUPABASE_POOL_MAX_KEEPALIVE = int(os.getenv('SUPABASE_POOL_MAX_KEEPALIVE', '20'))
+SUPABASE_POOL_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_POOL_KEEPALIVE_EXPIRY', '30'))
+SUPABASE_POOL_TIMEOUT = float(os.getenv('SUPABASE_POOL_TIMEOUT', '10'))
+SUPABASE_HEALTH_CHECK_INTERVAL = float(os.getenv('SUPABASE_HEALTH_CHECK_INTERVAL', '60'))
+
+_http_client: httpx.AsyncClient | None = None
+_supabase: AsyncClient | None = None
+_health_task: asyncio.Task | None = None
+_pool_lock = asyncio.Lock()
+supabase_healthy = False
+
+
+def _client_options() -> AsyncClientOptions:
+    """Client options that route every sub-client through the shared pool."""
+    return AsyncClientOptions(
+        httpx_client=_http_client,
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+
+
+async def _health_check_loop() -> None:
+    """Periodically probes Supabase so request handlers never have to."""
+    global supabase_healthy
+    while True:
+        try:
+            await _supabase.from_('user').select('id').limit(1).execute()
+            if not supabase_healthy:
+                logger.info("Supabase connection is healthy.")
+            supabase_healthy = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            supabase_healthy = False
+            logger.error(f"❌ Supabase connection failed: {e}")
+        await asyncio.sleep(SUPABASE_HEALTH_CHECK_INTERVAL)
+
+
+async def open_supabase_pool() -> AsyncClient:
+    """
+    Opens the worker-wide HTTP pool and Supabase client.
+    Called once from the FastAPI lifespan hook; safe to call again.
+    """
+    global _http_client, _supabase, _health_task
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("Supabase credentials not set.")
-    supabase: AsyncClient = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
-    try:
-        await supabase.from_('user').select('*').limit(1).execute()
-    
-    except Exception as e:
-        print(f"❌ Supabase connection failed: {e}")
-    return supabase
\ No newline at end of file
+    async with _pool_lock:
+        if _supabase is not None:
+            return _supabase
+        _http_client = httpx.AsyncClient(
+            transport=InstrumentedTransport(
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY,
+                ),
+                http2=True,
+            ),
+            timeout=SUPABASE_POOL_TIMEOUT,
+        )
+        _supabase = await acreate_client(
+            SUPABASE_URL, SUPABASE_KEY, options=_client_options()
+        )
+        _health_task = asyncio.create_task(_health_check_loop())
+        return _supabase
+
+
+async def close_supabase_pool() -> None:
+    """Stops the health check and releases pooled connections."""
+    global _http_client, _supabase, _health_task, supabase_healthy
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client, _supabase, _health_task = None, None, None
+    supabase_healthy = False
+
+
+async def get_supabase_client() -> AsyncClient:
+    """Returns the worker's shared, pooled asynchronous Supabase client."""
+    if _supabase is None:
+        return await open_supabase_pool()
+    return _supabase
+
+
+async def get_supabase_auth_client() -> AsyncClient:
+    """
+    Returns a request-scoped Supabase client for auth flows.
+    Signing in mutates the client's session headers, so it must not be shared
+    between users; it still reuses the pooled connections underneath.
+    """
+    if _supabase is None:
+        await open_supabase_pool()
+    return await acreate_client(SUPABASE_URL, SUPABASE_KEY, options=_client_options())
@@ -0,0 +1,106 @@
+# app/db/instrumentation.py
+
+import re
+import time
+from typing import Callable
+
+import httpx
+
+from server.core.metrics import SIZE_BUCKETS, registry
+
+_LABELS = ("kind", "name", "method")
+
+supabase_request_duration = registry.histogram(
+    "supabase_request_duration_seconds",
+    "Supabase call latency, from sending the request to reading the whole body.",
+    _LABELS,
+)
+supabase_request_bytes = registry.histogram(
+    "supabase_request_bytes",
+    "Supabase request body size in bytes.",
+    _LABELS,
+    SIZE_BUCKETS,
+)
+supabase_response_bytes = registry.histogram(
+    "supabase_response_bytes",
+    "Supabase response body size in bytes, as received on the wire.",
+    _LABELS,
+    SIZE_BUCKETS,
+)
+supabase_errors = registry.counter(
+    "supabase_errors_total",
+    "Supabase calls that failed, by HTTP status class or transport error type.",
+    (*_LABELS, "reason"),
+)
+
+_PATH = re.compile(r"/(rest|auth|storage|functions)/v1/([^/?]*)(?:/([^/?]*))?")
+
+
+def call_labels(request: httpx.Request) -> tuple[str, str, str]:
+    """
+    (kind, name, method) for a Supabase request: PostgREST calls are labelled
+    by RPC function or table name, other services by their first path segment.
+    """
+    match = _PATH.search(request.url.path)
+    if match is None:
+        return ("other", "", request.method)
+    service, first, second = match.groups()
+    if service == "rest":
+        if first == "rpc":
+            return ("rpc", second or "", request.method)
+        return ("table", first, request.method)
+    return (service, first, request.method)
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Counts response body bytes and reports once the body has been consumed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[int], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._bytes = 0
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close(self._bytes)
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    The pooled transport under every Supabase sub-client (PostgREST, auth,
+    storage), recording per-RPC/table call latency, payload sizes and errors.
+    Metering the transport rather than the query builders covers every call
+    path, including ones the client library makes internally.
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        labels = call_labels(request)
+        started = time.perf_counter()
+        supabase_request_bytes.observe(labels, int(request.headers.get("content-length", 0)))
+        try:
+            response = await super().handle_async_request(request)
+        except Exception as e:
+            supabase_request_duration.observe(labels, time.perf_counter() - started)
+            supabase_errors.inc((*labels, type(e).__name__))
+            raise
+
+        status_code = response.status_code
+
+        def on_close(size: int) -> None:
+            supabase_request_duration.observe(labels, time.perf_counter() - started)
+            supabase_response_bytes.observe(labels, size)
+            if status_code >= 400:
+                supabase_errors.inc((*labels, f"{status_code // 100}xx"))
+
+        response.stream = _MeteredStream(response.stream, on_close)
+        return response
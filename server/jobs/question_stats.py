@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from supabase import AsyncClient, acreate_client
+
+load_dotenv()
+
+url: str = os.environ.get("SUPABASE_URL", "")
+key: str = os.environ.get("SUPABASE_KEY", "")
+
+# How often pending answer statistics are folded into the questions table.
+FOLD_INTERVAL_SECONDS = float(os.environ.get("QUESTION_STATS_FOLD_INTERVAL", "60"))
+
+
+async def fold_question_stats(supabase: AsyncClient) -> int:
+    """
+    Applies all pending rows of question_stats_log to the questions table and
+    returns the number of questions updated.
+    """
+    response = await supabase.rpc("fold_question_stats", {}).execute()
+    return response.data or 0
+
+
+async def main():
+    """
+    Periodically drains the question statistics log. Safe to run alongside
+    other instances: each log row is consumed by exactly one fold.
+    """
+    supabase: AsyncClient = await acreate_client(url, key)
+    while True:
+        try:
+            updated = await fold_question_stats(supabase)
+            if updated:
+                print(f"Folded answer statistics into {updated} questions.")
+        except Exception as e:
+            print(f"Error folding question statistics: {e}")
+        await asyncio.sleep(FOLD_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    if not url or not key:
+        print("FATAL: SUPABASE_URL and SUPABASE_KEY environment variables are not set.")
+    else:
+        asyncio.run(main())
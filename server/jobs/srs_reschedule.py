@@ -0,0 +1,141 @@
+"""
+Batch rescheduling of user_question_progress with the vectorized SRS engine.
+
+Loads every progress row (or one user's), recomputes when each card is due
+under the chosen scheduler and prints the review load forecast before and
+after. With --apply, next_review_at is written back for the rows whose due
+day changed; the SM-2 fields are left alone, so answering a question keeps
+using process_answer_submission() as before.
+
+    python -m server.jobs.srs_reschedule --scheduler fsrs --retention 0.85
+    python -m server.jobs.srs_reschedule --scheduler sm2 --apply
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import AsyncClient, acreate_client
+
+from server.lib.srs import SCHEDULERS, Cards, FsrsScheduler, forecast_due, reschedule
+
+load_dotenv()
+
+url: str = os.environ.get("SUPABASE_URL", "")
+key: str = os.environ.get("SUPABASE_KEY", "")
+
+PAGE_SIZE = 1000
+COLUMNS = "user_id, question_id, ease_factor, current_interval, repetitions, last_reviewed_at, next_review_at"
+DAY = 86400.0
+
+
+def _epoch(timestamp: str | None) -> float:
+    return datetime.fromisoformat(timestamp).timestamp() if timestamp else np.nan
+
+
+async def load_progress(supabase: AsyncClient, user_id: str | None) -> dict[str, list]:
+    """All progress rows as columns, paged by (user_id, question_id) keyset."""
+    columns: dict[str, list] = {
+        name: [] for name in ("user_id", "question_id", "ease", "interval", "reps", "last", "next")
+    }
+    last_key: tuple[str, str] | None = None
+    while True:
+        query = supabase.table("user_question_progress").select(COLUMNS)
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if last_key:
+            u, q = last_key
+            query = query.or_(f"user_id.gt.{u},and(user_id.eq.{u},question_id.gt.{q})")
+        response = await query.order("user_id").order("question_id").limit(PAGE_SIZE).execute()
+        rows = response.data or []
+        for row in rows:
+            columns["user_id"].append(row["user_id"])
+            columns["question_id"].append(row["question_id"])
+            columns["ease"].append(float(row["ease_factor"]))
+            columns["interval"].append(row["current_interval"])
+            columns["reps"].append(row["repetitions"])
+            columns["last"].append(_epoch(row["last_reviewed_at"]))
+            columns["next"].append(_epoch(row["next_review_at"]))
+        if len(rows) < PAGE_SIZE:
+            return columns
+        last_key = (rows[-1]["user_id"], rows[-1]["question_id"])
+
+
+def print_forecast(before: np.ndarray, after: np.ndarray) -> None:
+    print(f"{'day':>5}{'due now':>10}{'rescheduled':>13}")
+    for day, (b, a) in enumerate(zip(before, after)):
+        print(f"{day:>5}{b:>10}{a:>13}")
+    print(f"{'total':>5}{before.sum():>10}{after.sum():>13}")
+
+
+async def apply_schedule(
+    supabase: AsyncClient, columns: dict[str, list], due_at: np.ndarray, changed: np.ndarray
+) -> None:
+    for start in range(0, len(changed), PAGE_SIZE):
+        chunk = changed[start : start + PAGE_SIZE]
+        rows = [
+            {
+                "user_id": columns["user_id"][i],
+                "question_id": columns["question_id"][i],
+                "next_review_at": datetime.fromtimestamp(due_at[i], timezone.utc).isoformat(),
+            }
+            for i in chunk
+        ]
+        await supabase.table("user_question_progress").upsert(
+            rows, on_conflict="user_id,question_id"
+        ).execute()
+
+
+async def main(args: argparse.Namespace):
+    supabase: AsyncClient = await acreate_client(url, key)
+    scheduler = (
+        FsrsScheduler(desired_retention=args.retention)
+        if args.scheduler == "fsrs"
+        else SCHEDULERS[args.scheduler]()
+    )
+
+    started = time.perf_counter()
+    columns = await load_progress(supabase, args.user_id)
+    print(f"Loaded {len(columns['user_id'])} progress rows in {time.perf_counter() - started:.1f}s.")
+    if not columns["user_id"]:
+        return
+
+    now = time.time()
+    cards = Cards.from_sm2(columns["ease"], columns["interval"], columns["reps"])
+    next_at = np.asarray(columns["next"])
+    # Rows never reviewed date from their scheduled day minus the interval.
+    last_at = np.asarray(columns["last"])
+    last_at = np.where(np.isnan(last_at), next_at - cards.interval * DAY, last_at)
+
+    started = time.perf_counter()
+    due_in = reschedule(cards, scheduler, (now - last_at) / DAY)
+    due_at = now + due_in * DAY
+    before = forecast_due((next_at - now) / DAY, args.horizon)
+    after = forecast_due(due_in, args.horizon)
+    print(f"Rescheduled with {scheduler.name} in {time.perf_counter() - started:.2f}s.")
+    print_forecast(before, after)
+
+    changed = np.flatnonzero(np.abs(due_at - next_at) >= DAY)
+    print(f"{len(changed)} rows move by a day or more.")
+    if args.apply and len(changed):
+        started = time.perf_counter()
+        await apply_schedule(supabase, columns, due_at, changed)
+        print(f"Updated {len(changed)} rows in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute review schedules in bulk.")
+    parser.add_argument("--scheduler", choices=sorted(SCHEDULERS), default="sm2")
+    parser.add_argument("--retention", type=float, default=0.9, help="FSRS desired retention.")
+    parser.add_argument("--user-id", help="Only reschedule this user's cards.")
+    parser.add_argument("--horizon", type=int, default=30, help="Days to forecast.")
+    parser.add_argument("--apply", action="store_true", help="Write the new schedule back.")
+    args = parser.parse_args()
+    if not url or not key:
+        print("FATAL: SUPABASE_URL and SUPABASE_KEY environment variables are not set.")
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    A bounded, per-worker LRU cache whose entries expire after a fixed TTL.
+
+    Values are held in process memory, so each worker keeps its own copy;
+    invalidate() only affects the worker it runs in and the TTL bounds how
+    stale the other workers can be.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Per-user dashboard payloads, dropped whenever the user answers a question.
+dashboard_summary_cache = TTLCache(
+    ttl=float(os.environ.get("DASHBOARD_SUMMARY_CACHE_TTL", "60"))
+)
+dashboard_stats_cache = TTLCache(
+    ttl=float(os.environ.get("DASHBOARD_STATS_CACHE_TTL", "60"))
+)
+dashboard_forecast_cache = TTLCache(
+    ttl=float(os.environ.get("DASHBOARD_FORECAST_CACHE_TTL", "300"))
+)
+
+
+def invalidate_user_dashboard(user_id: str) -> None:
+    """Drops a user's cached dashboard data after their progress changes."""
+    dashboard_summary_cache.invalidate(user_id)
+    dashboard_stats_cache.invalidate(user_id)
+    dashboard_forecast_cache.invalidate(user_id)
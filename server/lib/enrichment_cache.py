@@ -0,0 +1,112 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from typing import Any, Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrichments (
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    item TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (key, version)
+)
+"""
+
+
+def normalize_stem(stem: str) -> str:
+    """The cache form of a question stem: whitespace-collapsed and case-folded."""
+    return re.sub(r"\s+", " ", stem.strip()).casefold()
+
+
+def stem_key(stem: str) -> str:
+    return hashlib.sha256(normalize_stem(stem).encode()).hexdigest()
+
+
+def enrichment_version(*parts: str) -> str:
+    """A short fingerprint of everything that shapes the output (prompt, model)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class EnrichmentCache:
+    """
+    A persistent, content-addressed store of validated enrichments.
+
+    Entries are keyed by the normalized question stem and the enrichment
+    version, so a repeated stem is served locally while a change to the
+    prompt or model makes every old entry a miss without deleting it.
+    """
+
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def get(self, stem: str) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT item FROM enrichments WHERE key = ? AND version = ?",
+            (stem_key(stem), self.version),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put_many(self, entries: Iterable[tuple[str, dict]]) -> None:
+        """Stores (stem, item) pairs in one transaction."""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO enrichments (key, version, item, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (stem_key(stem), self.version, json.dumps(item, ensure_ascii=False), now)
+                    for stem, item in entries
+                ],
+            )
+
+    def invalidate(self, stale_only: bool = True) -> int:
+        """
+        Deletes entries written under other versions, or everything when
+        stale_only is False. Returns the number of entries removed.
+        """
+        with self._conn:
+            if stale_only:
+                cursor = self._conn.execute(
+                    "DELETE FROM enrichments WHERE version != ?", (self.version,)
+                )
+            else:
+                cursor = self._conn.execute("DELETE FROM enrichments")
+        self._conn.execute("VACUUM")
+        return cursor.rowcount
+
+    def stats(self) -> dict[str, Any]:
+        total, current = self._conn.execute(
+            "SELECT count(*), coalesce(sum(version = ?), 0) FROM enrichments",
+            (self.version,),
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": total,
+            "current_version_entries": current,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,123 @@
+import json
+import shutil
+from typing import Any, Iterable, Iterator
+
+try:
+    import ijson
+except ImportError:  # optional: the pure-Python decoder below is used instead
+    ijson = None
+
+READ_CHUNK_SIZE = 1 << 16
+
+
+def _first_char(f) -> str:
+    """Returns the first non-whitespace character of a text file and rewinds it."""
+    while True:
+        chunk = f.read(1024)
+        if not chunk:
+            f.seek(0)
+            return ""
+        stripped = chunk.lstrip()
+        if stripped:
+            f.seek(0)
+            return stripped[0]
+
+
+def _iter_ndjson(f) -> Iterator[Any]:
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+
+def _iter_json_array(f) -> Iterator[Any]:
+    """Decodes the elements of a top-level JSON array one at a time."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace, separators and the opening bracket.
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if not started and pos < len(buffer):
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if pos < len(buffer) or eof:
+                break
+            chunk = f.read(READ_CHUNK_SIZE)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # A scalar ending exactly at the buffer edge may be cut short.
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # The element straddles the buffer boundary: read more and retry.
+            chunk = f.read(READ_CHUNK_SIZE)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+            continue
+        yield item
+        buffer, pos = buffer[end:], 0
+
+
+def iter_json_records(file_path: str) -> Iterator[Any]:
+    """
+    Yields the records of a JSON array file or an NDJSON file one at a time,
+    so memory use does not grow with the size of the file. The format is
+    detected from the first character of the file.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        first = _first_char(f)
+        if first == "":
+            return
+        if first != "[":
+            yield from _iter_ndjson(f)
+        elif ijson is not None:
+            with open(file_path, "rb") as raw:
+                yield from ijson.items(raw, "item", use_float=True)
+        else:
+            yield from _iter_json_array(f)
+
+
+def write_ndjson(records: Iterable[Any], file_path: str) -> int:
+    """Atomically writes records to an NDJSON file, returning how many were written."""
+    temp = f"{file_path}.tmp"
+    count = 0
+    with open(temp, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    shutil.move(temp, file_path)
+    return count
+
+
+def chunked(records: Iterable[Any], size: int) -> Iterator[list]:
+    """Groups a stream of records into lists of at most size items."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
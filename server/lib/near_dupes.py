@@ -0,0 +1,245 @@
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from array import array
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional: signatures are computed in pure Python instead
+    np = None
+
+# MinHash parameters. 16 bands of 8 rows put the LSH candidate threshold near
+# a Jaccard similarity of 0.71, so pairs at the reporting threshold are found
+# with near certainty; candidates are then checked against the full signature.
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 2
+# Clinical vignettes that differ in one deciding detail (age, ethnicity, a
+# comorbidity) still share most of their stem, so the threshold is high and a
+# match also needs the same correct answer.
+DEFAULT_THRESHOLD = 0.9
+_PRIME = (1 << 31) - 1
+_FORMAT_VERSION = 2
+
+
+def question_text(q_data: dict) -> str:
+    """The text a question is compared on: its stem. Options are compared through correct_answer()."""
+    return str(q_data.get("question") or q_data.get("question_text") or "")
+
+
+def correct_answer(q_data: dict) -> str:
+    """
+    The text of the question's correct option, falling back to its 'answer'
+    field; empty when neither is known.
+    """
+    for option in q_data.get("options") or []:
+        if isinstance(option, dict) and option.get("is_correct"):
+            return str(option.get("text") or option.get("option_text") or "")
+    return str(q_data.get("answer") or "")
+
+
+def answer_key(answer: str) -> int:
+    """A fingerprint of the answer text that ignores case, spacing and punctuation."""
+    return zlib.crc32(" ".join(re.findall(r"\w+", answer.casefold())).encode())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    """Word n-grams of the case-folded text; short texts form a single shingle."""
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """
+    A MinHash / LSH index of question stems for near-duplicate detection.
+
+    Each stem is reduced to a fixed-size MinHash signature over its word
+    shingles. Signatures are split into bands and bucketed, so a lookup only
+    compares against stems that share at least one band, whatever the size of
+    the index. Two questions only match when their correct answers are the
+    same as well, so a copy whose changed detail changes the answer is not a
+    duplicate. Only the signatures and answer fingerprints are persisted; the
+    buckets are rebuilt on load.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = NUM_PERM,
+        bands: int = BANDS,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+        rng = random.Random(seed)
+        self._a = [rng.randrange(1, _PRIME) for _ in range(num_perm)]
+        self._b = [rng.randrange(0, _PRIME) for _ in range(num_perm)]
+        if np is not None:
+            self._np_a = np.array(self._a, dtype=np.uint64)[:, None]
+            self._np_b = np.array(self._b, dtype=np.uint64)[:, None]
+        self._signatures: dict[str, array] = {}
+        self._answers: dict[str, int] = {}
+        # Most buckets hold a single key, stored bare to avoid a list per entry.
+        self._buckets: list[dict[int, str | list[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def signature(self, text: str) -> array:
+        hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text)]
+        if np is not None:
+            values = np.array(hashes, dtype=np.uint64)[None, :]
+            minima = ((self._np_a * values + self._np_b) % _PRIME).min(axis=1)
+            return array("I", minima.astype(np.uint32).tobytes())
+        return array(
+            "I",
+            (min((a * h + b) % _PRIME for h in hashes) for a, b in zip(self._a, self._b)),
+        )
+
+    def _band_keys(self, signature: array) -> list[int]:
+        """One bucket key per band, in band order."""
+        raw = signature.tobytes()
+        step = self.rows * signature.itemsize
+        return [hash(raw[start : start + step]) for start in range(0, len(raw), step)]
+
+    def _insert(self, key: str, signature: array, answer: int) -> None:
+        self._signatures[key] = signature
+        self._answers[key] = answer
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(band_key)
+            if bucket is None:
+                buckets[band_key] = key
+            elif isinstance(bucket, list):
+                bucket.append(key)
+            else:
+                buckets[band_key] = [bucket, key]
+
+    def add(self, key: str, text: str, answer: str = "") -> None:
+        if key in self._signatures:
+            self.remove(key)
+        self._insert(key, self.signature(text), answer_key(answer))
+
+    def remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        del self._answers[key]
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(band_key)
+            if bucket == key:
+                del buckets[band_key]
+            elif isinstance(bucket, list) and key in bucket:
+                bucket.remove(key)
+                if len(bucket) == 1:
+                    buckets[band_key] = bucket[0]
+
+    def similarity(self, first: array, second: array) -> float:
+        """The estimated Jaccard similarity of two signatures."""
+        return sum(x == y for x, y in zip(first, second)) / self.num_perm
+
+    def _best_match(
+        self, signature: array, answer: int, exclude: Optional[str]
+    ) -> Optional[tuple[str, float]]:
+        best = None
+        checked = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(band_key)
+            if bucket is None:
+                continue
+            for candidate in bucket if isinstance(bucket, list) else (bucket,):
+                if candidate == exclude or candidate in checked:
+                    continue
+                checked.add(candidate)
+                if self._answers[candidate] != answer:
+                    continue
+                score = self.similarity(signature, self._signatures[candidate])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (candidate, score)
+        return best
+
+    def query(
+        self, text: str, answer: str = "", exclude: Optional[str] = None
+    ) -> Optional[tuple[str, float]]:
+        """
+        Returns (key, estimated similarity) of the closest indexed stem at or
+        above the threshold with the same answer, or None. `exclude` skips the
+        entry for the text itself.
+        """
+        return self._best_match(self.signature(text), answer_key(answer), exclude)
+
+    def add_if_unique(
+        self, key: str, text: str, answer: str = "", index_duplicates: bool = False
+    ) -> Optional[tuple[str, float]]:
+        """
+        Indexes the text unless it near-duplicates an indexed one, in which
+        case the match is returned and the index is left unchanged. With
+        index_duplicates the text is indexed either way, for callers that keep
+        the questions they flag.
+        """
+        signature = self.signature(text)
+        fingerprint = answer_key(answer)
+        match = self._best_match(signature, fingerprint, exclude=key)
+        if match is None or index_duplicates:
+            if key in self._signatures:
+                self.remove(key)
+            self._insert(key, signature, fingerprint)
+        return match
+
+    def save(self, path: str) -> None:
+        """Atomically writes the parameters and signatures to path."""
+        keys = list(self._signatures)
+        meta = {
+            "format": _FORMAT_VERSION,
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "seed": self.seed,
+            "byteorder": sys.byteorder,
+            "keys": keys,
+            "answers": [self._answers[key] for key in keys],
+        }
+        temp = f"{path}.tmp"
+        with open(temp, "wb") as f:
+            f.write(json.dumps(meta).encode())
+            f.write(b"\n")
+            for key in keys:
+                self._signatures[key].tofile(f)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "NearDuplicateIndex":
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+            if meta.get("format") != _FORMAT_VERSION:
+                raise ValueError(f"Unsupported near-duplicate index format in {path}")
+            index = cls(
+                threshold=meta["threshold"] if threshold is None else threshold,
+                num_perm=meta["num_perm"],
+                bands=meta["bands"],
+                seed=meta["seed"],
+            )
+            values = array("I")
+            values.frombytes(f.read())
+        if meta["byteorder"] != sys.byteorder:
+            values.byteswap()
+        keys = meta["keys"]
+        if len(values) != len(keys) * index.num_perm:
+            raise ValueError(f"Truncated near-duplicate index in {path}")
+        for i, (key, answer) in enumerate(zip(keys, meta["answers"])):
+            start = i * index.num_perm
+            index._insert(key, values[start : start + index.num_perm], answer)
+        return index
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import httpx
+
+from server.lib.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+OG_IMAGE_TIMEOUT = float(os.getenv('OG_IMAGE_TIMEOUT', '10'))
+OG_IMAGE_MAX_CONNECTIONS = int(os.getenv('OG_IMAGE_MAX_CONNECTIONS', '20'))
+OG_IMAGE_MAX_KEEPALIVE = int(os.getenv('OG_IMAGE_MAX_KEEPALIVE', '10'))
+# In-memory tier, per worker.
+OG_IMAGE_CACHE_MAX_BYTES = int(os.getenv('OG_IMAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Optional on-disk tier, shared by every worker on the host. Disabled when unset.
+OG_IMAGE_DISK_CACHE_DIR = os.getenv('OG_IMAGE_DISK_CACHE_DIR', '')
+OG_IMAGE_DISK_CACHE_MAX_BYTES = int(
+    os.getenv('OG_IMAGE_DISK_CACHE_MAX_BYTES', str(1024 * 1024 * 1024))
+)
+
+_og_client: httpx.AsyncClient | None = None
+
+
+async def open_og_client() -> httpx.AsyncClient:
+    """Opens the worker-wide client used to call the OG image renderer."""
+    global _og_client
+    if _og_client is None:
+        _og_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OG_IMAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=OG_IMAGE_MAX_KEEPALIVE,
+            ),
+            timeout=OG_IMAGE_TIMEOUT,
+        )
+    return _og_client
+
+
+async def close_og_client() -> None:
+    global _og_client
+    if _og_client is not None:
+        await _og_client.aclose()
+        _og_client = None
+
+
+def image_cache_key(question_id: str, params: dict) -> str:
+    """Question id plus a hash of everything the renderer is given."""
+    digest = hashlib.sha256(
+        json.dumps(params, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()[:16]
+    return f"{question_id}-{digest}"
+
+
+class _DiskTier:
+    """PNG files in one directory, pruned oldest-first past max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()
+        )
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, image: bytes) -> None:
+        path = self._path(key)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(image)
+        os.replace(temp, path)
+        with self._lock:
+            self._size += len(image)
+            if self._size > self.max_bytes:
+                self._prune()
+
+    def _prune(self) -> None:
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".png")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+
+class ImageCache:
+    """
+    Rendered OG images: a byte-bounded in-memory LRU in front of an optional
+    on-disk tier. Concurrent misses for the same key share one render.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = OG_IMAGE_CACHE_MAX_BYTES,
+        disk_dir: str = OG_IMAGE_DISK_CACHE_DIR,
+    ):
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._renders = single_flight("og_image_render")
+        self._disk = _DiskTier(disk_dir, OG_IMAGE_DISK_CACHE_MAX_BYTES) if disk_dir else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "renders": 0}
+
+    def _get_memory(self, key: str) -> bytes | None:
+        image = self._entries.get(key)
+        if image is not None:
+            self._entries.move_to_end(key)
+        return image
+
+    def _set_memory(self, key: str, image: bytes) -> None:
+        if len(image) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = image
+        self._size += len(image)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def _load(self, key: str, url: str, params: dict) -> bytes:
+        if self._disk is not None:
+            image = await asyncio.to_thread(self._disk.get, key)
+            if image is not None:
+                self.counters["disk_hits"] += 1
+                self._set_memory(key, image)
+                return image
+
+        self.counters["renders"] += 1
+        client = await open_og_client()
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        image = response.content
+        self._set_memory(key, image)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, image)
+            except OSError as e:
+                logger.warning(f"Could not write OG image {key} to the disk cache: {e}")
+        return image
+
+    async def get_or_render(self, key: str, url: str, params: dict) -> bytes:
+        image = self._get_memory(key)
+        if image is not None:
+            self.counters["memory_hits"] += 1
+            return image
+
+        return await self._renders.do(key, lambda: self._load(key, url, params))
+
+    def stats(self) -> dict[str, int]:
+        renders = self._renders.stats()
+        return {
+            **self.counters,
+            "coalesced": renders["coalesced"],
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "in_flight": renders["in_flight"],
+        }
+
+
+og_image_cache = ImageCache()
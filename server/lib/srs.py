@@ -0,0 +1,328 @@
+# app/lib/srs.py
+"""
+Vectorized spaced-repetition scheduling.
+
+Every function works on whole NumPy arrays of cards at once, so rescheduling,
+simulating or forecasting millions of user_question_progress rows is a few
+array passes instead of a row-by-row loop.
+
+Two schedulers share one interface (`review`, `next_interval`):
+
+* Sm2Scheduler reproduces process_answer_submission() in server/database.sql
+  exactly, including Postgres' numeric rounding, so schedules computed here
+  match the ones the database writes.
+* FsrsScheduler implements FSRS-4.5: a stability/difficulty memory model
+  whose intervals target a desired retention and separate 'hard', 'good'
+  and 'easy' properly. Cards with only SM-2 state are seeded with
+  `FsrsScheduler.from_sm2`.
+
+Ratings are FSRS grades: AGAIN=1, HARD=2, GOOD=3, EASY=4 (see
+`encode_ratings` for the labels the client and database use).
+"""
+
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+
+# Labels used by the client ('forgot'..'effortless') and by the SQL functions.
+# Note that the SQL only recognises 'forgot' and 'easy': 'effortless' answers
+# are scheduled there like 'good'.
+RATING_CODES = {
+    "forgot": AGAIN,
+    "again": AGAIN,
+    "struggled": HARD,
+    "hard": HARD,
+    "recalled": GOOD,
+    "good": GOOD,
+    "effortless": EASY,
+    "easy": EASY,
+}
+
+
+def encode_ratings(labels: Iterable[str | None]) -> np.ndarray:
+    """Rating labels to grades; missing or unknown labels count as GOOD, as in SQL."""
+    return np.fromiter(
+        (RATING_CODES.get(label, GOOD) if label else GOOD for label in labels),
+        dtype=np.int8,
+    )
+
+
+class Cards(NamedTuple):
+    """
+    Scheduling state of n cards as parallel arrays. The SM-2 fields mirror
+    user_question_progress; stability and difficulty are FSRS memory state
+    (NaN where not yet known).
+    """
+
+    ease: np.ndarray  # float64, ease factor
+    interval: np.ndarray  # int32, days
+    reps: np.ndarray  # int32, consecutive successful reviews
+    stability: np.ndarray  # float64, days until retrievability falls to 90%
+    difficulty: np.ndarray  # float64, 1 (easy) .. 10 (hard)
+
+    @classmethod
+    def new(cls, n: int) -> "Cards":
+        """n unseen cards, with the user_question_progress defaults."""
+        return cls(
+            ease=np.full(n, 2.5),
+            interval=np.zeros(n, dtype=np.int32),
+            reps=np.zeros(n, dtype=np.int32),
+            stability=np.full(n, np.nan),
+            difficulty=np.full(n, np.nan),
+        )
+
+    @classmethod
+    def from_sm2(cls, ease, interval, reps) -> "Cards":
+        ease = np.asarray(ease, dtype=np.float64)
+        return cls(
+            ease=ease,
+            interval=np.asarray(interval, dtype=np.int32),
+            reps=np.asarray(reps, dtype=np.int32),
+            stability=np.full(ease.shape, np.nan),
+            difficulty=np.full(ease.shape, np.nan),
+        )
+
+    def take(self, index) -> "Cards":
+        return Cards(*(field[index] for field in self))
+
+    def put(self, index, other: "Cards") -> None:
+        """Writes `other` into the cards selected by `index`, in place."""
+        for field, values in zip(self, other):
+            field[index] = values
+
+
+class Sm2Scheduler:
+    """
+    SM-2 as implemented by process_answer_submission():
+    AGAIN resets the repetitions, sets a 1-day interval and lowers the ease
+    by 0.2 (not below 1.3); otherwise the intervals run 1, 6, then
+    round(interval * ease), and EASY raises the ease by 0.15.
+
+    Ease factors are handled in hundredths, so the rounding matches Postgres'
+    round() on numeric (half away from zero) rather than float arithmetic.
+    """
+
+    name = "sm2"
+
+    def review(self, cards: Cards, ratings: np.ndarray, elapsed_days=None) -> Cards:
+        ratings = np.asarray(ratings)
+        ease = np.rint(cards.ease * 100).astype(np.int64)
+        interval = cards.interval.astype(np.int64)
+        forgot = ratings == AGAIN
+
+        reps = np.where(forgot, 0, cards.reps + 1)
+        grown = (interval * ease + 50) // 100
+        new_interval = np.select([forgot, reps == 1, reps == 2], [1, 1, 6], grown)
+        new_ease = np.where(
+            forgot,
+            np.maximum(130, ease - 20),
+            np.where(ratings == EASY, ease + 15, ease),
+        )
+        return cards._replace(
+            ease=new_ease / 100,
+            interval=new_interval.astype(np.int32),
+            reps=reps.astype(np.int32),
+        )
+
+    def next_interval(self, cards: Cards) -> np.ndarray:
+        """Days from the last review to the next; SM-2 stores it directly."""
+        return cards.interval
+
+
+# FSRS-4.5 default parameters.
+FSRS_WEIGHTS = np.array(
+    [
+        0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+        0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+    ]
+)
+_DECAY = -0.5
+_FACTOR = 0.9 ** (1 / _DECAY) - 1  # 19/81: retrievability is 90% at t = stability
+
+
+def retrievability(elapsed_days, stability) -> np.ndarray:
+    """Probability of recall after `elapsed_days` for a memory of the given stability."""
+    return (1 + _FACTOR * np.asarray(elapsed_days) / stability) ** _DECAY
+
+
+class FsrsScheduler:
+    """
+    FSRS-4.5. Each review updates a card's stability and difficulty from the
+    grade and its retrievability at review time; the next interval is when
+    retrievability is predicted to fall to `desired_retention`.
+    """
+
+    name = "fsrs"
+
+    def __init__(
+        self,
+        weights: np.ndarray = FSRS_WEIGHTS,
+        desired_retention: float = 0.9,
+        maximum_interval: int = 36500,
+    ):
+        self.w = np.asarray(weights, dtype=np.float64)
+        self.desired_retention = desired_retention
+        self.maximum_interval = maximum_interval
+
+    def _initial_difficulty(self, ratings) -> np.ndarray:
+        return self.w[4] - (ratings - 3) * self.w[5]
+
+    def from_sm2(self, cards: Cards) -> Cards:
+        """
+        Fills in missing memory state from SM-2 state. SM-2 intervals are read
+        as the days to 90% recall (so stability = interval); ease 2.5 maps to
+        the default difficulty, each 0.2 of ease to one difficulty step.
+        """
+        unknown = np.isnan(cards.stability) & (cards.reps > 0)
+        stability = np.where(unknown, np.maximum(cards.interval, 1), cards.stability)
+        difficulty = np.where(
+            unknown,
+            np.clip(self._initial_difficulty(GOOD) - (cards.ease - 2.5) * 5, 1, 10),
+            cards.difficulty,
+        )
+        return cards._replace(stability=stability, difficulty=difficulty)
+
+    def review(self, cards: Cards, ratings: np.ndarray, elapsed_days) -> Cards:
+        w = self.w
+        ratings = np.asarray(ratings, dtype=np.float64)
+        cards = self.from_sm2(cards)
+        first = np.isnan(cards.stability)
+        # Placeholders for first reviews keep the arithmetic below NaN-free.
+        s = np.where(first, 1.0, cards.stability)
+        d = np.where(first, 5.0, cards.difficulty)
+        r = retrievability(np.maximum(elapsed_days, 0), s)
+
+        success = s * (
+            1
+            + np.exp(w[8])
+            * (11 - d)
+            * s ** -w[9]
+            * np.expm1(w[10] * (1 - r))
+            * np.where(ratings == HARD, w[15], 1.0)
+            * np.where(ratings == EASY, w[16], 1.0)
+        )
+        lapse = np.minimum(
+            w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * np.exp(w[14] * (1 - r)), s
+        )
+        stability = np.where(ratings == AGAIN, lapse, success)
+
+        difficulty = d - w[6] * (ratings - 3)
+        difficulty = w[7] * self._initial_difficulty(GOOD) + (1 - w[7]) * difficulty
+
+        stability = np.where(first, w[ratings.astype(np.int64) - 1], stability)
+        difficulty = np.where(first, self._initial_difficulty(ratings), difficulty)
+        difficulty = np.clip(difficulty, 1, 10)
+        stability = np.maximum(stability, 0.01)
+
+        updated = cards._replace(
+            stability=stability,
+            difficulty=difficulty,
+            reps=np.where(ratings == AGAIN, 0, cards.reps + 1).astype(np.int32),
+        )
+        return updated._replace(interval=self.next_interval(updated))
+
+    def next_interval(self, cards: Cards) -> np.ndarray:
+        cards = self.from_sm2(cards)
+        days = cards.stability / _FACTOR * (self.desired_retention ** (1 / _DECAY) - 1)
+        days = np.where(np.isnan(days), 0, days)
+        return np.clip(np.rint(days), 1, self.maximum_interval).astype(np.int32)
+
+
+SCHEDULERS = {"sm2": Sm2Scheduler, "fsrs": FsrsScheduler}
+
+
+def reschedule(cards: Cards, scheduler, days_since_review) -> np.ndarray:
+    """
+    Days from now until each card is due under `scheduler`, without a new
+    review: used to move existing schedules onto another algorithm or
+    retention target. Negative values are overdue.
+    """
+    return scheduler.next_interval(cards) - np.asarray(days_since_review)
+
+
+def forecast_due(due_in_days, horizon: int) -> np.ndarray:
+    """
+    Reviews falling due on each of the next `horizon` days; overdue cards are
+    counted on day 0.
+    """
+    days = np.clip(np.floor(np.asarray(due_in_days, dtype=np.float64)), 0, None)
+    days = days[days < horizon].astype(np.int64)
+    return np.bincount(days, minlength=horizon)
+
+
+class SimulationResult(NamedTuple):
+    reviews: np.ndarray  # reviews per day
+    new: np.ndarray  # cards studied for the first time per day
+    lapses: np.ndarray  # failed reviews per day
+    retention: np.ndarray  # mean predicted recall of studied cards at each day's end
+
+
+def simulate(
+    cards: Cards,
+    scheduler,
+    days: int,
+    due_in_days=None,
+    new_per_day: int = 0,
+    grade_weights: tuple[float, float, float] = (0.15, 0.7, 0.15),
+    first_fail_rate: float = 0.3,
+    seed: int = 0,
+) -> SimulationResult:
+    """
+    What-if simulation: studies the cards day by day under `scheduler` and
+    records the daily workload and recall.
+
+    Recall is drawn from an FSRS memory model of each card, whichever
+    scheduler sets the intervals, so schedulers can be compared on the same
+    simulated learner. Successful reviews are graded HARD/GOOD/EASY with
+    `grade_weights`; a card's first answer fails with `first_fail_rate`. Unseen cards (reps == 0 and no due date) are introduced
+    at `new_per_day`.
+    """
+    rng = np.random.default_rng(seed)
+    memory_model = FsrsScheduler()
+    n = len(cards.ease)
+    cards = Cards(*(np.array(field, copy=True) for field in cards))
+    memory = memory_model.from_sm2(cards)
+
+    if due_in_days is None:
+        due_in_days = np.where(cards.reps > 0, cards.interval, np.inf)
+    due = np.asarray(due_in_days, dtype=np.float64).copy()
+    last_review = np.where(np.isfinite(due), due - cards.interval, np.nan)
+    unseen = np.flatnonzero(~np.isfinite(due))
+    grades = np.array([HARD, GOOD, EASY])
+    grade_p = np.asarray(grade_weights) / np.sum(grade_weights)
+
+    result = SimulationResult(*(np.zeros(days) for _ in range(4)))
+    for day in range(days):
+        introduced = unseen[:new_per_day]
+        unseen = unseen[new_per_day:]
+        due[introduced] = day
+
+        today = np.flatnonzero(due <= day)
+        if len(today):
+            elapsed = np.where(np.isnan(last_review[today]), 0, day - last_review[today])
+            first = np.isnan(memory.stability[today])
+            recall = np.where(
+                first, 1.0, retrievability(elapsed, np.where(first, 1.0, memory.stability[today]))
+            )
+            recalled = rng.random(len(today)) < recall
+            ratings = np.where(recalled, rng.choice(grades, size=len(today), p=grade_p), AGAIN)
+            ratings = np.where(first & (rng.random(len(today)) < first_fail_rate), AGAIN, ratings)
+
+            memory.put(today, memory_model.review(memory.take(today), ratings, elapsed))
+            scheduled = scheduler.review(cards.take(today), ratings, elapsed)
+            cards.put(today, scheduled)
+            due[today] = day + scheduled.interval
+            last_review[today] = day
+
+            result.reviews[day] = len(today) - np.count_nonzero(first)
+            result.new[day] = np.count_nonzero(first)
+            result.lapses[day] = np.count_nonzero(~recalled & ~first)
+
+        studied = ~np.isnan(last_review)
+        if studied.any():
+            result.retention[day] = retrievability(
+                day + 1 - last_review[studied], memory.stability[studied]
+            ).mean()
+    return result
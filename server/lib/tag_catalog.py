@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+
+from fastapi import Request, Response, status
+from supabase import AsyncClient
+
+from server.lib.single_flight import single_flight
+
+TAG_CATALOG_TTL = float(os.environ.get("TAG_CATALOG_TTL", "600"))
+TAG_PAGE_SIZE = 1000
+
+
+class SerializedPayload:
+    """A JSON body serialized once, with its strong ETag."""
+
+    def __init__(self, data: list[dict]):
+        self.body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()}"'
+
+    def to_response(self, request: Request) -> Response:
+        """Returns the payload, or an empty 304 if the client already holds it."""
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(
+            content=self.body, media_type="application/json", headers=headers
+        )
+
+
+class TagCatalog:
+    """
+    A per-worker, in-memory copy of the 'tags' table.
+
+    The table is loaded once and indexed by type and by name, and every
+    response shape is serialized once per load. Tags are written by the
+    import tools rather than the API, so there is nothing to invalidate: a
+    worker picks up changes when it reloads after TAG_CATALOG_TTL seconds.
+    """
+
+    def __init__(self, ttl: float = TAG_CATALOG_TTL):
+        self.ttl = ttl
+        self.tags: list[dict] = []
+        self.by_type: dict[str, list[dict]] = {}
+        self.by_name: dict[str, dict] = {}
+        self._payloads: dict[str, SerializedPayload] = {}
+        self._loaded_at = 0.0
+        self._flight = single_flight("tag_catalog")
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl
+
+    async def _fetch_all(self, supabase: AsyncClient) -> list[dict]:
+        tags: list[dict] = []
+        start = 0
+        while True:
+            response = (
+                await supabase.table("tags")
+                .select("id, name, type")
+                .order("name")
+                .range(start, start + TAG_PAGE_SIZE - 1)
+                .execute()
+            )
+            tags.extend(response.data)
+            if len(response.data) < TAG_PAGE_SIZE:
+                return tags
+            start += TAG_PAGE_SIZE
+
+    async def refresh(self, supabase: AsyncClient) -> None:
+        tags = await self._fetch_all(supabase)
+        by_type: dict[str, list[dict]] = {}
+        for tag in tags:
+            by_type.setdefault(tag["type"], []).append(tag)
+
+        self.tags = tags
+        self.by_type = by_type
+        self.by_name = {tag["name"].strip().casefold(): tag for tag in tags}
+        self._payloads = {}
+        self._loaded_at = time.monotonic()
+
+    async def ensure_loaded(self, supabase: AsyncClient) -> None:
+        if not self.is_stale:
+            return
+        # Requests arriving during a reload wait for it instead of starting their own.
+        await self._flight.do("refresh", lambda: self.refresh(supabase))
+
+    def get_by_name(self, name: str) -> dict | None:
+        return self.by_name.get(name.strip().casefold())
+
+    async def payload(
+        self, supabase: AsyncClient, type: str | None = None, with_type: bool = True
+    ) -> SerializedPayload:
+        """
+        Returns the serialized tag list, optionally filtered by type.
+        Filtered lists and lists without the 'type' field carry only id and name.
+        """
+        await self.ensure_loaded(supabase)
+        key = f"{type.upper() if type else '*'}:{with_type and not type}"
+        payload = self._payloads.get(key)
+        if payload is None:
+            if type:
+                tags = self.by_type.get(type.upper(), [])
+                data = [{"id": t["id"], "name": t["name"]} for t in tags]
+            elif with_type:
+                data = self.tags
+            else:
+                data = [{"id": t["id"], "name": t["name"]} for t in self.tags]
+            payload = SerializedPayload(data)
+            self._payloads[key] = payload
+        return payload
+
+
+tag_catalog = TagCatalog()
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import shutil
+from typing import Iterable
+
+from supabase import AsyncClient
+
+TAG_INDEX_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "all_tags.json"
+)
+UPSERT_CHUNK_SIZE = 500
+PAGE_SIZE = 1000
+
+# Question fields that carry tags, in order of precedence: a name that appears
+# both as a specialty and as a related term is stored as a SPECIALTY.
+TAG_FIELDS = (
+    ("specialty", "SPECIALTY"),
+    ("related_topics", "TOPIC"),
+    ("related_terms", "RELATED_TERM"),
+)
+_TAG_PRIORITY = {tag_type: rank for rank, (_, tag_type) in enumerate(TAG_FIELDS)}
+
+
+def normalize_tag(name: str) -> str:
+    """The lookup key for a tag name: trimmed, whitespace-collapsed, case-folded."""
+    return re.sub(r"\s+", " ", name.strip()).casefold()
+
+
+def clean_tag(name: str) -> str:
+    """The display form stored in the database: trimmed and whitespace-collapsed."""
+    return re.sub(r"\s+", " ", name.strip())
+
+
+class TagRegistry:
+    """
+    A name -> id index of the 'tags' table, persisted to all_tags.json.
+
+    Imports only upsert tag names missing from the local index and then merge
+    the returned IDs back in, so the full table is never re-read or rewritten.
+    The file keeps its original {name: id} format.
+    """
+
+    def __init__(self, index_path: str = TAG_INDEX_FILE):
+        self.index_path = index_path
+        self._ids: dict[str, str] = {}
+        self._names: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self) -> bool:
+        """Loads the persisted index. Returns False if there is none yet."""
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for name, tag_id in json.load(f).items():
+                self._add(name, tag_id)
+        return True
+
+    def save(self) -> None:
+        temp = f"{self.index_path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.as_map(), f, indent=2, ensure_ascii=False)
+        shutil.move(temp, self.index_path)
+
+    def get(self, name: str) -> str | None:
+        return self._ids.get(normalize_tag(name))
+
+    def as_map(self) -> dict[str, str]:
+        return {self._names[key]: tag_id for key, tag_id in self._ids.items()}
+
+    def _add(self, name: str, tag_id: str) -> None:
+        key = normalize_tag(name)
+        if key and key not in self._ids:
+            self._ids[key] = tag_id
+            self._names[key] = clean_tag(name)
+
+    @staticmethod
+    def collect(questions: Iterable[dict]) -> dict[str, dict]:
+        """
+        Gathers every distinct tag in one pass over the questions.
+        Returns {normalized name: {"name": ..., "type": ...}}.
+        """
+        tags: dict[str, dict] = {}
+        for question in questions:
+            for field, tag_type in TAG_FIELDS:
+                for name in question.get(field) or []:
+                    key = normalize_tag(name)
+                    if not key:
+                        continue
+                    existing = tags.get(key)
+                    if existing is None:
+                        tags[key] = {"name": clean_tag(name), "type": tag_type}
+                    elif _TAG_PRIORITY[tag_type] < _TAG_PRIORITY[existing["type"]]:
+                        existing["type"] = tag_type
+        return tags
+
+    async def rebuild(self, supabase: AsyncClient) -> None:
+        """Replaces the local index with the current contents of the 'tags' table."""
+        self._ids, self._names = {}, {}
+        start = 0
+        while True:
+            response = (
+                await supabase.table("tags")
+                .select("id, name")
+                .order("name")
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+            )
+            for item in response.data:
+                self._add(item["name"], item["id"])
+            if len(response.data) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        self.save()
+
+    async def sync(self, questions: Iterable[dict], supabase: AsyncClient) -> int:
+        """
+        Upserts the tags used by the questions that the index does not know yet
+        and records their IDs. Returns the number of tags added.
+        """
+        missing = [
+            tag for key, tag in self.collect(questions).items() if key not in self._ids
+        ]
+        for i in range(0, len(missing), UPSERT_CHUNK_SIZE):
+            response = (
+                await supabase.table("tags")
+                .upsert(missing[i : i + UPSERT_CHUNK_SIZE], on_conflict="name")
+                .execute()
+            )
+            for item in response.data:
+                self._add(item["name"], item["id"])
+        if missing:
+            self.save()
+        return len(missing)
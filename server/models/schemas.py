@@ -208,6 +208,10 @@ class NewSessionRequest(BaseModel):
 
     tag_id: uuid.UUID | None = None
     limit: int = Field(20, gt=0, le=50)
+    include_questions: bool = Field(
+        False,
+        description="Return the session's questions with the response instead of only its ID",
+    )
 
 
 class OptionResponse(BaseModel):
@@ -268,6 +272,19 @@ class ProgressUpdateResponse(BaseModel):
     # new_progress: UserQuestionProgress
 
 
+class AnswerBatchRequest(BaseModel):
+    """Schema for submitting all answers of a session (e.g. a test) at once."""
+
+    answers: list[AnswerSubmissionRequest] = Field(..., min_length=1, max_length=50)
+    completed: bool = False
+
+
+class AnswerBatchResult(ProgressUpdateResponse):
+    """Feedback for one answer in a batch submission."""
+
+    question_id: uuid.UUID
+
+
 class ActiveSessionResponse(BaseModel):
     """
     Schema for returning the user's most recent unfinished session.
@@ -325,6 +342,11 @@ class WeeklyAccuracyItem(BaseModel):
     accuracy: float
 
 
+class ReviewForecastItem(BaseModel):
+    date: str
+    due: int
+
+
 class DashboardStatsResponse(BaseModel):
     overallProgress: DashboardStatItem
     questionsAnswered: DashboardStatItem
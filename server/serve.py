@@ -0,0 +1,102 @@
+# app/serve.py
+"""
+Production entry point for the API.
+
+Runs server.app:app under uvicorn's process manager with one worker per
+available core, the uvloop event loop and the httptools HTTP parser.
+Each worker opens its own Supabase pool and caches in the app lifespan.
+
+Run from the repository root:
+    python -m server.serve
+
+Everything is tunable through the environment:
+    API_HOST / API_PORT            bind address (0.0.0.0:8000)
+    WEB_CONCURRENCY                worker count (default: available cores,
+                                   minus API_RESERVED_CPUS)
+    API_RESERVED_CPUS              cores left to other processes in the
+                                   container, e.g. Next.js (default 1 when
+                                   more than 2 cores are available)
+    API_BACKLOG                    listen backlog (2048)
+    API_KEEPALIVE_TIMEOUT          idle keep-alive seconds (75, above typical
+                                   proxy/load-balancer idle timeouts)
+    API_GRACEFUL_SHUTDOWN_TIMEOUT  seconds to drain in-flight requests (30)
+    API_MAX_REQUESTS               recycle a worker after N requests (0 = never)
+    API_ACCESS_LOG                 "1" to enable uvicorn's access log
+    FORWARDED_ALLOW_IPS            proxies trusted for X-Forwarded-* ("127.0.0.1")
+    METRICS_DIR                    where workers share /metrics snapshots
+                                   (a fresh temporary directory by default)
+    METRICS_TOKEN                  bearer token /metrics requires (the
+                                   endpoint is disabled without one)
+"""
+
+import glob
+import os
+import tempfile
+
+import uvicorn
+
+
+def available_cpus() -> int:
+    """Cores this process may use, honouring CPU affinity and cgroup v2 quotas."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    configured = os.environ.get("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    cpus = available_cpus()
+    reserved = int(os.environ.get("API_RESERVED_CPUS", "1" if cpus > 2 else "0"))
+    return max(1, cpus - reserved)
+
+
+def prepare_metrics_dir() -> None:
+    """
+    Gives the workers a shared, empty directory for their metrics snapshots so
+    /metrics reports the whole server whichever worker answers the scrape.
+    Snapshots left by a previous run are removed, restarting the counters.
+    """
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if not metrics_dir:
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="api-metrics-")
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+        os.remove(path)
+
+
+def main() -> None:
+    workers = worker_count()
+    prepare_metrics_dir()
+    max_requests = int(os.environ.get("API_MAX_REQUESTS", "0"))
+    print(f"Starting API with {workers} workers (uvloop, httptools)")
+    uvicorn.run(
+        "server.app:app",
+        host=os.environ.get("API_HOST", "0.0.0.0"),
+        port=int(os.environ.get("API_PORT", "8000")),
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=int(os.environ.get("API_BACKLOG", "2048")),
+        timeout_keep_alive=int(os.environ.get("API_KEEPALIVE_TIMEOUT", "75")),
+        timeout_graceful_shutdown=int(os.environ.get("API_GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        limit_max_requests=max_requests or None,
+        access_log=os.environ.get("API_ACCESS_LOG", "") == "1",
+        proxy_headers=True,
+        forwarded_allow_ips=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from server.batch_uploader import _dedupe
+from server.lib.near_dupes import NearDuplicateIndex, correct_answer, question_text
+
+DRUGS = ["Amlodipine", "Bendroflumethiazide", "Bisoprolol", "Doxazosin", "Ramipril"]
+
+
+def vignette(age: int, patient: str, answer: str) -> dict:
+    """A hypertension MCQ whose deciding details are the patient's age and background."""
+    return {
+        "question": (
+            f"A {age}-year-old {patient} attends his GP practice for review of his blood "
+            "pressure. Clinic readings over the past two months have been 162/98 mmHg and "
+            "158/96 mmHg, and ambulatory monitoring shows a daytime average of 152/94 mmHg. "
+            "He has no symptoms, his renal function and urine dipstick are normal and his "
+            "ECG shows no abnormality. He does not smoke and takes no regular medication. "
+            "Which is the most appropriate first-line antihypertensive treatment?"
+        ),
+        "options": [{"text": drug, "is_correct": drug == answer} for drug in DRUGS],
+    }
+
+
+# NICE NG136: ACE inhibitor under 55, calcium-channel blocker from 55 or for black
+# African or African-Caribbean patients, and ACE inhibitor at any age with type 2 diabetes.
+YOUNG_WHITE = vignette(45, "white man", "Ramipril")
+YOUNG_BLACK = vignette(45, "black African man", "Amlodipine")
+OLDER_WHITE = vignette(62, "white man", "Amlodipine")
+OLDER_DIABETIC = vignette(62, "white man with type 2 diabetes", "Ramipril")
+
+
+def indexed(*questions: dict) -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    for i, q in enumerate(questions):
+        index.add(f"q{i}", question_text(q), correct_answer(q))
+    return index
+
+
+def test_one_detail_that_changes_the_answer_is_not_a_near_duplicate():
+    for original, variant in ((YOUNG_WHITE, YOUNG_BLACK), (OLDER_WHITE, OLDER_DIABETIC)):
+        index = indexed(original)
+        # The stems alone are above the threshold; the different answers keep them apart.
+        stems = index.similarity(
+            index.signature(question_text(original)), index.signature(question_text(variant))
+        )
+        assert stems >= index.threshold
+        assert index.query(question_text(variant), correct_answer(variant)) is None
+
+
+def test_reworded_copy_with_the_same_answer_is_a_near_duplicate():
+    copy = {
+        "question": "  " + YOUNG_WHITE["question"].upper().replace(", ", " , "),
+        "options": list(reversed(YOUNG_WHITE["options"])),
+    }
+    match = indexed(YOUNG_WHITE).query(question_text(copy), correct_answer(copy))
+    assert match is not None and match[0] == "q0"
+
+
+def test_answers_survive_a_save_and_load(tmp_path):
+    path = str(tmp_path / "index.idx")
+    indexed(YOUNG_WHITE).save(path)
+    index = NearDuplicateIndex.load(path)
+    assert index.query(question_text(YOUNG_BLACK), correct_answer(YOUNG_BLACK)) is None
+    assert index.query(question_text(YOUNG_WHITE), correct_answer(YOUNG_WHITE)) is not None
+
+
+def test_uploader_flags_near_duplicates_unless_asked_to_skip():
+    def questions():
+        return [
+            dict(YOUNG_WHITE),
+            dict(YOUNG_BLACK),
+            dict(YOUNG_WHITE, question=YOUNG_WHITE["question"].replace("GP practice", "GP surgery")),
+        ]
+
+    near_duplicates = []
+    kept = list(_dedupe(questions(), NearDuplicateIndex(), near_duplicates))
+    assert len(kept) == 3
+    assert len(near_duplicates) == 1
+
+    near_duplicates = []
+    kept = list(_dedupe(questions(), NearDuplicateIndex(), near_duplicates, skip_near_duplicates=True))
+    assert [correct_answer(q) for q in kept] == ["Ramipril", "Amlodipine"]
+    assert len(near_duplicates) == 1